@@ -0,0 +1,93 @@
+# ===== ADMISSION.PY =====
+"""Contrôle d'admission par classe de routes : concurrence bornée et file d'attente bornée.
+
+Les limites sont propres à chaque processus : avec plusieurs workers (--production), la
+capacité totale d'une classe est ADMISSION_<CLASSE>_CONCURRENCY × nombre de workers (et de
+réplicas) ; les valeurs se règlent donc par worker."""
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS
+
+
+class AdmissionRejected(Exception):
+    """Requête refusée (file pleine ou attente trop longue) : à traduire en 429"""
+
+    def __init__(self, route_class: str, reason: str, retry_after: int):
+        super().__init__(f"{route_class}: {reason}")
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """Au plus `concurrency` requêtes en cours et `max_queue` en attente ; au-delà, refus immédiat"""
+
+    def __init__(self, route_class: str, concurrency: int, max_queue: int, queue_timeout: float):
+        self.route_class = route_class
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        # Durée moyenne de traitement (moyenne mobile), pour estimer Retry-After
+        self.avg_service_s = 1.0
+        self._slots = asyncio.Semaphore(concurrency)
+        ADMISSION_IN_FLIGHT.labels(route_class).set_function(lambda: self.in_flight)
+        ADMISSION_QUEUE_DEPTH.labels(route_class).set_function(lambda: self.waiting)
+
+    @classmethod
+    def from_env(cls, route_class: str, concurrency: int, max_queue: int,
+                 queue_timeout: float) -> "AdmissionLimiter":
+        """Limites surchargeables par ADMISSION_<CLASSE>_CONCURRENCY / _QUEUE / _TIMEOUT"""
+        prefix = f"ADMISSION_{route_class.upper()}"
+        return cls(
+            route_class,
+            concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+            max_queue=int(os.getenv(f"{prefix}_QUEUE", max_queue)),
+            queue_timeout=float(os.getenv(f"{prefix}_TIMEOUT", queue_timeout))
+        )
+
+    def retry_after(self) -> int:
+        """Délai estimé (s) avant qu'une place se libère pour une nouvelle requête"""
+        backlog = self.waiting + 1
+        return max(1, math.ceil(self.avg_service_s * backlog / self.concurrency))
+
+    def reject(self, reason: str, retry_after: Optional[int] = None) -> AdmissionRejected:
+        ADMISSION_REJECTIONS.labels(self.route_class, reason).inc()
+        return AdmissionRejected(self.route_class, reason, retry_after or self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self):
+        """Occupation d'une place pendant le traitement (AdmissionRejected si refus)"""
+        if self.in_flight + self.waiting >= self.concurrency + self.max_queue:
+            raise self.reject("queue_full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self.reject("queue_timeout")
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            self.avg_service_s = 0.8 * self.avg_service_s + 0.2 * (time.perf_counter() - started)
+
+    def snapshot(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting
+        }
@@ -3,35 +3,58 @@ import json
 import asyncio
 import tempfile
 import os
-from typing import Dict, List, Any, Tuple, Optional
-import librosa
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+import re
+import shutil
+import time
+from typing import Dict, List, Any, Tuple, Optional, Callable, Sequence, Union
 import base64
 import io
+from metrics import STAGE_LATENCY, STAGE_ERRORS, SERVICE_IN_FLIGHT
+from css_compiler import default_compiler as css_compiler
+
+# Analyse audio : fréquence et rééchantillonnage par défaut de librosa.load (résultats identiques
+# quel que soit le format d'entrée) ; WAV convertis par blocs de WAV_BLOCK_FRAMES trames
+ANALYSIS_SAMPLE_RATE = 22050
+ANALYSIS_RES_TYPE = "soxr_hq"
+WAV_BLOCK_FRAMES = 1 << 18
+
+# librosa et numpy sont importés à la première analyse audio (démarrage rapide,
+# mémoire épargnée pour les workers qui ne servent que le TTS)
 
 class AnimationService:
     def __init__(self):
         self.temp_dir = tempfile.mkdtemp()
         self.lottie_templates = self._load_lottie_templates()
         
+        # Rétention des fichiers temporaires (âge en secondes, nombre, octets)
+        self.temp_retention = {
+            "max_age": float(os.getenv("ANIMATION_TEMP_MAX_AGE", 3600)),
+            "max_files": int(os.getenv("ANIMATION_TEMP_MAX_FILES", 1000)),
+            "max_bytes": int(os.getenv("ANIMATION_TEMP_MAX_BYTES", 1024 ** 3))
+        }
+        # Dernière occupation mesurée (rafraîchie par sweep_temp_dir, lue par health_check)
+        self.last_temp_usage = {"files": 0, "bytes": 0}
+        
     async def generate(self, animation_type: str, content: Dict[Any, Any], 
                       duration: int = 3000, fps: int = 30, 
                       dimensions: Tuple[int, int] = (1920, 1080)) -> Dict:
         """Générateur principal d'animations"""
         try:
-            if animation_type == "lottie":
-                return await self.create_lottie(content, duration, fps)
-            elif animation_type == "css":
-                return self.generate_css_animation(content, duration)
-            elif animation_type == "video":
-                return await self.generate_video_animation(content, duration, fps, dimensions)
-            elif animation_type == "mixed":
-                return await self.generate_mixed_animation(content, duration, fps)
-            else:
-                raise ValueError(f"Type d'animation non supporté: {animation_type}")
+            with SERVICE_IN_FLIGHT.labels("animation").track_inprogress(), \
+                    STAGE_LATENCY.labels("animation", f"generate_{animation_type}").time():
+                if animation_type == "lottie":
+                    return await self.create_lottie(content, duration, fps)
+                elif animation_type == "css":
+                    return self.generate_css_animation(content, duration)
+                elif animation_type == "video":
+                    return await self.generate_video_animation(content, duration, fps, dimensions)
+                elif animation_type == "mixed":
+                    return await self.generate_mixed_animation(content, duration, fps)
+                else:
+                    raise ValueError(f"Type d'animation non supporté: {animation_type}")
                 
         except Exception as e:
+            STAGE_ERRORS.labels("animation", "generate").inc()
             return {"success": False, "error": str(e)}
     
     async def create_lottie(self, elements: List[Dict[str, Any]], 
@@ -111,6 +134,10 @@ class AnimationService:
             
         return base_layer
     
+    def _add_auto_animations(self, lottie_data: Dict, duration: int) -> Dict:
+        """Animations automatiques : aucune pour l'instant (les calques gardent celles demandées)"""
+        return lottie_data
+    
     def _create_shape_data(self, element: Dict) -> List[Dict]:
         """Création des données de forme"""
         shape_type = element.get("shape", "rectangle")
@@ -205,97 +232,208 @@ class AnimationService:
         return ks
     
     def generate_css_animation(self, content: Dict, duration: int = 2000) -> Dict:
-        """Génération d'animations CSS"""
+        """Génération d'animations CSS (compilées, minifiées et mises en cache)"""
         try:
-            animation_name = content.get("name", "customAnimation")
-            keyframes = content.get("keyframes", [])
-            easing = content.get("easing", "ease-in-out")
-            
-            # Génération des keyframes CSS
-            css_keyframes = f"@keyframes {animation_name} {{\n"
-            
-            for keyframe in keyframes:
-                percentage = keyframe.get("percentage", 0)
-                properties = keyframe.get("properties", {})
-                
-                css_keyframes += f"  {percentage}% {{\n"
-                for prop, value in properties.items():
-                    css_keyframes += f"    {prop}: {value};\n"
-                css_keyframes += f"  }}\n"
-            
-            css_keyframes += "}\n\n"
-            
-            # Classe d'animation
-            css_class = f".{animation_name} {{\n"
-            css_class += f"  animation: {animation_name} {duration}ms {easing};\n"
-            css_class += "}\n"
-            
-            full_css = css_keyframes + css_class
-            
+            compiled = css_compiler.compile(content, duration)
             return {
                 "success": True,
-                "css_code": full_css,
-                "animation_name": animation_name,
-                "duration": duration,
+                "css_code": compiled["keyframes_css"] + compiled["rule_css"],
+                "animation_name": compiled["animation_name"],
+                "keyframes_name": compiled["keyframes_name"],
+                "duration": compiled["duration"],
                 "format": "css"
             }
             
         except Exception as e:
             return {"success": False, "error": f"Erreur CSS: {str(e)}"}
     
-    async def sync_with_audio(self, audio_file: str, animations: List[Dict], 
-                             timeline: List[Dict]) -> Dict:
-        """Synchronisation audio et animations"""
+    def generate_css_batch(self, animations: List[Dict], duration: int = 2000) -> Dict:
+        """Feuille de style d'un lot d'animations CSS (@keyframes identiques dédupliquées)"""
         try:
-            # Décodage audio
-            audio_data = base64.b64decode(audio_file)
-            
-            # Analyse audio avec librosa
-            with tempfile.NamedTemporaryFile(suffix='.wav') as temp_audio:
-                temp_audio.write(audio_data)
-                temp_audio.flush()
-                
-                y, sr = librosa.load(temp_audio.name)
-                
-                # Détection du tempo et des beats
-                tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-                
-                # Analyse spectrale pour détection d'énergie
-                onset_frames = librosa.onset.onset_detect(y=y, sr=sr)
-                onset_times = librosa.frames_to_time(onset_frames, sr=sr)
-                
-                # Segmentation audio
-                segments = self._segment_audio(y, sr, onset_times)
+            with STAGE_LATENCY.labels("animation", "css_batch").time():
+                stylesheet = css_compiler.compile_batch(animations, duration)
+            return {"success": True, **stylesheet, "format": "css"}
+        except Exception as e:
+            return {"success": False, "error": f"Erreur CSS: {str(e)}"}
+    
+    async def sync_with_audio(self, audio_file: Optional[str], animations: List[Dict], 
+                             timeline: List[Dict], audio_path: Optional[str] = None,
+                             word_timings: Optional[List[Dict]] = None) -> Dict:
+        """Synchronisation audio et animations (audio en base64 ou fichier déjà sur disque).
+        
+        Avec word_timings (horodatage par mot fourni par le TTS), aucune analyse du signal :
+        les segments sont les phrases, et une animation portant un `cue` (mot ou expression)
+        démarre au premier mot correspondant."""
+        # Métriques sous le même service ("sync") : en cours, durées et erreurs
+        stage = "analyze"
+        try:
+            with SERVICE_IN_FLIGHT.labels("sync").track_inprogress():
+                if word_timings:
+                    stage = "word_timings"
+                    with STAGE_LATENCY.labels("sync", "word_timings").time():
+                        analysis = self._analyze_word_timings(word_timings)
+                elif audio_path:
+                    analysis = await asyncio.to_thread(self._analyze_file, audio_path)
+                else:
+                    # Ancien format : audio base64 dans le JSON, décodé vers un fichier temporaire
+                    with tempfile.NamedTemporaryFile(suffix='.wav', dir=self.temp_dir) as temp_audio:
+                        temp_audio.write(base64.b64decode(audio_file))
+                        temp_audio.flush()
+                        analysis = await asyncio.to_thread(self._analyze_file, temp_audio.name)
                 
                 # Création des markers de synchronisation
+                stage = "markers"
                 sync_markers = []
-                for i, segment in enumerate(segments):
-                    if i < len(animations):
+                cued = self._cue_markers(animations, analysis.get("words"))
+                remaining = [animation for animation in animations if animation.get("id") not in cued]
+                for i, segment in enumerate(analysis["segments"]):
+                    if i < len(remaining):
                         sync_markers.append({
                             "time": segment["start"],
-                            "animation_id": animations[i].get("id"),
+                            "animation_id": remaining[i].get("id"),
                             "trigger": "start",
-                            "intensity": segment["energy"]
+                            "intensity": segment.get("energy", 1.0)
                         })
+                if cued:
+                    sync_markers = sorted(sync_markers + list(cued.values()), key=lambda m: m["time"])
                 
                 return {
                     "success": True,
-                    "sync_data": {
-                        "tempo": float(tempo),
-                        "beats": beats.tolist(),
-                        "onset_times": onset_times.tolist(),
-                        "duration": len(y) / sr,
-                        "segments": segments
-                    },
+                    "sync_data": analysis,
                     "timeline": timeline,
                     "markers": sync_markers
                 }
                 
         except Exception as e:
+            STAGE_ERRORS.labels("sync", stage).inc()
             return {"success": False, "error": f"Erreur sync: {str(e)}"}
     
-    def _segment_audio(self, y: np.ndarray, sr: int, onset_times: np.ndarray) -> List[Dict]:
+    def _analyze_word_timings(self, word_timings: List[Dict]) -> Dict:
+        """Équivalent de l'analyse audio à partir de l'horodatage des mots : les débuts
+        de mots tiennent lieu d'onsets, les phrases de segments (énergie inconnue)"""
+        words = sorted(
+            ({"word": str(w["word"]), "start": float(w["start"]), "end": float(w["end"])} for w in word_timings),
+            key=lambda w: w["start"]
+        )
+        segments = []
+        sentence_start = None
+        for index, word in enumerate(words):
+            if sentence_start is None:
+                sentence_start = word["start"]
+            if re.search(r"[.!?…][\"')\]»]*$", word["word"]) or index == len(words) - 1:
+                segments.append({
+                    "start": sentence_start,
+                    "end": word["end"],
+                    "duration": word["end"] - sentence_start
+                })
+                sentence_start = None
+        
+        return {
+            "source": "word_timings",
+            "onset_times": [word["start"] for word in words],
+            "duration": words[-1]["end"] if words else 0.0,
+            "segments": segments,
+            "words": words
+        }
+    
+    def _cue_markers(self, animations: List[Dict], words: Optional[List[Dict]]) -> Dict[Any, Dict]:
+        """Marqueurs des animations ancrées sur un mot (`cue`), recherché après le précédent"""
+        if not words:
+            return {}
+        normalize = lambda text: re.sub(r"[^\w'-]", "", text.lower())
+        spoken = [normalize(word["word"]) for word in words]
+        markers = {}
+        search_from = 0
+        for animation in animations:
+            cue = [normalize(part) for part in str(animation.get("cue") or "").split()]
+            if not cue or animation.get("id") is None:
+                continue
+            for start in list(range(search_from, len(spoken))) + list(range(search_from)):
+                if spoken[start:start + len(cue)] == cue:
+                    markers[animation["id"]] = {
+                        "time": words[start]["start"],
+                        "animation_id": animation["id"],
+                        "trigger": "start",
+                        "cue": animation["cue"]
+                    }
+                    search_from = start + 1
+                    break
+        return markers
+    
+    async def analyze_audio(self, audio_path: str) -> Dict:
+        """Analyse d'un fichier audio (tempo, beats, onsets, segments)"""
+        with SERVICE_IN_FLIGHT.labels("analyze").track_inprogress():
+            try:
+                return await asyncio.to_thread(self._analyze_file, audio_path)
+            except Exception:
+                STAGE_ERRORS.labels("animation", "analyze").inc()
+                raise
+    
+    def _analyze_file(self, audio_path: str) -> Dict:
+        """Analyse librosa d'un fichier (exécutée hors boucle d'événements)"""
+        import librosa
+        import numpy as np
+        
+        with STAGE_LATENCY.labels("animation", "load").time():
+            y, sr = self._load_audio(audio_path)
+        
+        # Détection du tempo et des beats
+        with STAGE_LATENCY.labels("animation", "beat_track").time():
+            tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
+        
+        # Analyse spectrale pour détection d'énergie
+        with STAGE_LATENCY.labels("animation", "onset").time():
+            onset_frames = librosa.onset.onset_detect(y=y, sr=sr)
+            onset_times = librosa.frames_to_time(onset_frames, sr=sr)
+        
+        # Segmentation audio
+        with STAGE_LATENCY.labels("animation", "segment").time():
+            segments = self._segment_audio(y, sr, onset_times)
+        
+        return {
+            # librosa >= 0.10 renvoie le tempo sous forme de tableau
+            "tempo": float(np.atleast_1d(tempo)[0]),
+            "beats": beats.tolist(),
+            "onset_times": onset_times.tolist(),
+            "duration": len(y) / sr,
+            "segments": segments
+        }
+    
+    def _load_audio(self, audio_path: str) -> Tuple["np.ndarray", int]:
+        """Chargement mono float32 à ANALYSIS_SAMPLE_RATE, comme librosa.load : les WAV PCM sont
+        lus par mappage mémoire et convertis par blocs (seul le signal mono est alloué), puis
+        rééchantillonnés ; les autres formats sont décodés par librosa"""
+        import numpy as np
+        import librosa
+        
+        if audio_path.lower().endswith(".wav"):
+            from scipy.io import wavfile
+            try:
+                sr, data = wavfile.read(audio_path, mmap=True)
+            except ValueError:
+                data = None  # WAV compressé ou exotique : décodage librosa
+            if data is not None:
+                # Mêmes échelles que soundfile (décodeur de librosa.load)
+                if data.dtype == np.uint8:
+                    offset, scale = 128.0, 1 / 128.0
+                elif np.issubdtype(data.dtype, np.integer):
+                    offset, scale = 0.0, 1 / (float(np.iinfo(data.dtype).max) + 1.0)
+                else:
+                    offset, scale = 0.0, 1.0
+                y = np.empty(data.shape[0], dtype=np.float32)
+                for start in range(0, data.shape[0], WAV_BLOCK_FRAMES):
+                    block = (np.asarray(data[start:start + WAV_BLOCK_FRAMES], dtype=np.float32) - offset) * scale
+                    y[start:start + len(block)] = block.mean(axis=1) if block.ndim > 1 else block
+                if sr != ANALYSIS_SAMPLE_RATE:
+                    y = librosa.resample(y, orig_sr=sr, target_sr=ANALYSIS_SAMPLE_RATE, res_type=ANALYSIS_RES_TYPE)
+                return y, ANALYSIS_SAMPLE_RATE
+        
+        return librosa.load(audio_path, sr=ANALYSIS_SAMPLE_RATE, res_type=ANALYSIS_RES_TYPE)
+    
+    def _segment_audio(self, y: "np.ndarray", sr: int, onset_times: "np.ndarray") -> List[Dict]:
         """Segmentation de l'audio pour synchronisation"""
+        import numpy as np
+        
         segments = []
         
         for i, start_time in enumerate(onset_times):
@@ -342,76 +480,390 @@ class AnimationService:
             }
         }
     
+    def temp_dir_usage(self) -> Dict:
+        """Occupation du répertoire temporaire"""
+        files = self._list_temp_files()
+        return {
+            "files": len(files),
+            "bytes": sum(size for _, _, size in files)
+        }
+    
+    def sweep_temp_dir(self) -> Dict:
+        """Éviction des fichiers temporaires selon la politique de rétention"""
+        files = sorted(self._list_temp_files(), key=lambda f: f[1])
+        now = time.time()
+        total_bytes = sum(size for _, _, size in files)
+        evicted = 0
+        
+        for index, (path, mtime, size) in enumerate(files):
+            remaining = len(files) - index
+            if (now - mtime <= self.temp_retention["max_age"]
+                    and remaining <= self.temp_retention["max_files"]
+                    and total_bytes <= self.temp_retention["max_bytes"]):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            evicted += 1
+        
+        self.last_temp_usage = self.temp_dir_usage()
+        return {"evicted_files": evicted, **self.last_temp_usage}
+    
+    def _list_temp_files(self) -> List[Tuple[str, float, int]]:
+        """Fichiers du répertoire temporaire (chemin, mtime, taille)"""
+        files = []
+        for root, _, names in os.walk(self.temp_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((path, stat.st_mtime, stat.st_size))
+        return files
+    
+    def warm_up(self):
+        """Préchargement de librosa et compilation JIT des analyses (optionnel, au démarrage)"""
+        import librosa
+        import numpy as np
+        
+        # Une seconde de signal suffit à déclencher la compilation numba de beat_track/onset
+        y = np.sin(np.linspace(0, 440 * 2 * np.pi, 22050)).astype(np.float32)
+        librosa.beat.beat_track(y=y, sr=22050)
+        librosa.onset.onset_detect(y=y, sr=22050)
+    
+    def close(self):
+        """Suppression du répertoire temporaire à l'arrêt du service"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
     def health_check(self) -> Dict:
         """Vérification santé du service"""
         return {
             "status": "healthy",
             "temp_dir": self.temp_dir,
+            "temp_usage": self.last_temp_usage,
             "templates_loaded": len(self.lottie_templates)
         }
 
 # ===== EPUB_GENERATOR.PY =====
+import json
+import os
+import time
 import zipfile
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 import xml.etree.ElementTree as ET
-from jinja2 import Template
+from xml.sax.saxutils import escape, quoteattr
 import asyncio
 import shutil
+import logging
+import re
+from metrics import STAGE_LATENCY, STAGE_ERRORS, SERVICE_IN_FLIGHT
+from document_model import Document
+from marker_index import MarkerIndex
+from css_compiler import default_compiler as css_compiler
+from asset_store import local_media_path, media_roots
+from fingerprinted_tasks import FingerprintedTasks
 
-class EPubGenerator:
-    def __init__(self):
-        self.tasks = {}
+logger = logging.getLogger(__name__)
+
+# Taille des blocs pour la copie des médias depuis le disque vers l'archive
+MEDIA_CHUNK_SIZE = 1024 * 1024
+
+# Progression de l'assemblage (thread d'écriture) : publiée au plus à chaque pas de
+# progression (en points) ou après cet intervalle (s), pas à chaque bloc copié
+ASSEMBLE_PROGRESS_STEP = 0.5
+ASSEMBLE_PROGRESS_INTERVAL = 0.5
+
+# Formats déjà compressés : stockés tels quels (ZIP_STORED) pour ne pas gaspiller de CPU
+PRECOMPRESSED_EXTENSIONS = {
+    ".mp3", ".m4a", ".aac", ".ogg", ".opus", ".mp4", ".webm",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp"
+}
+
+MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".aac": "audio/mp4",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".wav": "audio/wav",
+    ".mp4": "video/mp4",
+    ".webm": "video/webm",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".svg": "image/svg+xml",
+    ".json": "application/json"
+}
+
+# Gabarit des chapitres, compilé une seule fois (jinja2 importé à la première génération)
+CHAPTER_TEMPLATE = """
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head>
+    <meta charset="utf-8"/>
+    <title>{{ chapter.title }}</title>
+    <link rel="stylesheet" type="text/css" href="../styles/main.css"/>
+    <script src="../js/interactions.js"></script>
+</head>
+<body>
+    <div class="chapter" id="{{ chapter.id }}">
+        <h1 class="chapter-title animated fadeIn">{{ chapter.title }}</h1>
+        
+        {% for item in chapter.content %}
+            {% if item.type == "text" %}
+                <div class="text-content animated slideUp">
+                    {{ item.html|safe }}
+                </div>
+            {% elif item.type == "animation" %}
+                <div class="animation-container" id="{{ item.animation_id }}" data-animation="{{ item.animation_id }}">
+                    <div class="lottie-player" data-src="{{ item.lottie_path }}"></div>
+                </div>
+            {% elif item.type == "audio" %}
+                <div class="audio-container">
+                    <audio controls preload="metadata" class="chapter-audio"{% if chapter.audio and chapter.audio.href == item.audio_path %} data-marker-table="{{ chapter.audio.marker_table|e }}"{% endif %}>
+                        <source src="{{ item.audio_path }}" type="{{ item.media_type or 'audio/mpeg' }}"/>
+                    </audio>
+                </div>
+            {% elif item.type == "image" %}
+                <figure class="image-container">
+                    <img src="{{ item.image_path }}" alt="{{ item.alt or '' }}"/>
+                </figure>
+            {% elif item.type == "interactive" %}
+                <div class="interactive-element" data-type="{{ item.interactive_type }}">
+                    {{ item.html|safe }}
+                </div>
+            {% endif %}
+        {% endfor %}
+    </div>
+</body>
+</html>
+"""
+
+class ProgressBroker:
+    """Pub/sub en mémoire des événements de progression, par tâche"""
+    
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self.subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+    
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        """Abonnement aux événements d'une tâche"""
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        self.subscribers.setdefault(task_id, []).append((asyncio.get_running_loop(), queue))
+        return queue
+    
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        """Désabonnement"""
+        subscribers = [s for s in self.subscribers.get(task_id, []) if s[1] is not queue]
+        if subscribers:
+            self.subscribers[task_id] = subscribers
+        else:
+            self.subscribers.pop(task_id, None)
+    
+    def publish(self, task_id: str, event: Dict):
+        """Publication d'un événement (utilisable depuis un thread de travail)"""
+        for loop, queue in list(self.subscribers.get(task_id, [])):
+            loop.call_soon_threadsafe(self._offer, queue, event)
+    
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: Dict):
+        # Abonné trop lent : on sacrifie l'événement le plus ancien
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+class EPubGenerator(FingerprintedTasks):
+    CACHE_NAME = "epub_artifact"
+
+    def __init__(self, store=None):
+        # État en mémoire, ou partagé entre workers (SharedStore) : les valeurs lues
+        # sont alors des copies, d'où la réécriture systématique après modification
+        self.tasks = store.mapping("epub_tasks") if store else {}
+        self.fingerprints = store.mapping("epub_fingerprints") if store else {}
+        # Compteurs de tâches par statut, tenus à jour à chaque transition (santé en O(1))
+        self.status_counts = store.mapping("epub_status_counts") if store else {}
+        self.last_usage = None
+        self.chapter_template = None
+        self.events = ProgressBroker()
         self.output_dir = Path("./exports/epub")
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
+        # Rétention des tâches terminées et des fichiers générés (âge en secondes, nombre, octets)
+        self.retention = {
+            "max_age": float(os.getenv("EPUB_RETENTION_MAX_AGE", 24 * 3600)),
+            "max_tasks": int(os.getenv("EPUB_RETENTION_MAX_TASKS", 500)),
+            "max_bytes": int(os.getenv("EPUB_RETENTION_MAX_BYTES", 10 * 1024 ** 3))
+        }
+        
     async def generate_async(self, task_id: str, title: str, author: str, 
-                           content: List[Dict], animations: List[Dict] = None,
-                           audio_files: List[str] = None, metadata: Dict = None):
-        """Génération ePub3 asynchrone"""
+                           content: Union[List[Dict], Document], animations: List[Dict] = None,
+                           audio_files: List[str] = None, metadata: Dict = None,
+                           fingerprint: Optional[str] = None):
+        """Génération ePub3 asynchrone (content : brut, ou Document déjà construit)"""
+        in_flight = SERVICE_IN_FLIGHT.labels("epub")
+        in_flight.inc()
         try:
-            self.tasks[task_id] = {"status": "processing", "progress": 0}
+            self._set_task(task_id, {"status": "processing", "progress": 0, "created_at": time.time()})
+            if fingerprint:
+                self.fingerprints[fingerprint] = task_id
             
             # Étape 1: Préparation des données
-            self.tasks[task_id]["progress"] = 10
+            self._update_progress(task_id, 10, "prepare")
             epub_data = self._prepare_epub_data(title, author, content, animations, audio_files, metadata)
             
-            # Étape 2: Génération des fichiers HTML
-            self.tasks[task_id]["progress"] = 30
-            html_files = self._generate_html_chapters(epub_data)
+            # Étape 2: Génération des fichiers HTML (30 → 50, par chapitre)
+            self._update_progress(task_id, 30, "html")
+            chapter_count = max(len(epub_data["chapters"]), 1)
+            html_files = self._generate_html_chapters(
+                epub_data,
+                on_chapter=lambda index, chapter: self._update_progress(
+                    task_id, 30 + 20 * index / chapter_count, "html",
+                    chapter=chapter["id"], chapters_done=index, chapters_total=chapter_count
+                )
+            )
             
             # Étape 3: Génération CSS et JS
-            self.tasks[task_id]["progress"] = 50
+            self._update_progress(task_id, 50, "css_js")
             css_content = self._generate_epub_css(animations)
             js_content = self._generate_epub_js(animations)
             
             # Étape 4: Création de la structure ePub
-            self.tasks[task_id]["progress"] = 70
+            self._update_progress(task_id, 70, "structure")
             epub_structure = self._create_epub_structure(epub_data, html_files, css_content, js_content)
             
-            # Étape 5: Assemblage final
-            self.tasks[task_id]["progress"] = 90
+            # Étape 5: Assemblage final (90 → 100, selon les octets écrits)
+            self._update_progress(task_id, 90, "assemble")
             epub_path = await self._assemble_epub(task_id, epub_structure)
             
-            # Finalisation
-            self.tasks[task_id] = {
+            # Finalisation (empreinte du fichier pour l'ETag fort)
+            self._end_stage(task_id)
+            timings = self.tasks[task_id].get("timings", {})
+            self._set_task(task_id, {
                 "status": "completed",
                 "progress": 100,
                 "file_path": str(epub_path),
-                "file_size": epub_path.stat().st_size
-            }
+                "file_size": epub_path.stat().st_size,
+                "sha256": await asyncio.to_thread(self._file_digest, epub_path),
+                "fingerprint": fingerprint,
+                "timings": timings,
+                "finished_at": time.time()
+            })
             
         except Exception as e:
-            self.tasks[task_id] = {
+            STAGE_ERRORS.labels("epub", self.tasks.get(task_id, {}).get("stage", "start")).inc()
+            self._set_task(task_id, {
                 "status": "error",
                 "progress": 0,
-                "error": str(e)
-            }
+                "error": str(e),
+                "finished_at": time.time()
+            })
+            self._release_fingerprint(fingerprint, task_id)
+        finally:
+            in_flight.dec()
+        
+        self.events.publish(task_id, {"task_id": task_id, **self.tasks[task_id]})
+    
+    def _set_task(self, task_id: str, record: Optional[Dict]):
+        """Remplacement (ou suppression si None) d'une tâche, avec mise à jour des compteurs"""
+        previous = self.tasks.get(task_id)
+        if record is None:
+            self.tasks.pop(task_id, None)
+        else:
+            self.tasks[task_id] = record
+        
+        old_status = previous.get("status") if previous else None
+        new_status = record.get("status") if record else None
+        if old_status != new_status:
+            if old_status:
+                self._count_status(old_status, -1)
+            if new_status:
+                self._count_status(new_status, 1)
+    
+    def backlog(self) -> int:
+        """Nombre de générations en attente ou en cours (tous workers)"""
+        return sum(self.status_counts.get(status, 0) for status in ("queued", "processing"))
+    
+    def _count_status(self, status: str, delta: int):
+        if hasattr(self.status_counts, "increment"):
+            self.status_counts.increment(status, delta)
+        else:
+            self.status_counts[status] = self.status_counts.get(status, 0) + delta
+    
+    def _update_progress(self, task_id: str, progress: float, stage: str, **details):
+        """Mise à jour de la progression et diffusion aux abonnés"""
+        if self.tasks[task_id].get("stage") != stage:
+            self._end_stage(task_id)
+            task = self.tasks[task_id]
+            task["stage_started"] = time.perf_counter()
+        else:
+            task = self.tasks[task_id]
+        task["progress"] = round(progress, 1)
+        task["stage"] = stage
+        self.tasks[task_id] = task
+        self.events.publish(task_id, {
+            "task_id": task_id,
+            "status": "processing",
+            "stage": stage,
+            "progress": task["progress"],
+            **{key: value for key, value in details.items() if value is not None}
+        })
     
-    def _prepare_epub_data(self, title: str, author: str, content: List[Dict],
+    def _end_stage(self, task_id: str):
+        """Clôture de l'étape en cours : durée enregistrée dans task["timings"]"""
+        task = self.tasks[task_id]
+        if task.get("stage"):
+            elapsed = time.perf_counter() - task.pop("stage_started")
+            task.setdefault("timings", {})[task["stage"]] = round(elapsed, 6)
+            self.tasks[task_id] = task
+            STAGE_LATENCY.labels("epub", task["stage"]).observe(elapsed)
+    
+    async def stream_events(self, task_id: str, poll_interval: float = 1.0,
+                            missing_grace: float = 30.0):
+        """Flux Server-Sent Events de progression d'une tâche"""
+        queue = self.events.subscribe(task_id)
+        try:
+            last = self.get_task_status(task_id)
+            yield self._format_sse(task_id, last)
+            missing_for = 0.0
+            
+            while last.get("status") not in ("completed", "error"):
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    # Tâche exécutée ailleurs (autre worker) : relecture de l'état partagé
+                    event = self.get_task_status(task_id)
+                    if event.get("status") == "not_found":
+                        missing_for += poll_interval
+                        if missing_for >= missing_grace:
+                            yield self._format_sse(task_id, event)
+                            return
+                    if event == last or event.get("status") == "not_found":
+                        yield ": keep-alive\n\n"
+                        continue
+                last = event
+                yield self._format_sse(task_id, event)
+        finally:
+            self.events.unsubscribe(task_id, queue)
+    
+    def _format_sse(self, task_id: str, event: Dict) -> str:
+        """Sérialisation d'un événement au format SSE"""
+        payload = {"task_id": task_id, **event}
+        return f"event: {payload.get('status', 'progress')}\ndata: {json.dumps(payload)}\n\n"
+    
+    def _prepare_epub_data(self, title: str, author: str, content: Union[List[Dict], Document],
                           animations: List[Dict], audio_files: List[str], metadata: Dict) -> Dict:
         """Préparation des données ePub"""
+        document = Document.parse(content, animations)
+        chapters = self._organize_chapters(document)
+        media = self._collect_media(chapters, document.animations, audio_files or [])
+        
         return {
             "metadata": {
                 "title": title,
@@ -422,81 +874,133 @@ class EPubGenerator:
                 "publisher": metadata.get("publisher", "AI Platform"),
                 "description": metadata.get("description", "Document interactif généré par IA")
             },
-            "content": content,
-            "animations": animations or [],
+            "document": document,
+            "animations": list(document.animations),
             "audio_files": audio_files or [],
-            "chapters": self._organize_chapters(content)
+            "chapters": chapters,
+            "media": media
         }
     
-    def _organize_chapters(self, content: List[Dict]) -> List[Dict]:
-        """Organisation du contenu en chapitres"""
-        chapters = []
-        current_chapter = None
-        
-        for item in content:
-            if item.get("type") == "chapter" or item.get("level") == 1:
-                if current_chapter:
-                    chapters.append(current_chapter)
-                current_chapter = {
-                    "id": f"chapter_{len(chapters) + 1}",
-                    "title": item.get("title", f"Chapitre {len(chapters) + 1}"),
-                    "content": [item],
-                    "animations": [],
-                    "audio": None
+    def _collect_media(self, chapters: List[Dict], animations: Sequence[Dict],
+                       audio_files: List[str]) -> List[Dict]:
+        """Inventaire des médias à embarquer (audio, Lottie, images)"""
+        media = []
+        by_source = {}
+        
+        roots = media_roots()
+        
+        def register(source: Optional[str], folder: str) -> Optional[Dict]:
+            # Seuls les fichiers des répertoires autorisés sont embarqués, les URLs restent des références
+            if not source:
+                return None
+            source = local_media_path(source, roots)
+            if source is None:
+                return None
+            if source not in by_source:
+                extension = Path(source).suffix.lower()
+                safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", Path(source).name)
+                entry = {
+                    "id": f"media_{len(media) + 1}",
+                    "href": f"{folder}/{len(media) + 1}_{safe_name}",
+                    "source": source,
+                    "media_type": MEDIA_TYPES.get(extension, "application/octet-stream"),
+                    "compress_type": (zipfile.ZIP_STORED if extension in PRECOMPRESSED_EXTENSIONS
+                                      else zipfile.ZIP_DEFLATED)
                 }
-            elif current_chapter:
-                current_chapter["content"].append(item)
+                media.append(entry)
+                by_source[source] = entry
+            return by_source[source]
         
-        if current_chapter:
-            chapters.append(current_chapter)
-            
-        return chapters
+        # Animations Lottie générées en mémoire (résultat de create_lottie)
+        lottie_hrefs = {}
+        for animation in animations:
+            lottie_data = animation.get("lottie_data")
+            if animation.get("id") and lottie_data:
+                href = f"animations/{re.sub(r'[^A-Za-z0-9._-]', '_', str(animation['id']))}.json"
+                media.append({
+                    "id": f"media_{len(media) + 1}",
+                    "href": href,
+                    "data": json.dumps(lottie_data, separators=(",", ":")).encode(),
+                    "media_type": "application/json",
+                    "compress_type": zipfile.ZIP_DEFLATED
+                })
+                lottie_hrefs[str(animation["id"])] = href
+        
+        for audio_file in audio_files:
+            register(audio_file, "audio")
+        
+        # Réécriture des chemins des chapitres vers les ressources embarquées
+        for chapter in chapters:
+            items = []
+            for item in chapter["content"]:
+                if item.type == "audio":
+                    entry = register(item.audio_path, "audio")
+                    if entry:
+                        item = item.replace(audio_path=f"../{entry['href']}", media_type=entry["media_type"])
+                    sync = item.sync or {}
+                    markers = [m for m in sync.get("markers", []) if m.get("animation_id")]
+                    if markers and not chapter["audio"]:
+                        duration = (sync.get("sync_data") or {}).get("duration")
+                        chapter["audio"] = {
+                            "href": item.audio_path,
+                            "markers": markers,
+                            "duration": duration,
+                            # Table triée des intervalles actifs, lue par interactions.js
+                            "marker_table": json.dumps(
+                                MarkerIndex.build(markers, animations, duration=duration).to_table(),
+                                separators=(",", ":")
+                            )
+                        }
+                elif item.type == "animation":
+                    entry = register(item.lottie_path, "animations")
+                    if entry:
+                        item = item.replace(lottie_path=f"../{entry['href']}")
+                    elif item.animation_id in lottie_hrefs:
+                        item = item.replace(lottie_path=f"../{lottie_hrefs[item.animation_id]}")
+                elif item.type == "image":
+                    entry = register(item.image_path, "images")
+                    if entry:
+                        item = item.replace(image_path=f"../{entry['href']}")
+                items.append(item)
+            chapter["content"] = items
+        
+        return media
+    
+    def _organize_chapters(self, document: Document) -> List[Dict]:
+        """Chapitres à générer (le contenu précédant le premier titre est ignoré)"""
+        return [
+            {
+                "id": chapter.id,
+                "title": chapter.title,
+                "content": list(chapter.items),
+                "animations": [],
+                "audio": None
+            }
+            for chapter in document.chapters
+        ]
     
-    def _generate_html_chapters(self, epub_data: Dict) -> Dict[str, str]:
+    def _chapter_template(self):
+        """Gabarit jinja2 des chapitres (compilation paresseuse, mise en cache)"""
+        if self.chapter_template is None:
+            from jinja2 import Template
+            self.chapter_template = Template(CHAPTER_TEMPLATE)
+        return self.chapter_template
+    
+    def warm_up(self):
+        """Préchargement de jinja2 et du gabarit (optionnel, au démarrage)"""
+        self._chapter_template()
+    
+    def _generate_html_chapters(self, epub_data: Dict,
+                                on_chapter: Optional[Callable[[int, Dict], None]] = None) -> Dict[str, str]:
         """Génération des fichiers HTML des chapitres"""
-        html_template = Template("""
-<!DOCTYPE html>
-<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
-<head>
-    <meta charset="utf-8"/>
-    <title>{{ chapter.title }}</title>
-    <link rel="stylesheet" type="text/css" href="../styles/main.css"/>
-    <script src="../js/interactions.js"></script>
-</head>
-<body>
-    <div class="chapter" id="{{ chapter.id }}">
-        <h1 class="chapter-title animated fadeIn">{{ chapter.title }}</h1>
-        
-        {% for item in chapter.content %}
-            {% if item.type == "text" %}
-                <div class="text-content animated slideUp">
-                    {{ item.html|safe }}
-                </div>
-            {% elif item.type == "animation" %}
-                <div class="animation-container" data-animation="{{ item.animation_id }}">
-                    <div class="lottie-player" data-src="{{ item.lottie_path }}"></div>
-                </div>
-            {% elif item.type == "audio" %}
-                <div class="audio-container">
-                    <audio controls preload="metadata" class="chapter-audio">
-                        <source src="{{ item.audio_path }}" type="audio/mpeg"/>
-                    </audio>
-                </div>
-            {% elif item.type == "interactive" %}
-                <div class="interactive-element" data-type="{{ item.interactive_type }}">
-                    {{ item.html|safe }}
-                </div>
-            {% endif %}
-        {% endfor %}
-    </div>
-</body>
-</html>
-        """)
+        html_template = self._chapter_template()
         
         html_files = {}
-        for chapter in epub_data["chapters"]:
+        for index, chapter in enumerate(epub_data["chapters"], start=1):
             html_content = html_template.render(chapter=chapter)
-            html_files[f"{chapter['id']}.xhtml"] = html_content
+            html_files[f"text/{chapter['id']}.xhtml"] = html_content
+            if on_chapter:
+                on_chapter(index, chapter)
             
         return html_files
     
@@ -635,11 +1139,19 @@ body {
 }
         """
         
-        # Ajout des animations personnalisées
-        for animation in animations:
-            if animation.get("type") == "css":
-                base_css += f"\n/* Animation: {animation.get('name', 'Custom')} */\n"
-                base_css += animation.get("css_code", "")
+        # Animations personnalisées : spécifications compilées en une feuille dédupliquée,
+        # CSS déjà généré (css_code) repris tel quel, une seule fois
+        css_animations = [animation for animation in animations if animation.get("type") == "css"]
+        specs = [animation for animation in css_animations if animation.get("keyframes")]
+        if specs:
+            # Une spécification invalide est écartée (et journalisée) sans faire échouer l'export
+            stylesheet = css_compiler.compile_batch(specs, skip_invalid=True)
+            for invalid in stylesheet["invalid"]:
+                logger.warning(f"Animation CSS ignorée ({invalid['name']}): {invalid['error']}")
+            base_css += "\n/* Animations compilées */\n" + stylesheet["css_code"] + "\n"
+        for css_code in dict.fromkeys(animation["css_code"] for animation in css_animations
+                                      if not animation.get("keyframes") and animation.get("css_code")):
+            base_css += f"\n{css_code}\n"
                 
         return base_css
     
@@ -687,6 +1199,8 @@ body {
     function initializeAudio() {
         const audioElements = document.querySelectorAll('audio');
         audioElements.forEach(audio => {
+            const markerTable = audio.dataset.markerTable ? JSON.parse(audio.dataset.markerTable) : null;
+            
             // Synchronisation avec animations
             audio.addEventListener('play', function() {
                 syncAnimationsWithAudio(audio);
@@ -697,7 +1211,11 @@ body {
             });
             
             audio.addEventListener('timeupdate', function() {
-                updateAnimationProgress(audio.currentTime);
+                if (markerTable) {
+                    updateActiveMarkers(markerTable, audio.currentTime);
+                } else {
+                    updateAnimationProgress(audio.currentTime);
+                }
             });
         });
     }
@@ -781,6 +1299,51 @@ body {
         });
     }
     
+    // Table triée générée avec l'ePub : recherche dichotomique au lieu d'un parcours du DOM
+    function markerTablePosition(table, time) {
+        let low = 0, high = table.boundaries.length - 1, position = -1;
+        while (low <= high) {
+            const middle = (low + high) >> 1;
+            if (table.boundaries[middle] <= time) {
+                position = middle;
+                low = middle + 1;
+            } else {
+                high = middle - 1;
+            }
+        }
+        return position;
+    }
+    
+    function updateActiveMarkers(table, currentTime) {
+        const position = markerTablePosition(table, currentTime);
+        if (position === table.lastPosition) {
+            return;  // Même intervalle que la mise à jour précédente : rien à changer
+        }
+        table.lastPosition = position;
+        
+        const activeIds = new Set();
+        if (position >= 0) {
+            table.active[position].forEach(index => activeIds.add(table.markers[index].animation_id));
+        }
+        (table.activeIds || new Set()).forEach(id => {
+            const element = document.getElementById(id);
+            if (element && !activeIds.has(id)) {
+                element.classList.remove('active');
+            }
+        });
+        activeIds.forEach(id => {
+            const element = document.getElementById(id);
+            if (element) {
+                element.classList.add('active');
+                const lottiePlayer = element.querySelector('.lottie-player');
+                if (lottiePlayer && lottiePlayer.lottieAnimation) {
+                    lottiePlayer.lottieAnimation.play();
+                }
+            }
+        });
+        table.activeIds = activeIds;
+    }
+    
     function updateAnimationProgress(currentTime) {
         // Mise à jour des animations selon le temps audio
         const timeBasedAnimations = document.querySelectorAll('[data-start-time]');
@@ -805,6 +1368,51 @@ body {
         """Assemblage final du fichier ePub"""
         epub_path = self.output_dir / f"{task_id}.epub"
         
+        media = epub_structure.get('media', [])
+        bytes_total = (
+            sum(len(content.encode()) for content in epub_structure['oebps_files'].values())
+            + sum(len(entry["data"]) if "data" in entry else os.path.getsize(entry["source"])
+                  for entry in media)
+        )
+        written = {"bytes": 0, "assets": 0, "asset": None}
+        posted = {"progress": 90.0, "at": time.monotonic()}
+        loop = asyncio.get_running_loop()
+        
+        def progress_update() -> Dict:
+            return {
+                "progress": 90 + 10 * min(written["bytes"] / max(bytes_total, 1), 1.0),
+                "asset": written["asset"], "assets_done": written["assets"], "assets_total": len(media),
+                "bytes_written": written["bytes"], "bytes_total": bytes_total
+            }
+        
+        def post(update: Dict):
+            # Tâches (état éventuellement partagé) et abonnés : modifiés sur la boucle uniquement
+            self._update_progress(task_id, update.pop("progress"), "assemble", **update)
+        
+        def on_bytes(count: int, asset: Optional[str] = None):
+            # Appelé dans le thread d'écriture, à chaque bloc : publication limitée
+            written["bytes"] += count
+            if asset:
+                written["assets"] += 1
+                written["asset"] = asset
+            update = progress_update()
+            now = time.monotonic()
+            if (update["progress"] - posted["progress"] >= ASSEMBLE_PROGRESS_STEP
+                    or now - posted["at"] >= ASSEMBLE_PROGRESS_INTERVAL):
+                posted.update(progress=update["progress"], at=now)
+                loop.call_soon_threadsafe(post, update)
+        
+        # Écriture bloquante (compression, copie des médias) hors de la boucle d'événements
+        await asyncio.to_thread(self._write_epub_archive, epub_path, epub_structure, on_bytes)
+        post(progress_update())
+        
+        return epub_path
+    
+    def _write_epub_archive(self, epub_path: Path, epub_structure: Dict,
+                            on_bytes: Optional[Callable[..., None]] = None):
+        """Écriture de l'archive ePub sur disque"""
+        on_bytes = on_bytes or (lambda count, asset=None: None)
+        
         with zipfile.ZipFile(epub_path, 'w', zipfile.ZIP_DEFLATED) as epub_zip:
             # Mimetype (doit être le premier fichier, non compressé)
             epub_zip.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
@@ -815,8 +1423,34 @@ body {
             # Structure OEBPS
             for filename, content in epub_structure['oebps_files'].items():
                 epub_zip.writestr(f'OEBPS/{filename}', content)
+                on_bytes(len(content.encode()))
+            
+            # Médias : copie par blocs depuis le disque, sans chargement complet en mémoire
+            for entry in epub_structure.get('media', []):
+                self._write_media_entry(epub_zip, entry, on_bytes)
+    
+    def _write_media_entry(self, epub_zip: zipfile.ZipFile, entry: Dict,
+                           on_bytes: Callable[..., None]):
+        """Ajout d'un média à l'archive"""
+        arcname = f"OEBPS/{entry['href']}"
+        if "data" in entry:
+            epub_zip.writestr(arcname, entry["data"], compress_type=entry["compress_type"])
+            on_bytes(len(entry["data"]), asset=entry["href"])
+            return
         
-        return epub_path
+        zip_info = zipfile.ZipInfo.from_file(entry["source"], arcname)
+        zip_info.compress_type = entry["compress_type"]
+        force_zip64 = zip_info.file_size > zipfile.ZIP64_LIMIT
+        
+        with open(entry["source"], 'rb') as source, \
+                epub_zip.open(zip_info, 'w', force_zip64=force_zip64) as target:
+            while True:
+                chunk = source.read(MEDIA_CHUNK_SIZE)
+                if not chunk:
+                    break
+                target.write(chunk)
+                on_bytes(len(chunk))
+        on_bytes(0, asset=entry["href"])
     
     def _create_epub_structure(self, epub_data: Dict, html_files: Dict, 
                               css_content: str, js_content: str) -> Dict:
@@ -838,23 +1472,171 @@ body {
         # nav.xhtml
         nav_xhtml = self._generate_nav_xhtml(epub_data)
         
+        # Media overlays SMIL (narration synchronisée)
+        media_overlays = self._generate_media_overlays(epub_data)
+        
         oebps_files = {
             'content.opf': content_opf,
             'toc.ncx': toc_ncx,
             'nav.xhtml': nav_xhtml,
             'styles/main.css': css_content,
             'js/interactions.js': js_content,
-            **html_files
+            **html_files,
+            **media_overlays
         }
         
         return {
             'container_xml': container_xml,
-            'oebps_files': oebps_files
+            'oebps_files': oebps_files,
+            'media': epub_data.get('media', [])
         }
     
-    def get_task_status(self, task_id: str) -> Dict:
-        """Récupération du statut d'une tâche"""
-        return self.tasks.get(task_id, {"status": "not_found"})
+    def _generate_content_opf(self, epub_data: Dict, html_files: Dict) -> str:
+        """Génération du manifeste content.opf"""
+        metadata = epub_data["metadata"]
+        manifest = [
+            '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>',
+            '<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>',
+            '<item id="css" href="styles/main.css" media-type="text/css"/>',
+            '<item id="js" href="js/interactions.js" media-type="application/javascript"/>'
+        ]
+        spine = []
+        overlay_meta = []
+        
+        for chapter in epub_data["chapters"]:
+            overlay = ""
+            if chapter.get("audio"):
+                smil_id = f"smil_{chapter['id']}"
+                manifest.append(
+                    f'<item id="{smil_id}" href="smil/{chapter["id"]}.smil" media-type="application/smil+xml"/>'
+                )
+                overlay = f' media-overlay="{smil_id}"'
+                overlay_meta.append(
+                    f'<meta property="media:duration" refines="#{smil_id}">'
+                    f'{self._format_clock(self._overlay_duration(chapter["audio"]))}</meta>'
+                )
+            manifest.append(
+                f'<item id="{chapter["id"]}" href="text/{chapter["id"]}.xhtml" '
+                f'media-type="application/xhtml+xml" properties="scripted"{overlay}/>'
+            )
+            spine.append(f'<itemref idref="{chapter["id"]}"/>')
+        
+        for entry in epub_data.get("media", []):
+            manifest.append(f'<item id="{entry["id"]}" href="{entry["href"]}" media-type="{entry["media_type"]}"/>')
+        
+        if overlay_meta:
+            total = sum(self._overlay_duration(c["audio"]) for c in epub_data["chapters"] if c.get("audio"))
+            overlay_meta.append(f'<meta property="media:duration">{self._format_clock(total)}</meta>')
+            overlay_meta.append('<meta property="media:active-class">-epub-media-overlay-active</meta>')
+        
+        newline = "\n        "
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">
+    <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+        <dc:identifier id="book-id">urn:uuid:{metadata["identifier"]}</dc:identifier>
+        <dc:title>{escape(metadata["title"])}</dc:title>
+        <dc:creator>{escape(metadata["author"])}</dc:creator>
+        <dc:language>{escape(metadata["language"])}</dc:language>
+        <dc:publisher>{escape(metadata["publisher"])}</dc:publisher>
+        <dc:description>{escape(metadata["description"])}</dc:description>
+        <meta property="dcterms:modified">{datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}</meta>
+        {newline.join(overlay_meta)}
+    </metadata>
+    <manifest>
+        {newline.join(manifest)}
+    </manifest>
+    <spine toc="ncx">
+        {newline.join(spine)}
+    </spine>
+</package>"""
+    
+    def _generate_toc_ncx(self, epub_data: Dict) -> str:
+        """Génération de la table des matières NCX (compatibilité ePub2)"""
+        nav_points = "".join(
+            f"""
+        <navPoint id="nav_{chapter['id']}" playOrder="{index}">
+            <navLabel><text>{escape(chapter['title'])}</text></navLabel>
+            <content src="text/{chapter['id']}.xhtml"/>
+        </navPoint>"""
+            for index, chapter in enumerate(epub_data["chapters"], start=1)
+        )
+        
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
+    <head>
+        <meta name="dtb:uid" content="urn:uuid:{epub_data['metadata']['identifier']}"/>
+    </head>
+    <docTitle><text>{escape(epub_data['metadata']['title'])}</text></docTitle>
+    <navMap>{nav_points}
+    </navMap>
+</ncx>"""
+    
+    def _generate_nav_xhtml(self, epub_data: Dict) -> str:
+        """Génération du document de navigation ePub3"""
+        entries = "".join(
+            f"""
+            <li><a href="text/{chapter['id']}.xhtml">{escape(chapter['title'])}</a></li>"""
+            for chapter in epub_data["chapters"]
+        )
+        
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head>
+    <meta charset="utf-8"/>
+    <title>{escape(epub_data['metadata']['title'])}</title>
+</head>
+<body>
+    <nav epub:type="toc" id="toc">
+        <ol>{entries}
+        </ol>
+    </nav>
+</body>
+</html>"""
+    
+    def _generate_media_overlays(self, epub_data: Dict) -> Dict[str, str]:
+        """Génération des media overlays SMIL à partir des markers de sync_with_audio"""
+        overlays = {}
+        
+        for chapter in epub_data["chapters"]:
+            audio = chapter.get("audio")
+            if not audio:
+                continue
+            
+            text_href = f"../text/{chapter['id']}.xhtml"
+            markers = sorted(audio["markers"], key=lambda m: m["time"])
+            end_of_track = self._overlay_duration(audio)
+            
+            pars = []
+            for index, marker in enumerate(markers):
+                clip_end = markers[index + 1]["time"] if index + 1 < len(markers) else end_of_track
+                pars.append(f"""
+            <par id="par_{index + 1}">
+                <text src={quoteattr(f"{text_href}#{marker['animation_id']}")}/>
+                <audio src={quoteattr(audio["href"])} clipBegin="{marker['time']:.3f}s" clipEnd="{clip_end:.3f}s"/>
+            </par>""")
+            
+            overlays[f"smil/{chapter['id']}.smil"] = f"""<?xml version="1.0" encoding="UTF-8"?>
+<smil xmlns="http://www.w3.org/ns/SMIL" xmlns:epub="http://www.idpf.org/2007/ops" version="3.0">
+    <body>
+        <seq id="seq_{chapter['id']}" epub:textref="{text_href}" epub:type="chapter">{"".join(pars)}
+        </seq>
+    </body>
+</smil>"""
+        
+        return overlays
+    
+    def _overlay_duration(self, audio: Dict) -> float:
+        """Durée couverte par un media overlay (durée audio ou dernier marker)"""
+        if audio.get("duration"):
+            return float(audio["duration"])
+        return max((float(m["time"]) for m in audio["markers"]), default=0.0)
+    
+    def _format_clock(self, seconds: float) -> str:
+        """Format horloge SMIL (h:mm:ss.fff)"""
+        hours, remainder = divmod(seconds, 3600)
+        minutes, secs = divmod(remainder, 60)
+        return f"{int(hours)}:{int(minutes):02d}:{secs:06.3f}"
     
     def get_generated_file(self, task_id: str) -> Optional[str]:
         """Récupération du chemin du fichier généré"""
@@ -863,11 +1645,82 @@ body {
             return task.get("file_path")
         return None
     
+    async def sweep(self) -> Dict:
+        """Éviction des tâches terminées et des fichiers selon la politique de rétention.
+        
+        Les tâches (et leurs compteurs) sont lues et modifiées sur la boucle d'événements, qui
+        les partage avec les générations en cours ; seules les E/S disque passent par un thread."""
+        now = time.time()
+        finished = sorted(
+            ((task_id, task) for task_id, task in list(self.tasks.items()) if task.get("finished_at")),
+            key=lambda item: item[1]["finished_at"]
+        )
+        total_bytes = sum(task.get("file_size", 0) for _, task in finished)
+        evicted = 0
+        evicted_files = []
+        
+        for index, (task_id, task) in enumerate(finished):
+            remaining = len(finished) - index
+            if (now - task["finished_at"] <= self.retention["max_age"]
+                    and remaining <= self.retention["max_tasks"]
+                    and total_bytes <= self.retention["max_bytes"]):
+                break
+            self._evict_task(task_id)
+            if task.get("file_path"):
+                evicted_files.append(task["file_path"])
+            total_bytes -= task.get("file_size", 0)
+            evicted += 1
+        
+        tracked = {task.get("file_path") for task in list(self.tasks.values())}
+        evicted += await asyncio.to_thread(self._remove_files, evicted_files, tracked, now)
+        self.last_usage = await asyncio.to_thread(self.storage_usage)
+        return {"evicted": evicted, **self.last_usage}
+    
+    def _evict_task(self, task_id: str):
+        """Suppression d'une tâche (son fichier est supprimé par l'appelant)"""
+        task = self.tasks.get(task_id) or {}
+        self._set_task(task_id, None)
+        self._release_fingerprint(task.get("fingerprint"), task_id)
+    
+    def _remove_files(self, paths: List[str], tracked: set, now: float) -> int:
+        """Suppression des fichiers évincés, puis des fichiers orphelins (tâches d'un processus
+        précédent) au-delà de l'âge maximal ; renvoie le nombre d'orphelins supprimés"""
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        orphans = 0
+        for path in self.output_dir.glob("*.epub"):
+            try:
+                if str(path) not in tracked and now - path.stat().st_mtime > self.retention["max_age"]:
+                    path.unlink()
+                    orphans += 1
+            except FileNotFoundError:
+                continue
+        return orphans
+    
+    def storage_usage(self) -> Dict:
+        """Occupation mémoire (tâches) et disque (fichiers ePub)"""
+        files = list(self.output_dir.glob("*.epub"))
+        return {
+            "tasks": len(self.tasks),
+            "files": len(files),
+            "bytes": sum(path.stat().st_size for path in files if path.exists())
+        }
+    
     def health_check(self) -> Dict:
         """Vérification santé du générateur"""
+        if self.last_usage is None:
+            self.last_usage = self.storage_usage()
+        counts = dict(self.status_counts.items())
         return {
             "status": "healthy",
-            "active_tasks": len([t for t in self.tasks.values() if t.get("status") == "processing"]),
-            "completed_tasks": len([t for t in self.tasks.values() if t.get("status") == "completed"]),
-            "output_dir": str(self.output_dir)
+            "queued_tasks": counts.get("queued", 0),
+            "active_tasks": counts.get("processing", 0),
+            "completed_tasks": counts.get("completed", 0),
+            "failed_tasks": counts.get("error", 0),
+            "output_dir": str(self.output_dir),
+            "storage": self.last_usage,
+            "retention": self.retention
         }
@@ -0,0 +1,171 @@
+# ===== ASSET_STORE.PY =====
+"""Stockage local adressé par contenu (SHA-256) des fichiers envoyés une fois puis référencés par ID"""
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+ASSET_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+# Référence à un asset dans les requêtes JSON (ex. "audio_path": "asset:<sha256>")
+ASSET_REF_PREFIX = "asset:"
+# Médias distants : laissés en référence, jamais lus sur le disque
+REMOTE_PREFIXES = ("http://", "https://")
+
+
+class MediaPathError(ValueError):
+    """Média local hors des répertoires autorisés (lecture de fichiers arbitraires du serveur)"""
+
+
+def media_roots() -> List[str]:
+    """Répertoires dont les fichiers peuvent être embarqués (ePub, mobile) : MEDIA_ROOTS
+    (séparés par os.pathsep), par défaut les blobs du stockage d'assets et le travail du pipeline"""
+    configured = os.getenv("MEDIA_ROOTS") or os.pathsep.join((
+        os.path.join(os.getenv("ASSET_STORE_DIR", "./exports/assets"), "objects"),
+        os.getenv("PIPELINE_WORK_DIR", "./exports/pipelines")
+    ))
+    return [os.path.realpath(root) for root in configured.split(os.pathsep) if root]
+
+
+def is_remote(reference: Optional[str]) -> bool:
+    return isinstance(reference, str) and reference.lower().startswith(REMOTE_PREFIXES)
+
+
+def local_media_path(source: str, roots: Optional[Sequence[str]] = None) -> Optional[str]:
+    """Chemin réel d'un média local à embarquer (None pour une URL) ; MediaPathError si le
+    fichier n'existe pas ou sort des répertoires autorisés (liens symboliques résolus)"""
+    if is_remote(source):
+        return None
+    path = os.path.realpath(source)
+    roots = media_roots() if roots is None else roots
+    if not any(path.startswith(root + os.sep) for root in roots) or not os.path.isfile(path):
+        raise MediaPathError(f"Média non autorisé: {source}")
+    return path
+
+
+class AssetStore:
+    """Blobs dans objects/<2 premiers caractères>/<sha256><extension>, métadonnées en JSON à côté.
+
+    Un même contenu n'est stocké qu'une fois ; la date de modification des métadonnées
+    sert de date de dernier usage pour l'éviction (le blob n'est jamais modifié)."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        # Occupation relevée au dernier nettoyage (rapport de santé sans parcours du disque)
+        self.last_usage: Optional[Dict] = None
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        (self.root / "objects").mkdir(exist_ok=True)
+
+    @staticmethod
+    def is_valid_id(asset_id: str) -> bool:
+        return bool(ASSET_ID_PATTERN.match(asset_id or ""))
+
+    def _meta_path(self, asset_id: str) -> Path:
+        return self.root / "objects" / asset_id[:2] / f"{asset_id}.json"
+
+    def info(self, asset_id: str) -> Optional[Dict]:
+        """Métadonnées d'un asset (None si inconnu ou ID invalide)"""
+        if not self.is_valid_id(asset_id):
+            return None
+        try:
+            return json.loads(self._meta_path(asset_id).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def path(self, asset_id: str, touch: bool = True) -> Optional[str]:
+        """Chemin du blob sur disque ; marque l'asset comme utilisé"""
+        info = self.info(asset_id)
+        if not info:
+            return None
+        blob = self.root / info["path"]
+        if not blob.is_file():
+            return None
+        if touch:
+            os.utime(self._meta_path(asset_id))
+        return str(blob)
+
+    def resolve(self, reference: Optional[str]) -> Optional[str]:
+        """Remplacement d'une référence "asset:<id>" par le chemin du blob (autres valeurs inchangées)"""
+        if not isinstance(reference, str) or not reference.startswith(ASSET_REF_PREFIX):
+            return reference
+        asset_id = reference[len(ASSET_REF_PREFIX):]
+        path = self.path(asset_id)
+        if path is None:
+            raise KeyError(asset_id)
+        return path
+
+    def put_spooled(self, tmp_path: str, asset_id: str, size: int, filename: Optional[str],
+                    content_type: Optional[str]) -> Dict:
+        """Publication d'un fichier déjà reçu dans tmp_dir et haché pendant la réception"""
+        try:
+            return self._commit(tmp_path, asset_id, size, filename, content_type)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _commit(self, tmp_path: str, asset_id: str, size: int, filename: Optional[str],
+                content_type: Optional[str]) -> Dict:
+        """Publication atomique du blob (ou réutilisation s'il existe déjà)"""
+        existing = self.info(asset_id)
+        if existing and (self.root / existing["path"]).is_file():
+            os.utime(self._meta_path(asset_id))
+            return {**existing, "created": False}
+
+        extension = Path(filename or "").suffix.lower()
+        if not re.match(r"^\.[a-z0-9]{1,8}$", extension):
+            extension = ""
+        relative = Path("objects") / asset_id[:2] / f"{asset_id}{extension}"
+        (self.root / relative).parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, self.root / relative)
+
+        info = {
+            "asset_id": asset_id,
+            "path": str(relative),
+            "size": size,
+            "filename": filename,
+            "content_type": content_type,
+            "created_at": time.time()
+        }
+        meta_tmp = self._meta_path(asset_id).with_suffix(f".{os.getpid()}.tmp")
+        meta_tmp.write_text(json.dumps(info))
+        os.replace(meta_tmp, self._meta_path(asset_id))
+        return {**info, "created": True}
+
+    def sweep(self, max_age: float) -> int:
+        """Suppression des assets inutilisés depuis max_age secondes ; renvoie le nombre supprimé"""
+        cutoff = time.time() - max_age
+        removed = 0
+        for meta in (self.root / "objects").glob("*/*.json"):
+            try:
+                if meta.stat().st_mtime >= cutoff:
+                    continue
+                info = json.loads(meta.read_text())
+                (self.root / info["path"]).unlink(missing_ok=True)
+                meta.unlink()
+                removed += 1
+            except (OSError, ValueError, KeyError):
+                continue
+
+        # Fichiers temporaires abandonnés (upload interrompu par un arrêt brutal)
+        for stale in self.tmp_dir.iterdir():
+            try:
+                if stale.stat().st_mtime < cutoff:
+                    stale.unlink()
+            except OSError:
+                continue
+        self.last_usage = self.usage()
+        return removed
+
+    def usage(self) -> Dict:
+        """Nombre d'assets et octets occupés (tailles lues dans les métadonnées)"""
+        files = 0
+        total = 0
+        for meta in (self.root / "objects").glob("*/*.json"):
+            try:
+                total += json.loads(meta.read_text())["size"]
+                files += 1
+            except (OSError, ValueError, KeyError):
+                continue
+        return {"assets": files, "bytes": total}
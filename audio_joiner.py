@@ -0,0 +1,298 @@
+# ===== AUDIO_JOINER.PY =====
+"""Concaténation sans réencodage de segments audio de même format (trames MP3, PCM WAV),
+avec silences optionnels et table des positions de chaque segment dans la piste produite"""
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple, Union
+
+# Segment : chemin d'un fichier ou contenu déjà en mémoire (sortie d'un fournisseur TTS)
+Source = Union[str, os.PathLike, bytes]
+
+JOINABLE_FORMATS = ("mp3", "wav")
+WRITE_CHUNK_SIZE = 1024 * 1024
+
+# Débits (kbit/s) par (MPEG-1 ?, couche), index 1 à 14 ; 0 (« free ») et 15 sont refusés
+MP3_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Fréquences par version (3 : MPEG-1, 2 : MPEG-2, 0 : MPEG-2.5)
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+class Mp3Frame:
+    """En-tête de trame MP3 décodé"""
+
+    __slots__ = ("length", "samples", "sample_rate", "stream", "mono", "crc", "layer", "mpeg1")
+
+    def __init__(self, length: int, samples: int, sample_rate: int, stream: Tuple[int, int],
+                 mono: bool, crc: bool):
+        self.length = length
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.stream = stream
+        self.mono = mono
+        self.crc = crc
+        self.layer = stream[1]
+        self.mpeg1 = stream[0] == 3
+
+
+def _mp3_header(data, pos: int) -> Optional[Mp3Frame]:
+    """En-tête valide à cette position, None sinon"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version, layer_bits = (b1 >> 3) & 3, (b1 >> 1) & 3
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if version == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    layer, mpeg1 = 4 - layer_bits, version == 3
+    bitrate = MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        length, samples = (12 * bitrate // sample_rate + padding) * 4, 384
+    elif layer == 2 or mpeg1:
+        length, samples = 144 * bitrate // sample_rate + padding, 1152
+    else:
+        length, samples = 72 * bitrate // sample_rate + padding, 576
+    return Mp3Frame(length, samples, sample_rate, (version, layer), (b3 >> 6) == 3, not b1 & 1)
+
+
+def _id3v2_size(data) -> int:
+    """Taille de l'étiquette ID3v2 en tête (0 si absente)"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+def _is_info_frame(data, pos: int, frame: Mp3Frame) -> bool:
+    """Trame d'information Xing/Info/VBRI (métadonnées d'encodeur, pas de l'audio)"""
+    if frame.layer != 3:
+        return False
+    side_info = (17 if frame.mono else 32) if frame.mpeg1 else (9 if frame.mono else 17)
+    offset = pos + 4 + (2 if frame.crc else 0) + side_info
+    return data[offset:offset + 4] in (b"Xing", b"Info") or data[pos + 36:pos + 40] == b"VBRI"
+
+
+def iter_mp3_frames(data) -> Iterator[Tuple[int, Mp3Frame]]:
+    """Trames audio (position, en-tête), étiquettes ID3 et trame d'information exclues.
+    Les octets parasites entre trames sont sautés (resynchronisation)."""
+    pos = _id3v2_size(data)
+    end = len(data) - (128 if data[-128:-125] == b"TAG" else 0)
+    first = True
+    while pos + 4 <= end:
+        frame = _mp3_header(data, pos)
+        if frame is None or pos + frame.length > end:
+            pos = data.find(b"\xff", pos + 1, end)
+            if pos < 0:
+                return
+            continue
+        if not (first and _is_info_frame(data, pos, frame)):
+            yield pos, frame
+        first = False
+        pos += frame.length
+
+
+def _silent_mp3_frame(data, pos: int) -> Tuple[bytes, Mp3Frame]:
+    """Trame muette au format de la trame donnée : sans CRC ni bourrage, informations
+    latérales nulles (aucun coefficient : le décodeur produit du silence)"""
+    header = bytearray(data[pos:pos + 4])
+    header[1] |= 0x01
+    header[2] &= 0xFD
+    frame = _mp3_header(header, 0)
+    return bytes(header) + bytes(frame.length - 4), frame
+
+
+def _wav_layout(data) -> Tuple[bytes, int, int]:
+    """Corps du bloc fmt, position et taille des données PCM"""
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("Fichier WAV invalide")
+    pos, fmt = 12, None
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        size = struct.unpack_from("<I", data, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            fmt = bytes(data[body:body + size])
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("Bloc fmt manquant avant les données WAV")
+            # Sortie en flux : taille inconnue à l'écriture (0 ou 0xFFFFFFFF)
+            if size in (0, 0xFFFFFFFF) or body + size > len(data):
+                size = len(data) - body
+            block_align = struct.unpack_from("<H", fmt, 12)[0]
+            return fmt, body, size - size % block_align
+        pos = body + size + (size & 1)
+    raise ValueError("Bloc data manquant")
+
+
+@contextmanager
+def _open_source(source: Source):
+    """Contenu du segment : octets, ou fichier projeté en mémoire (aucune copie)"""
+    if isinstance(source, (bytes, bytearray)):
+        yield source
+        return
+    with open(source, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def detect_format(data) -> Optional[str]:
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "wav"
+    pos = _id3v2_size(data)
+    if _mp3_header(data, pos) is not None:
+        return "mp3"
+    return None
+
+
+def join_audio(sources: Sequence[Source], output_path: Union[str, os.PathLike],
+               audio_format: Optional[str] = None, silence: float = 0.0,
+               leading_silence: float = 0.0) -> Dict:
+    """Concaténation des segments dans output_path (écriture en flux, fichier publié
+    atomiquement). `silence` est inséré entre deux segments, `leading_silence` avant le premier.
+
+    Renvoie la durée totale et, pour chaque segment, son début et sa durée (secondes)."""
+    if not sources:
+        raise ValueError("Aucun segment à concaténer")
+    # Silence négatif : taille de données fausse dans l'en-tête WAV, ramené à zéro
+    silence, leading_silence = max(silence, 0.0), max(leading_silence, 0.0)
+    if audio_format is None:
+        with _open_source(sources[0]) as data:
+            audio_format = detect_format(data)
+    if audio_format not in JOINABLE_FORMATS:
+        raise ValueError(f"Format non supporté pour la concaténation: {audio_format}")
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    try:
+        with open(tmp_path, "wb") as output:
+            writer = _join_mp3 if audio_format == "mp3" else _join_wav
+            result = writer(sources, output, silence, leading_silence)
+        os.replace(tmp_path, output_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return {"path": str(output_path), "format": audio_format, **result}
+
+
+def _segment_entry(index: int, start: float, duration: float) -> Dict:
+    return {"index": index, "start": round(start, 6), "duration": round(duration, 6)}
+
+
+def _join_mp3(sources: Sequence[Source], output, silence: float, leading_silence: float) -> Dict:
+    stream = sample_rate = None
+    silent_frame = None
+    total_samples = 0
+    segments = []
+
+    def write_silence(seconds: float) -> int:
+        # Durée arrondie à la trame : les positions sont calculées sur ce qui est écrit
+        if seconds <= 0 or silent_frame is None:
+            return 0
+        frame_bytes, frame = silent_frame
+        count = round(seconds * frame.sample_rate / frame.samples)
+        for start in range(0, count, 256):
+            output.write(frame_bytes * min(256, count - start))
+        return count * frame.samples
+
+    pending_leading = leading_silence
+    for index, source in enumerate(sources):
+        with _open_source(source) as data:
+            samples = 0
+            run_start = run_end = None
+            for pos, frame in iter_mp3_frames(data):
+                if stream is None:
+                    stream, sample_rate = frame.stream, frame.sample_rate
+                    silent_frame = _silent_mp3_frame(data, pos)
+                    total_samples += write_silence(pending_leading)
+                elif frame.stream != stream or frame.sample_rate != sample_rate:
+                    raise ValueError(f"Segment {index}: format MP3 différent du premier segment "
+                                     f"({frame.sample_rate} Hz)")
+                if index and samples == 0:
+                    total_samples += write_silence(silence)
+                # Trames contiguës écrites d'un bloc
+                if run_end != pos:
+                    if run_start is not None:
+                        output.write(data[run_start:run_end])
+                    run_start = pos
+                run_end = pos + frame.length
+                samples += frame.samples
+            if run_start is not None:
+                output.write(data[run_start:run_end])
+        if samples == 0:
+            raise ValueError(f"Segment {index}: aucune trame MP3")
+        segments.append(_segment_entry(index, total_samples / sample_rate, samples / sample_rate))
+        total_samples += samples
+
+    return {
+        "duration": round(total_samples / sample_rate, 6),
+        "sample_rate": sample_rate,
+        "segments": segments
+    }
+
+
+def _join_wav(sources: Sequence[Source], output, silence: float, leading_silence: float) -> Dict:
+    fmt = None
+    data_bytes = 0
+    segments = []
+
+    def write_silence(seconds: float) -> int:
+        frames = round(seconds * sample_rate)
+        remaining = frames * block_align
+        # PCM 8 bits non signé : le silence vaut 0x80
+        fill = b"\x80" if bits == 8 else b"\x00"
+        block = fill * min(remaining, WRITE_CHUNK_SIZE)
+        while remaining > 0:
+            output.write(block[:remaining])
+            remaining -= len(block)
+        return frames * block_align
+
+    for index, source in enumerate(sources):
+        with _open_source(source) as data:
+            segment_fmt, offset, size = _wav_layout(data)
+            if fmt is None:
+                fmt = segment_fmt
+                channels, sample_rate, _, block_align, bits = struct.unpack_from("<HIIHH", fmt, 2)
+                # En-tête provisoire : tailles RIFF et data complétées à la fin
+                output.write(b"RIFF\0\0\0\0WAVEfmt " + struct.pack("<I", len(fmt)) + fmt
+                             + (b"\0" if len(fmt) & 1 else b"") + b"data\0\0\0\0")
+                data_bytes += write_silence(leading_silence)
+            elif segment_fmt[:16] != fmt[:16]:
+                raise ValueError(f"Segment {index}: format WAV différent du premier segment")
+            else:
+                data_bytes += write_silence(silence)
+            for start in range(offset, offset + size, WRITE_CHUNK_SIZE):
+                output.write(data[start:min(start + WRITE_CHUNK_SIZE, offset + size)])
+        segments.append(_segment_entry(index, data_bytes / block_align / sample_rate,
+                                       size / block_align / sample_rate))
+        data_bytes += size
+
+    if data_bytes & 1:
+        output.write(b"\0")
+    end = output.tell()
+    output.seek(4)
+    output.write(struct.pack("<I", end - 8))
+    output.seek(end - data_bytes - (data_bytes & 1) - 4)
+    output.write(struct.pack("<I", data_bytes))
+    output.seek(end)
+
+    return {
+        "duration": round(data_bytes / block_align / sample_rate, 6),
+        "sample_rate": sample_rate,
+        "segments": segments
+    }
@@ -0,0 +1,14 @@
+# ===== BENCHMARK_META.PY =====
+"""Métadonnées communes des rapports de benchmark (commit mesuré)"""
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+
+def git_commit() -> Optional[str]:
+    """Commit courant du dépôt (None hors dépôt git ou sans git)"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
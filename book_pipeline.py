@@ -0,0 +1,429 @@
+# ===== BOOK_PIPELINE.PY =====
+"""Livre narré de bout en bout : TTS, synchronisation, animations et assemblage ePub
+exécutés comme un graphe de dépendances (chapitres indépendants traités en parallèle)"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from audio_joiner import JOINABLE_FORMATS, join_audio
+from document_model import Document, ContentItem
+from metrics import STAGE_LATENCY, STAGE_ERRORS, SERVICE_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+# Limite de caractères par appel TTS (OpenAI : 4096)
+TTS_MAX_CHARS = 4000
+
+# name -> (dépendances, fonction recevant les sorties des dépendances)
+Graph = Dict[str, Tuple[List[str], Callable[[Dict[str, Any]], Awaitable[Any]]]]
+
+
+class NarratedBookPipeline:
+    """Orchestrateur du pipeline. L'état de chaque étape (statut, sortie) est persisté dans
+    `pipelines` : une reprise après échec ne réexécute que les étapes non terminées (et celles
+    dont une dépendance est réexécutée)."""
+
+    def __init__(self, tts_service, animation_service, epub_generator, store=None):
+        self.tts = tts_service
+        self.animation = animation_service
+        self.epub = epub_generator
+        self.pipelines = store.mapping("pipelines") if store else {}
+        self.work_dir = Path(os.getenv("PIPELINE_WORK_DIR", "./exports/pipelines"))
+        # Limites du processus, tous pipelines confondus : étapes en cours (TTS, synchronisation,
+        # animation, assemblage) et appels TTS simultanés. En mode partagé, chaque worker
+        # exécute en plus au plus JOB_CONCURRENCY pipelines de la file.
+        self.concurrency = int(os.getenv("PIPELINE_CONCURRENCY", 4))
+        self.tts_concurrency = int(os.getenv("PIPELINE_TTS_CONCURRENCY", 4))
+        self._stage_slots = asyncio.Semaphore(self.concurrency)
+        self._tts_slots = asyncio.Semaphore(self.tts_concurrency)
+        self.max_age = float(os.getenv("PIPELINE_MAX_AGE", 24 * 3600))
+        # Pipeline "processing" sans battement depuis ce délai : exécution interrompue (worker arrêté)
+        self.stale_after = float(os.getenv("PIPELINE_STALE_AFTER", 300))
+        self.shared = store is not None
+        self._running: set = set()
+
+    def create(self, pipeline_id: str, request: Dict, options: Dict) -> Dict:
+        """Enregistrement d'un pipeline et de ses étapes (toutes en attente)"""
+        graph = self._build_graph(pipeline_id, request, options)
+        record = {
+            "pipeline_id": pipeline_id,
+            "status": "queued",
+            "progress": 0,
+            "created_at": time.time(),
+            "request": request,
+            "options": options,
+            "stages": {name: {"status": "pending", "depends_on": deps} for name, (deps, _) in graph.items()}
+        }
+        self.pipelines[pipeline_id] = record
+        return record
+
+    def get_status(self, pipeline_id: str) -> Dict:
+        """État du pipeline (sans la requête d'origine)"""
+        record = self.pipelines.get(pipeline_id)
+        if record is None:
+            return {"status": "not_found"}
+        return {key: value for key, value in record.items() if key != "request"}
+
+    def backlog(self) -> int:
+        """Nombre de pipelines en attente ou en cours (parcours des pipelines)"""
+        return sum(record.get("status") in ("queued", "processing") for record in list(self.pipelines.values()))
+
+    def resumable(self, pipeline_id: str) -> bool:
+        """Reprise possible : pipeline en échec, ou "processing" sans exécution en cours
+        (arrêt du processus, ou worker sans battement depuis stale_after en mode partagé)"""
+        record = self.pipelines.get(pipeline_id)
+        if record is None:
+            return False
+        if record["status"] == "failed":
+            return True
+        if record["status"] != "processing" or pipeline_id in self._running:
+            return False
+        return not self.shared or time.time() - record.get("heartbeat_at", 0) > self.stale_after
+
+    def mark_queued(self, pipeline_id: str) -> List[str]:
+        """Remise en file avant reprise ; renvoie les étapes qui seront exécutées"""
+        record = self.pipelines[pipeline_id]
+        graph = self._build_graph(pipeline_id, record["request"], record["options"])
+        reusable = self._reusable_stages(record, graph)
+        self._update(pipeline_id, status="queued", heartbeat_at=time.time())
+        return [name for name in graph if name not in reusable]
+
+    async def run(self, pipeline_id: str):
+        """Exécution (ou reprise) du graphe ; les étapes terminées dont la sortie est
+        toujours disponible, ainsi que celle de toutes leurs dépendances, sont sautées"""
+        self._running.add(pipeline_id)
+        heartbeat = asyncio.create_task(self._heartbeat(pipeline_id))
+        try:
+            await self._run(pipeline_id)
+        except BaseException as e:
+            # Erreur hors étape (document invalide) ou annulation : pas de "processing" orphelin
+            if self.pipelines.get(pipeline_id, {}).get("status") == "processing":
+                self._update(pipeline_id, status="failed", error=str(e) or type(e).__name__,
+                             finished_at=time.time())
+            raise
+        finally:
+            heartbeat.cancel()
+            self._running.discard(pipeline_id)
+
+    async def _heartbeat(self, pipeline_id: str):
+        while True:
+            await asyncio.sleep(self.stale_after / 4)
+            self._update(pipeline_id, heartbeat_at=time.time())
+
+    async def _run(self, pipeline_id: str):
+        record = self.pipelines[pipeline_id]
+        graph = self._build_graph(pipeline_id, record["request"], record["options"])
+        self._update(pipeline_id, status="processing", error=None, started_at=time.time(),
+                     heartbeat_at=time.time())
+
+        completed = self._reusable_stages(record, graph)
+        for name in graph:
+            # Sortie périmée (étape ou dépendance réexécutée) : l'étape repart en attente
+            if name not in completed and record["stages"][name]["status"] != "pending":
+                self._set_stage(pipeline_id, name, status="pending", output=None)
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def execute(name: str):
+            deps, function = graph[name]
+            # Échec d'une dépendance : l'étape reste en attente (reprise ultérieure)
+            await asyncio.gather(*(tasks[dep] for dep in deps))
+            if name in completed:
+                return
+            async with self._stage_slots:
+                stage_kind = name.split(":")[0]
+                self._set_stage(pipeline_id, name, status="running", started_at=time.time(), error=None)
+                try:
+                    with STAGE_LATENCY.labels("pipeline", stage_kind).time():
+                        stages = self.pipelines[pipeline_id]["stages"]
+                        output = await function({dep: stages[dep].get("output") for dep in deps})
+                except Exception as e:
+                    STAGE_ERRORS.labels("pipeline", stage_kind).inc()
+                    self._set_stage(pipeline_id, name, status="failed", error=str(e), finished_at=time.time())
+                    raise
+                self._set_stage(pipeline_id, name, status="completed", output=output, finished_at=time.time())
+
+        # Ordre d'insertion du graphe : les dépendances précèdent toujours leurs dépendants
+        with SERVICE_IN_FLIGHT.labels("pipeline").track_inprogress():
+            for name in graph:
+                tasks[name] = asyncio.create_task(execute(name))
+            results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        errors = [f"{name}: {result}" for name, result in zip(tasks, results)
+                  if isinstance(result, Exception) and self.pipelines[pipeline_id]["stages"][name]["status"] == "failed"]
+        if errors:
+            self._update(pipeline_id, status="failed", error="; ".join(errors), finished_at=time.time())
+            logger.error(f"Pipeline {pipeline_id} en échec: {errors}")
+        else:
+            assemble = self.pipelines[pipeline_id]["stages"]["assemble"]["output"]
+            self._update(pipeline_id, status="completed", epub_task_id=assemble["task_id"],
+                         file_path=assemble["path"], finished_at=time.time())
+
+    # ----- Construction du graphe -----
+
+    def _build_graph(self, pipeline_id: str, request: Dict, options: Dict) -> Graph:
+        graph: Graph = {}
+        work_dir = self.work_dir / pipeline_id
+        # Document construit une fois, partagé par toutes les étapes du graphe
+        document = Document.parse(request["content"], request.get("animations", []))
+
+        # Animations à générer (spécification "generate"), indépendantes de l'audio
+        for animation in document.animations:
+            if animation.get("generate") and animation.get("id"):
+                graph[f"animation:{animation['id']}"] = ([], self._animation_stage(work_dir, animation))
+
+        for index, chapter in enumerate(document.chapters):
+            if not options.get("narrate", True) or not self._chapter_text(chapter.items):
+                continue
+            graph[f"tts:{index}"] = ([], self._tts_stage(work_dir, index, chapter.items, options))
+            graph[f"sync:{index}"] = ([f"tts:{index}"], self._sync_stage(index, chapter.items, document))
+
+        graph["assemble"] = (list(graph), self._assemble_stage(pipeline_id, request, document))
+        return graph
+
+    def _chapter_text(self, chapter: Sequence[ContentItem]) -> str:
+        """Texte à narrer : titres et paragraphes, balises HTML retirées"""
+        parts = []
+        for item in chapter:
+            text = item.text or item.html or (item.title if item.type == "chapter" else None)
+            if text:
+                text = re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", text))
+                parts.append(re.sub(r" ([.,…)])", r"\1", text).strip())
+        return "\n\n".join(part for part in parts if part)
+
+    def _text_chunks(self, text: str) -> List[str]:
+        """Découpage aux paragraphes (puis aux phrases) sous la limite TTS"""
+        chunks, current = [], ""
+        pieces = []
+        for paragraph in text.split("\n\n"):
+            if len(paragraph) <= TTS_MAX_CHARS:
+                pieces.append(paragraph)
+            else:
+                pieces.extend(re.split(r"(?<=[.!?…])\s+", paragraph))
+        for piece in pieces:
+            piece = piece[:TTS_MAX_CHARS]
+            if current and len(current) + len(piece) + 2 > TTS_MAX_CHARS:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n\n{piece}" if current else piece
+        if current:
+            chunks.append(current)
+        return chunks
+
+    # ----- Étapes -----
+
+    def _tts_stage(self, work_dir: Path, index: int, chapter: Sequence[ContentItem], options: Dict):
+        async def run(_: Dict) -> Dict:
+            quality = options.get("quality", "standard")
+            # Horodatage demandé seulement s'il ne change ni le fournisseur ni le format
+            timestamps = self.tts.timestamps_available(options.get("format", "mp3"), quality)
+            async def synthesize(chunk: str) -> Dict:
+                async with self._tts_slots:
+                    return await self.tts.synthesize(
+                        text=chunk,
+                        voice=options.get("voice", "alloy"),
+                        language=options.get("language", "fr"),
+                        speed=options.get("speed", 1.0),
+                        format=options.get("format", "mp3"),
+                        quality=quality,
+                        timestamps=timestamps,
+                        priority="bulk"
+                    )
+
+            results = await asyncio.gather(*(
+                synthesize(chunk) for chunk in self._text_chunks(self._chapter_text(chapter))
+            ))
+            failed = [result.get("error") for result in results if not result.get("success")]
+            if failed:
+                raise RuntimeError(f"TTS: {failed[0]}")
+
+            # Format réellement rendu par le fournisseur (ElevenLabs : toujours MP3)
+            formats = {result.get("format") or options.get("format", "mp3") for result in results}
+            if len(formats) > 1:
+                raise RuntimeError(f"TTS: formats hétérogènes dans le chapitre ({', '.join(sorted(formats))})")
+            audio_format = formats.pop()
+            path = work_dir / "audio" / f"chapter_{index + 1}.{audio_format}"
+            audio = await asyncio.to_thread(
+                self._write_audio, path, audio_format, [result["data"] for result in results],
+                options.get("chunk_pause", 0.0), sum(result.get("duration", 0) for result in results)
+            )
+            # Horodatage des mots ramené au début de chaque segment dans la piste jointe
+            if audio.get("segments") and all(result.get("words") for result in results):
+                audio["words"] = [
+                    {"word": word["word"], "start": round(word["start"] + segment["start"], 3),
+                     "end": round(word["end"] + segment["start"], 3)}
+                    for result, segment in zip(results, audio["segments"]) for word in result["words"]
+                ]
+            return audio
+        return run
+
+    def _write_audio(self, path: Path, audio_format: str, encoded_chunks: List[str],
+                     pause: float, estimated_duration: float) -> Dict:
+        """Piste du chapitre : segments joints sans réencodage (MP3, WAV), avec la position
+        de chaque segment ; autres formats concaténés tels quels (durée estimée)"""
+        chunks = [base64.b64decode(chunk) for chunk in encoded_chunks]
+        if audio_format in JOINABLE_FORMATS:
+            joined = join_audio(chunks, path, audio_format, silence=pause)
+            return {"path": joined["path"], "duration": joined["duration"], "segments": joined["segments"]}
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "wb") as audio:
+            for chunk in chunks:
+                audio.write(chunk)
+        os.replace(tmp_path, path)
+        return {"path": str(path), "duration": estimated_duration}
+
+    def _sync_stage(self, index: int, chapter: Sequence[ContentItem], document: Document):
+        # Ancrage éventuel sur un mot de la narration (`cue` de la spécification d'animation)
+        animations = []
+        for item in chapter:
+            if item.type == "animation" and item.animation_id:
+                cue = (document.animation(item.animation_id) or {}).get("cue") or item.get("cue")
+                animations.append({"id": item.animation_id, **({"cue": cue} if cue else {})})
+
+        async def run(outputs: Dict) -> Dict:
+            audio = outputs[f"tts:{index}"]
+            # Horodatage fourni par le TTS : pas d'analyse librosa de notre propre synthèse
+            result = await self.animation.sync_with_audio(
+                audio_file=None,
+                animations=animations,
+                timeline=[],
+                audio_path=audio["path"],
+                word_timings=audio.get("words")
+            )
+            if not result.get("success"):
+                raise RuntimeError(result.get("error", "Erreur sync"))
+            return {
+                "markers": result["markers"],
+                # Piste jointe : durée exacte (l'horodatage s'arrête au dernier mot)
+                "duration": audio["duration"] if audio.get("segments") else
+                result["sync_data"].get("duration", audio["duration"])
+            }
+        return run
+
+    def _animation_stage(self, work_dir: Path, animation: Dict):
+        spec = animation["generate"]
+
+        async def run(_: Dict) -> Dict:
+            result = await self.animation.generate(
+                animation_type=spec.get("type", "lottie"),
+                content=spec.get("content", {}),
+                duration=spec.get("duration", 3000),
+                fps=spec.get("fps", 30)
+            )
+            if not result.get("success"):
+                raise RuntimeError(result.get("error", "Erreur animation"))
+            path = work_dir / "animations" / f"{re.sub(r'[^A-Za-z0-9._-]', '_', str(animation['id']))}.json"
+            await asyncio.to_thread(self._write_json, path, result)
+            return {"path": str(path)}
+        return run
+
+    def _write_json(self, path: Path, data: Dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, separators=(",", ":")))
+
+    def _assemble_stage(self, pipeline_id: str, request: Dict, document: Document):
+        async def run(outputs: Dict) -> Dict:
+            # Animations générées : résultat relu depuis le disque
+            animations = []
+            for animation in document.animations:
+                generated = outputs.get(f"animation:{animation.get('id')}")
+                if generated:
+                    result = json.loads(Path(generated["path"]).read_text())
+                    animation = {key: value for key, value in animation.items() if key != "generate"}
+                    if "lottie_data" in result:
+                        animation["lottie_data"] = result["lottie_data"]
+                    else:
+                        animation.update(result)
+                animations.append(animation)
+
+            # Narration insérée en tête de chaque chapitre, avec ses marqueurs de synchronisation
+            items = list(document.preamble)
+            for index, chapter in enumerate(document.chapters):
+                sync = outputs.get(f"sync:{index}")
+                items.append(chapter.items[0])
+                if sync:
+                    items.append(ContentItem(
+                        "audio",
+                        audio_path=outputs[f"tts:{index}"]["path"],
+                        sync={"markers": sync["markers"], "sync_data": {"duration": sync["duration"]}}
+                    ))
+                items.extend(chapter.items[1:])
+
+            task_id = f"{pipeline_id}_epub"
+            await self.epub.generate_async(
+                task_id=task_id,
+                title=request["title"],
+                author=request["author"],
+                content=Document(items, animations),
+                animations=animations,
+                audio_files=request.get("audio_files", []),
+                metadata=request.get("metadata", {})
+            )
+            task = self.epub.get_task_status(task_id)
+            if task.get("status") != "completed":
+                raise RuntimeError(task.get("error", "Erreur ePub"))
+            return {"task_id": task_id, "path": task["file_path"]}
+        return run
+
+    # ----- État -----
+
+    def _output_available(self, output: Optional[Dict]) -> bool:
+        """Sortie réutilisable (fichiers produits toujours présents)"""
+        return output is not None and (not output.get("path") or os.path.exists(output["path"]))
+
+    def _reusable_stages(self, record: Dict, graph: Graph) -> set:
+        """Étapes terminées dont la sortie est disponible et dont toutes les dépendances le sont
+        aussi : une étape réexécutée invalide ses dépendants, transitivement (ordre du graphe)"""
+        reusable = set()
+        for name, (deps, _) in graph.items():
+            stage = record["stages"].get(name, {})
+            if (stage.get("status") == "completed" and self._output_available(stage.get("output"))
+                    and all(dep in reusable for dep in deps)):
+                reusable.add(name)
+        return reusable
+
+    def _update(self, pipeline_id: str, **fields):
+        record = self.pipelines[pipeline_id]
+        record.update(fields)
+        self.pipelines[pipeline_id] = record
+
+    def _set_stage(self, pipeline_id: str, name: str, **fields):
+        """Mise à jour d'une étape et de la progression (valeurs lues = copies : réécriture)"""
+        record = self.pipelines[pipeline_id]
+        record["stages"][name].update(fields)
+        stages = record["stages"].values()
+        record["progress"] = round(100 * sum(s["status"] == "completed" for s in stages) / len(stages))
+        self.pipelines[pipeline_id] = record
+
+    async def sweep(self) -> int:
+        """Éviction des pipelines terminés depuis plus de max_age (état et fichiers de travail).
+
+        Les enregistrements sont choisis et retirés sur la boucle d'événements, qui les modifie
+        pendant les exécutions et reprises ; seule la suppression des fichiers passe par un thread."""
+        cutoff = time.time() - self.max_age
+        evicted = [
+            pipeline_id for pipeline_id, record in list(self.pipelines.items())
+            if record.get("status") in ("completed", "failed") and record.get("finished_at", 0) < cutoff
+            and pipeline_id not in self._running
+        ]
+        for pipeline_id in evicted:
+            self.pipelines.pop(pipeline_id, None)
+        await asyncio.to_thread(self._remove_work_dirs, evicted)
+        return len(evicted)
+
+    def _remove_work_dirs(self, pipeline_ids: List[str]):
+        for pipeline_id in pipeline_ids:
+            shutil.rmtree(self.work_dir / pipeline_id, ignore_errors=True)
+
+    def health_check(self) -> Dict:
+        """Vérification santé du pipeline"""
+        return {"status": "healthy", "work_dir": str(self.work_dir)}
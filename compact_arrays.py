@@ -0,0 +1,198 @@
+# ===== COMPACT_ARRAYS.PY =====
+"""Encodage compact des séries d'analyse audio (beats, onsets, segments).
+
+Conteneur binaire « jaza/1 », petit-boutiste :
+    en-tête : b"JAZA", version (u8 = 1), nombre de champs (u16), taille des métadonnées (u32),
+              métadonnées JSON UTF-8 (valeurs scalaires, marqueurs, timeline...)
+    champ   : longueur du nom (u8), nom UTF-8, type (u8), nombre de valeurs (u32),
+              taille des données en octets (u32), données
+Types de champ :
+    1 float32  valeurs telles quelles (secondes, énergies)
+    2 delta16  int16 : écart en millisecondes avec la valeur précédente (la première part de 0) ;
+               la valeur -32768 introduit une valeur absolue en ms sur deux int16 (uint32)
+    3 float16  énergies en demi-précision
+    4 idelta16 entiers (indices de trames) en écarts int16, même échappement que delta16
+    5 int32    entiers tels quels
+Champs : beats (indices de trames : idelta16 ou int32), onset_times, segments.start,
+segments.end (delta16 ou float32), segments.energy (float16 ou float32).
+En JSON, le conteneur est transmis en base64 (champ "packed", "schema": "jaza/1").
+"""
+import json
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+MAGIC = b"JAZA"
+VERSION = 1
+SCHEMA = "jaza/1"
+ENCODINGS = ("float32", "delta16")
+
+FLOAT32, DELTA16, FLOAT16, IDELTA16, INT32 = 1, 2, 3, 4, 5
+ESCAPE = -32768
+# Séries de l'analyse (clé, type entier ?) ; le reste de l'analyse va dans les métadonnées
+SERIES_KEYS = (("beats", True), ("onset_times", False))
+
+
+def thin(values: Sequence[float], min_interval: float) -> List[float]:
+    """Valeurs espacées d'au moins min_interval (les plus proches de la précédente sont retirées)"""
+    kept: List[float] = []
+    for value in values:
+        if not kept or value - kept[-1] >= min_interval:
+            kept.append(value)
+    return kept
+
+
+def decimate(values: Sequence, max_points: int) -> List:
+    """Au plus max_points valeurs, prélevées à pas régulier (première et dernière conservées)"""
+    if max_points <= 0 or len(values) <= max_points:
+        return list(values)
+    if max_points == 1:
+        return [values[0]]
+    step = (len(values) - 1) / (max_points - 1)
+    return [values[round(index * step)] for index in range(max_points)]
+
+
+def merge_segments(segments: Sequence[Dict], max_segments: int) -> List[Dict]:
+    """Regroupement de segments consécutifs (énergie pondérée par la durée)"""
+    if max_segments <= 0 or len(segments) <= max_segments:
+        return list(segments)
+    size = -(-len(segments) // max_segments)
+    merged = []
+    for first in range(0, len(segments), size):
+        group = segments[first:first + size]
+        duration = sum(segment["duration"] for segment in group)
+        merged.append({
+            "start": group[0]["start"],
+            "end": group[-1]["end"],
+            "duration": duration,
+            "energy": (sum(segment.get("energy", 0.0) * segment["duration"] for segment in group) / duration
+                       if duration else group[0].get("energy", 0.0))
+        })
+    return merged
+
+
+def _delta16(integers) -> bytes:
+    import numpy as np
+
+    integers = np.asarray(integers, dtype=np.int64)
+    deltas = np.diff(integers, prepend=0)
+    if deltas.size == 0 or (np.abs(deltas) <= 32767).all():
+        return deltas.astype("<i2").tobytes()
+    # Écarts hors plage (longs silences) : valeur absolue échappée
+    words: List[int] = []
+    for value, delta in zip(integers.tolist(), deltas.tolist()):
+        if -32767 <= delta <= 32767:
+            words.append(delta)
+        else:
+            words.extend((ESCAPE, (value >> 16) & 0xFFFF, value & 0xFFFF))
+    return np.asarray(words, dtype=np.int64).astype("<u2").astype("<i2").tobytes() if words else b""
+
+
+def _undelta16(payload: bytes) -> List[int]:
+    words = struct.unpack(f"<{len(payload) // 2}h", payload)
+    values, current, index = [], 0, 0
+    while index < len(words):
+        if words[index] == ESCAPE:
+            current = ((words[index + 1] & 0xFFFF) << 16) | (words[index + 2] & 0xFFFF)
+            index += 3
+        else:
+            current += words[index]
+            index += 1
+        values.append(current)
+    return values
+
+
+def encode_field(values: Sequence, field_type: int) -> bytes:
+    import numpy as np
+
+    if field_type == FLOAT32:
+        return np.asarray(values, dtype="<f4").tobytes()
+    if field_type == FLOAT16:
+        return np.asarray(values, dtype="<f2").tobytes()
+    if field_type == DELTA16:
+        return _delta16(np.rint(np.asarray(values, dtype=np.float64) * 1000))
+    if field_type == IDELTA16:
+        return _delta16(values)
+    if field_type == INT32:
+        return np.asarray(values, dtype="<i4").tobytes()
+    raise ValueError(f"Type de champ inconnu: {field_type}")
+
+
+def decode_field(payload: bytes, field_type: int) -> List:
+    if field_type == FLOAT32:
+        return list(struct.unpack(f"<{len(payload) // 4}f", payload))
+    if field_type == FLOAT16:
+        return list(struct.unpack(f"<{len(payload) // 2}e", payload))
+    if field_type == DELTA16:
+        return [value / 1000 for value in _undelta16(payload)]
+    if field_type == IDELTA16:
+        return _undelta16(payload)
+    if field_type == INT32:
+        return list(struct.unpack(f"<{len(payload) // 4}i", payload))
+    raise ValueError(f"Type de champ inconnu: {field_type}")
+
+
+def pack_analysis(analysis: Dict, encoding: str = "delta16", max_points: Optional[int] = None,
+                  min_interval: Optional[float] = None, max_segments: Optional[int] = None,
+                  meta: Optional[Dict] = None) -> bytes:
+    """Conteneur jaza/1 d'une analyse : séries encodées, autres clés dans les métadonnées.
+
+    min_interval (s) espace les onsets, max_points borne chaque série, max_segments
+    (max_points par défaut) regroupe les segments."""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Encodage inconnu: {encoding} (attendu: {', '.join(ENCODINGS)})")
+    seconds_type, integer_type = (FLOAT32, INT32) if encoding == "float32" else (DELTA16, IDELTA16)
+    fields: List[Tuple[str, int, Sequence]] = []
+
+    for key, integer in SERIES_KEYS:
+        values = analysis.get(key)
+        if values is None:
+            continue
+        if min_interval and not integer:
+            values = thin(values, min_interval)
+        if max_points:
+            values = decimate(values, max_points)
+        fields.append((key, integer_type if integer else seconds_type, values))
+
+    segments = analysis.get("segments")
+    if segments is not None:
+        segments = merge_segments(segments, max_segments or max_points or 0)
+        fields.append(("segments.start", seconds_type, [segment["start"] for segment in segments]))
+        fields.append(("segments.end", seconds_type, [segment["end"] for segment in segments]))
+        if any("energy" in segment for segment in segments):
+            fields.append(("segments.energy", FLOAT16 if encoding == "delta16" else FLOAT32,
+                           [segment.get("energy", 0.0) for segment in segments]))
+
+    packed_keys = {key for key, _ in SERIES_KEYS} | {"segments"}
+    metadata = {**{key: value for key, value in analysis.items() if key not in packed_keys}, **(meta or {})}
+    meta_bytes = json.dumps(metadata, separators=(",", ":"), ensure_ascii=False).encode()
+
+    parts = [MAGIC, struct.pack("<BHI", VERSION, len(fields), len(meta_bytes)), meta_bytes]
+    for name, field_type, values in fields:
+        payload = encode_field(values, field_type)
+        encoded_name = name.encode()
+        parts.append(struct.pack("<B", len(encoded_name)) + encoded_name
+                     + struct.pack("<BII", field_type, len(values), len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def unpack(blob: bytes) -> Tuple[Dict, Dict[str, List]]:
+    """Métadonnées et séries décodées d'un conteneur jaza/1 (clients Python, tests)"""
+    if blob[:4] != MAGIC:
+        raise ValueError("Conteneur jaza invalide")
+    version, count, meta_length = struct.unpack_from("<BHI", blob, 4)
+    if version != VERSION:
+        raise ValueError(f"Version jaza non supportée: {version}")
+    position = 11
+    meta = json.loads(blob[position:position + meta_length])
+    position += meta_length
+    arrays = {}
+    for _ in range(count):
+        name_length = blob[position]
+        name = blob[position + 1:position + 1 + name_length].decode()
+        position += 1 + name_length
+        field_type, _, size = struct.unpack_from("<BII", blob, position)
+        position += 9
+        arrays[name] = decode_field(blob[position:position + size], field_type)
+        position += size
+    return meta, arrays
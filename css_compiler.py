@@ -0,0 +1,201 @@
+# ===== CSS_COMPILER.PY =====
+"""Compilateur d'animations CSS : spécifications de keyframes normalisées, blocs @keyframes
+nommés d'après leur contenu (un bloc identique n'est émis qu'une fois, d'une requête ou d'un
+livre à l'autre), sortie minifiée, résultats en cache LRU.
+
+Spécification :
+    {"name": "pulse", "easing": "ease-in-out", "delay": 0, "iteration_count": 1,
+     "direction": "normal", "fill_mode": "both",
+     "keyframes": [{"percentage": 0 | "50%" | "from" | "to", "properties": {"opacity": 0}}]}
+Sortie : @keyframes kf-<empreinte>{0%{opacity:0}100%{opacity:1}}.pulse{animation:kf-<empreinte> 2000ms ease-in-out}
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Sequence, Tuple
+
+from metrics import CACHE_REQUESTS
+
+PROPERTY_PATTERN = re.compile(r"^(--|-?[A-Za-z])[A-Za-z0-9-]*$")
+# Séquences permettant de sortir d'une déclaration ou du bloc <style>, de commenter la suite
+# de la feuille ou de charger une ressource : refusées
+FORBIDDEN_VALUE = re.compile(r"[;{}<>\\]|/\*|\*/|url\(", re.IGNORECASE)
+DEFAULT_EASING = "ease-in-out"
+KEYWORD_OFFSETS = {"from": 0.0, "to": 100.0}
+
+
+class CSSSpecError(ValueError):
+    """Spécification d'animation CSS invalide"""
+
+
+def _number(value: float) -> str:
+    """Nombre CSS le plus court (0.50 -> .5, 100.0 -> 100)"""
+    text = f"{value:.4f}".rstrip("0").rstrip(".")
+    if text.startswith("0."):
+        text = text[1:]
+    elif text.startswith("-0."):
+        text = "-" + text[2:]
+    return text or "0"
+
+
+def _value(value) -> str:
+    if isinstance(value, bool):
+        raise CSSSpecError(f"Valeur CSS invalide: {value!r}")
+    if isinstance(value, (int, float)):
+        return _number(float(value))
+    text = " ".join(str(value).split())
+    if not text or FORBIDDEN_VALUE.search(text) or not _quotes_balanced(text):
+        raise CSSSpecError(f"Valeur CSS invalide: {value!r}")
+    if '"' not in text and "'" not in text:
+        text = re.sub(r"\s*,\s*", ",", text)
+    return text
+
+
+def _quotes_balanced(text: str) -> bool:
+    """Chaînes CSS toutes refermées (une chaîne ouverte absorberait la suite de la feuille)"""
+    quote = None
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+    return quote is None
+
+
+def _milliseconds(value, field: str) -> int:
+    if isinstance(value, bool):
+        raise CSSSpecError(f"{field} invalide: {value!r}")
+    try:
+        milliseconds = float(value)
+    except (TypeError, ValueError):
+        raise CSSSpecError(f"{field} invalide: {value!r}")
+    if not math.isfinite(milliseconds) or milliseconds < 0:
+        raise CSSSpecError(f"{field} doit être un nombre positif de millisecondes")
+    return int(milliseconds)
+
+
+def _offset(keyframe: Dict) -> float:
+    raw = keyframe.get("percentage", 0)
+    if isinstance(raw, str):
+        raw = raw.strip().lower()
+        if raw in KEYWORD_OFFSETS:
+            return KEYWORD_OFFSETS[raw]
+        raw = raw.rstrip("%")
+    try:
+        offset = float(raw)
+    except (TypeError, ValueError):
+        raise CSSSpecError(f"Pourcentage de keyframe invalide: {keyframe.get('percentage')!r}")
+    if not 0 <= offset <= 100:
+        raise CSSSpecError(f"Pourcentage hors de [0, 100]: {offset}")
+    return offset
+
+
+def normalize_keyframes(keyframes: Sequence[Dict]) -> Tuple[Tuple[float, Tuple[Tuple[str, str], ...]], ...]:
+    """Keyframes triées par position, propriétés fusionnées (dernière valeur gagnante) et triées"""
+    merged: Dict[float, Dict[str, str]] = {}
+    for keyframe in keyframes:
+        if not isinstance(keyframe, dict):
+            raise CSSSpecError("Keyframe: objet attendu")
+        properties = merged.setdefault(_offset(keyframe), {})
+        for prop, value in (keyframe.get("properties") or {}).items():
+            prop = str(prop).strip()
+            if not PROPERTY_PATTERN.match(prop):
+                raise CSSSpecError(f"Propriété CSS invalide: {prop!r}")
+            properties[prop if prop.startswith("--") else prop.lower()] = _value(value)
+    if not merged:
+        raise CSSSpecError("Au moins une keyframe est requise")
+    return tuple((offset, tuple(sorted(merged[offset].items()))) for offset in sorted(merged))
+
+
+def class_name(name: str) -> str:
+    name = re.sub(r"[^A-Za-z0-9_-]", "-", str(name or "customAnimation"))
+    return name if re.match(r"^-?[A-Za-z_]", name) else f"a-{name}"
+
+
+class CSSAnimationCompiler:
+    """Compilation (minifiée) et mise en cache des animations CSS, unitaires ou par lot"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compile(self, spec: Dict, duration: int = 2000) -> Dict:
+        """Animation compilée : animation_name (classe), keyframes_name, keyframes_css, rule_css"""
+        key = json.dumps([spec, duration], sort_keys=True, separators=(",", ":"), default=str)
+        with self._lock:
+            compiled = self._cache.get(key)
+            if compiled is not None:
+                self._cache.move_to_end(key)
+        CACHE_REQUESTS.labels("css_animation", "hit" if compiled is not None else "miss").inc()
+        if compiled is not None:
+            return compiled
+
+        compiled = self._compile(spec, duration)
+        with self._lock:
+            self._cache[key] = compiled
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return compiled
+
+    def _compile(self, spec: Dict, duration: int) -> Dict:
+        if not isinstance(spec, dict):
+            raise CSSSpecError("Spécification d'animation: objet attendu")
+        keyframes = normalize_keyframes(spec.get("keyframes") or [])
+        body = "".join(
+            f"{_number(offset)}%{{{';'.join(f'{prop}:{value}' for prop, value in properties)}}}"
+            for offset, properties in keyframes
+        )
+        keyframes_name = f"kf-{hashlib.sha256(body.encode()).hexdigest()[:12]}"
+
+        # Valeurs absentes ou nulles : valeurs par défaut
+        duration = _milliseconds(spec["duration"] if spec.get("duration") is not None else duration, "duration")
+        shorthand = [keyframes_name, f"{duration}ms", _value(spec.get("easing") or DEFAULT_EASING)]
+        if spec.get("delay"):
+            shorthand.append(f"{_milliseconds(spec['delay'], 'delay')}ms")
+        for option in ("iteration_count", "direction", "fill_mode"):
+            if spec.get(option) not in (None, ""):
+                shorthand.append(_value(spec[option]))
+        name = class_name(spec.get("name"))
+        return {
+            "animation_name": name,
+            "keyframes_name": keyframes_name,
+            "duration": duration,
+            "keyframes_css": f"@keyframes {keyframes_name}{{{body}}}",
+            "rule_css": f".{name}{{animation:{' '.join(shorthand)}}}"
+        }
+
+    def compile_batch(self, specs: Sequence[Dict], duration: int = 2000, skip_invalid: bool = False) -> Dict:
+        """Feuille de style d'un lot : chaque bloc @keyframes une seule fois, puis les classes.
+        skip_invalid : spécifications invalides écartées (listées dans `invalid`) au lieu d'une erreur"""
+        keyframes: Dict[str, str] = {}
+        rules: Dict[str, None] = {}
+        animations = []
+        invalid = []
+        for index, spec in enumerate(specs):
+            try:
+                compiled = self.compile(spec, duration)
+            except CSSSpecError as e:
+                if not skip_invalid:
+                    raise
+                invalid.append({"index": index, "name": spec.get("name") if isinstance(spec, dict) else None,
+                                "error": str(e)})
+                continue
+            keyframes.setdefault(compiled["keyframes_name"], compiled["keyframes_css"])
+            rules[compiled["rule_css"]] = None
+            animations.append({key: compiled[key] for key in ("animation_name", "keyframes_name", "duration")})
+        return {
+            "css_code": "".join(keyframes.values()) + "".join(rules),
+            "animations": animations,
+            "keyframes": len(keyframes),
+            "invalid": invalid
+        }
+
+
+# Compilateur partagé (animations à la demande et feuilles de style des ePub)
+default_compiler = CSSAnimationCompiler(int(os.getenv("CSS_ANIMATION_CACHE_ENTRIES", 1024)))
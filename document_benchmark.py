@@ -0,0 +1,155 @@
+# ===== DOCUMENT_BENCHMARK.PY =====
+"""Benchmark du modèle de document typé face au contenu brut (List[Dict]).
+
+Compare, pour des livres synthétiques :
+- la mémoire retenue par le contenu (dicts issus de json.loads / Document construit) ;
+- le temps de préparation pour les exports (ePub, mobile, pipeline) : parcours des dicts
+  répétés par chaque export, contre un Document construit une fois puis partagé.
+
+Usage :
+    python document_benchmark.py --sizes 100 1000 5000 --repeat 5 --output run.json
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from document_model import Document, MEDIA_KEYS
+from benchmark_meta import git_commit
+from epub_benchmark import build_request
+
+
+
+def _split_dicts(content: List[Dict]):
+    """Découpage en chapitres sur dicts bruts (refait par chaque export)"""
+    preamble, chapters = [], []
+    for item in content:
+        if item.get("type") == "chapter" or item.get("level") == 1:
+            chapters.append([])
+        (chapters[-1] if chapters else preamble).append(item)
+    return preamble, chapters
+
+
+def prepare_dicts(content: List[Dict]) -> int:
+    """Référence : parcours des dicts tels qu'effectués par chaque export avant le modèle typé
+    (ePub : découpage puis copie de chaque élément ; mobile : découpage et médias ;
+    pipeline : découpage à la construction du graphe puis à l'assemblage)"""
+    touched = 0
+    _, chapters = _split_dicts(content)
+    for chapter in chapters:
+        for item in chapter:
+            item = dict(item)
+            touched += item.get("type") in ("audio", "animation", "image")
+    _, chapters = _split_dicts(content)
+    for chapter in chapters:
+        for item in chapter:
+            touched += sum(isinstance(item.get(key), str) for key in MEDIA_KEYS)
+    for _ in range(2):
+        _, chapters = _split_dicts(content)
+        touched += sum(1 for chapter in chapters for item in chapter
+                       if item.get("type") == "animation" and item.get("animation_id"))
+    return touched
+
+
+def prepare_document(content: List[Dict]) -> int:
+    """Document construit (et validé) une fois, chapitres et index partagés par les exports"""
+    document = Document.parse(content)
+    touched = 0
+    for chapter in document.chapters:
+        items = list(chapter.items)
+        touched += len(items)
+    touched += len(document.media_paths())
+    touched += len(document.items_of_type("animation"))
+    return touched
+
+
+def retained_bytes(payload: bytes, build) -> int:
+    """Octets alloués encore vivants après construction (objets intermédiaires libérés)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build(payload)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def _median_time(function, content: List[Dict], repeat: int) -> float:
+    """Médiane des durées, ramasse-miettes suspendu pendant les mesures (comme timeit)"""
+    timings = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function(content)
+            timings.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return sorted(timings)[len(timings) // 2]
+
+
+def run_case(chapters: int, repeat: int) -> Dict:
+    # Variante « media » sans fichiers réels : seuls les chemins comptent ici
+    media = {"audio": [f"media/narration_{i}.mp3" for i in range(10)],
+             "images": [f"media/illustration_{i}.png" for i in range(10)]}
+    payload = json.dumps(build_request(chapters, "media", media)).encode()
+
+    dict_bytes = retained_bytes(payload, lambda data: json.loads(data)["content"])
+    document_bytes = retained_bytes(payload, lambda data: Document.parse(json.loads(data)["content"]))
+    # Décodage JSON commun aux deux approches : exclu des durées
+    content = json.loads(payload)["content"]
+    dict_s = _median_time(prepare_dicts, content, repeat)
+    document_s = _median_time(prepare_document, content, repeat)
+
+    return {
+        "chapters": chapters,
+        "items": len(content),
+        "payload_bytes": len(payload),
+        "retained_bytes": {"dicts": dict_bytes, "document": document_bytes},
+        "prepare_s": {"dicts": round(dict_s, 6), "document": round(document_s, 6)}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du modèle de document")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="fichier JSON de résultats (stdout par défaut)")
+    args = parser.parse_args()
+
+    results = []
+    for chapters in args.sizes:
+        result = run_case(chapters, args.repeat)
+        results.append(result)
+        memory, timing = result["retained_bytes"], result["prepare_s"]
+        print(f"{chapters:>6} chapitres: mémoire {memory['dicts'] // 1024} → {memory['document'] // 1024} Kio, "
+              f"préparation {timing['dicts']:.4f} → {timing['document']:.4f} s", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat
+        },
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
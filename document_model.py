@@ -0,0 +1,236 @@
+# ===== DOCUMENT_MODEL.PY =====
+"""Modèle de document typé et immuable : le contenu d'une requête (List[Dict]) est validé
+une seule fois puis partagé par les exports (ePub, mobile, pipeline livre narré)"""
+import sys
+from bisect import bisect_right
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Chemins de médias locaux (ou références "asset:<id>" avant résolution)
+MEDIA_KEYS = ("audio_path", "image_path", "lottie_path")
+# Champs typés ; toute autre clé est conservée telle quelle dans `attrs`
+ITEM_FIELDS = ("type", "level", "title", "html", "text", "animation_id") + MEDIA_KEYS + ("sync",)
+# Valeurs très répétées d'un élément à l'autre : une seule copie en mémoire
+INTERNED_ATTRS = ("media_type", "interactive_type")
+
+# Position de chaque champ dans le tuple (attrs en dernier) et contrôles par position
+FIELD_INDEX = {name: index for index, name in enumerate(ITEM_FIELDS)}
+ATTRS_INDEX = len(ITEM_FIELDS)
+LEVEL_INDEX = FIELD_INDEX["level"]
+ANIMATION_ID_INDEX = FIELD_INDEX["animation_id"]
+STRING_INDEXES = frozenset(FIELD_INDEX[name] for name in ("type", "title", "html", "text", "animation_id") + MEDIA_KEYS)
+INTERNED_INDEXES = frozenset(FIELD_INDEX[name] for name in ("type", "animation_id") + MEDIA_KEYS)
+MEDIA_INDEXES = tuple(FIELD_INDEX[name] for name in MEDIA_KEYS)
+# Type absent ou null : None (distinct de "text", comme pour les éléments bruts)
+EMPTY_VALUES = (None,) * len(ITEM_FIELDS) + ((),)
+
+
+class DocumentError(ValueError):
+    """Contenu de document invalide"""
+
+
+intern = sys.intern
+
+
+def _intern(value):
+    return intern(value) if value.__class__ is str else value
+
+
+class ContentItem(tuple):
+    """Élément de contenu (titre, texte, animation, audio, image...). Tuple à champs nommés :
+    immuable, sans __dict__ ; les modifications passent par replace(), qui renvoie une copie."""
+
+    __slots__ = ()
+
+    def __new__(cls, type: Optional[str] = None, level: Optional[int] = None, title: Optional[str] = None,
+                html: Optional[str] = None, text: Optional[str] = None, animation_id: Optional[str] = None,
+                audio_path: Optional[str] = None, image_path: Optional[str] = None,
+                lottie_path: Optional[str] = None, sync: Optional[Dict] = None,
+                attrs: Tuple[Tuple[str, Any], ...] = ()):
+        return tuple.__new__(cls, (
+            _intern(type), level, title, html, text, _intern(animation_id),
+            _intern(audio_path), _intern(image_path), _intern(lottie_path), sync, attrs
+        ))
+
+    @classmethod
+    def from_dict(cls, data: Dict, position: int = 0) -> "ContentItem":
+        """Validation et conversion d'un élément brut (position : pour les messages d'erreur)"""
+        if not isinstance(data, dict):
+            raise DocumentError(f"Élément {position}: objet attendu")
+        # Un seul passage sur les clés présentes (en général deux ou trois par élément)
+        values = list(EMPTY_VALUES)
+        attrs = None
+        for key, value in data.items():
+            index = FIELD_INDEX.get(key)
+            if index is None:
+                if attrs is None:
+                    attrs = []
+                attrs.append((key, intern(value) if key in INTERNED_ATTRS and value.__class__ is str else value))
+                continue
+            if value is None:
+                continue
+            if index in STRING_INDEXES:
+                if value.__class__ is not str:
+                    if index != ANIMATION_ID_INDEX or value.__class__ is not int:
+                        raise DocumentError(f"Élément {position}: {key} doit être une chaîne")
+                    value = str(value)
+                if index in INTERNED_INDEXES:
+                    value = intern(value)
+            elif index == LEVEL_INDEX:
+                if value.__class__ is not int:
+                    # 1.0 (JSON produit par certains clients) : accepté comme 1
+                    if value.__class__ is not float or not value.is_integer():
+                        raise DocumentError(f"Élément {position}: level doit être un entier")
+                    value = int(value)
+            elif not isinstance(value, dict):
+                raise DocumentError(f"Élément {position}: {key} doit être un objet")
+            values[index] = value
+        if attrs is not None:
+            values[ATTRS_INDEX] = tuple(attrs)
+        return tuple.__new__(cls, values)
+
+    def __getattr__(self, name):
+        # Clés libres (alt, media_type...) : accessibles comme attributs (gabarits jinja2)
+        for key, value in tuple.__getitem__(self, ATTRS_INDEX):
+            if key == name:
+                return value
+        raise AttributeError(name)
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    def __repr__(self):
+        return f"ContentItem({self.to_dict()!r})"
+
+    @property
+    def is_heading(self) -> bool:
+        """Début de chapitre"""
+        return self.type == "chapter" or self.level == 1
+
+    def get(self, key: str, default=None):
+        """Accès façon dict (code écrit pour les éléments bruts) : champs puis clés libres,
+        jamais les méthodes de tuple (count, index)"""
+        index = FIELD_INDEX.get(key)
+        if index is not None:
+            value = tuple.__getitem__(self, index)
+        else:
+            value = None
+            for name, attr in tuple.__getitem__(self, ATTRS_INDEX):
+                if name == key:
+                    value = attr
+                    break
+        return default if value is None else value
+
+    def replace(self, **changes) -> "ContentItem":
+        return ContentItem.from_dict({**self.to_dict(), **changes})
+
+    def to_dict(self) -> Dict:
+        data = {key: getattr(self, key) for key in ITEM_FIELDS if getattr(self, key) is not None}
+        data.update(self.attrs)
+        return data
+
+
+# Accès aux champs par nom (descripteurs en C, comme pour collections.namedtuple)
+for _index, _name in enumerate(ITEM_FIELDS + ("attrs",)):
+    setattr(ContentItem, _name, property(itemgetter(_index), doc=_name))
+
+
+class Chapter:
+    """Chapitre : titre et tranche d'éléments (le titre est le premier élément)"""
+
+    __slots__ = ("id", "index", "title", "start", "items")
+
+    def __init__(self, index: int, start: int, items: Tuple[ContentItem, ...]):
+        setter = object.__setattr__
+        heading = items[0]
+        setter(self, "id", f"chapter_{index + 1}")
+        setter(self, "index", index)
+        setter(self, "title", heading.title if heading.title is not None else f"Chapitre {index + 1}")
+        setter(self, "start", start)
+        setter(self, "items", items)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Chapter est immuable")
+
+    def items_of_type(self, item_type: str) -> Tuple[ContentItem, ...]:
+        return tuple(item for item in self.items if item.type == item_type)
+
+
+class Document:
+    """Éléments, chapitres et index (par type, par animation), construits une fois"""
+
+    __slots__ = ("items", "preamble", "chapters", "animations",
+                 "_by_type", "_by_animation", "_chapter_starts")
+
+    def __init__(self, items: Sequence[ContentItem], animations: Optional[Sequence[Dict]] = None):
+        setter = object.__setattr__
+        items = tuple(items)
+        setter(self, "items", items)
+
+        # Découpage : contenu précédant le premier titre, puis un chapitre par titre
+        starts = [position for position, item in enumerate(items)
+                  if item[0] == "chapter" or item[LEVEL_INDEX] == 1]
+        bounds = starts + [len(items)]
+        setter(self, "preamble", items[:starts[0]] if starts else items)
+        setter(self, "chapters", tuple(
+            Chapter(index, start, items[start:bounds[index + 1]]) for index, start in enumerate(starts)
+        ))
+        setter(self, "_chapter_starts", tuple(starts))
+
+        by_type: Dict[str, List[ContentItem]] = {}
+        for item in items:
+            group = by_type.get(item[0])
+            if group is None:
+                group = by_type[item[0]] = []
+            group.append(item)
+        setter(self, "_by_type", {item_type: tuple(group) for item_type, group in by_type.items()})
+
+        animations = tuple(animations or ())
+        setter(self, "animations", animations)
+        setter(self, "_by_animation", {
+            str(animation["id"]): animation for animation in animations
+            if isinstance(animation, dict) and animation.get("id") is not None
+        })
+
+    @classmethod
+    def parse(cls, content: Sequence[Dict], animations: Optional[Sequence[Dict]] = None) -> "Document":
+        """Construction depuis le contenu brut d'une requête (DocumentError si invalide)"""
+        if isinstance(content, Document):
+            return content
+        if not isinstance(content, (list, tuple)):
+            raise DocumentError("content doit être une liste")
+        return cls([ContentItem.from_dict(item, position) for position, item in enumerate(content)], animations)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Document est immuable")
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[ContentItem]:
+        return iter(self.items)
+
+    def items_of_type(self, item_type: str) -> Tuple[ContentItem, ...]:
+        return self._by_type.get(item_type, ())
+
+    def animation(self, animation_id) -> Optional[Dict]:
+        """Spécification d'une animation par son ID"""
+        return self._by_animation.get(str(animation_id))
+
+    def chapter_at(self, position: int) -> Optional[Chapter]:
+        """Chapitre contenant l'élément à cette position (None dans le préambule)"""
+        index = bisect_right(self._chapter_starts, position) - 1
+        return self.chapters[index] if index >= 0 else None
+
+    def media_paths(self) -> Tuple[str, ...]:
+        """Chemins de médias référencés, sans doublon, dans l'ordre du document"""
+        paths = {}
+        for item in self.items:
+            for index in MEDIA_INDEXES:
+                if item[index]:
+                    paths[item[index]] = None
+        return tuple(paths)
+
+    def to_content(self) -> List[Dict]:
+        """Contenu brut équivalent (files de jobs JSON, empreintes)"""
+        return [item.to_dict() for item in self.items]
@@ -0,0 +1,323 @@
+# ===== EPUB_BENCHMARK.PY =====
+"""Benchmark du pipeline EPubGenerator.generate_async sur des livres synthétiques.
+
+Chaque cas s'exécute dans un sous-processus neuf : le pic de RSS d'un cas n'hérite pas des
+cas précédents. Par étape, le RSS courant (/proc/self/statm) est relevé au début et à la fin,
+et son pic échantillonné en tâche de fond pendant l'étape.
+
+Usage :
+    python epub_benchmark.py --sizes 10 100 1000 --variants plain css media --output run.json
+    python epub_benchmark.py --compare baseline.json run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmark_meta import git_commit
+from epub_generator import EPubGenerator
+
+VARIANTS = ("plain", "css", "media")
+PARAGRAPHS_PER_CHAPTER = 8
+MEDIA_FILES = 10
+MEDIA_FILE_SIZE = 1024 * 1024
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def current_rss_kb() -> Optional[int]:
+    """RSS courant du processus (/proc/self/statm, Linux) ; None ailleurs"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _peak_rss_kb() -> int:
+    """Pic de RSS du processus depuis son démarrage (ru_maxrss est en octets sous macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class RSSSampler(threading.Thread):
+    """Relevé du RSS courant en tâche de fond ; lap() rend le pic depuis l'appel précédent"""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss_kb()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> Optional[int]:
+        rss = current_rss_kb()
+        with self._lock:
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+        return rss
+
+    def lap(self) -> Optional[int]:
+        rss = self._sample()
+        with self._lock:
+            peak, self.peak = self.peak, rss
+        return peak
+
+    def stop(self):
+        self._stop.set()
+
+
+class ProfiledEPubGenerator(EPubGenerator):
+    """EPubGenerator qui relève RSS (début, fin, pic échantillonné) et allocations Python par étape"""
+
+    def __init__(self, output_dir: Path, trace_allocations: bool = False):
+        super().__init__()
+        self.output_dir = output_dir
+        self.trace_allocations = trace_allocations
+        self.stage_stats: Dict[str, Dict] = {}
+        self.sampler = RSSSampler()
+        self._stage_start_rss: Optional[int] = None
+
+    def _update_progress(self, task_id: str, progress: float, stage: str, **details):
+        stage_changed = self.tasks[task_id].get("stage") != stage
+        super()._update_progress(task_id, progress, stage, **details)
+        if stage_changed:
+            # Étape précédente close par super() : compteurs remis à zéro pour la nouvelle
+            self.sampler.lap()
+            self._stage_start_rss = current_rss_kb()
+            if self.trace_allocations:
+                tracemalloc.reset_peak()
+
+    def _end_stage(self, task_id: str):
+        stage = self.tasks[task_id].get("stage")
+        super()._end_stage(task_id)
+        if not stage:
+            return
+
+        stats = {
+            "wall_s": self.tasks[task_id]["timings"][stage],
+            "rss_start_kb": self._stage_start_rss,
+            "rss_end_kb": current_rss_kb(),
+            "peak_rss_kb": self.sampler.lap()
+        }
+        if self.trace_allocations:
+            stats["py_alloc_peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+        self.stage_stats[stage] = stats
+
+
+def media_paths(media_dir: Path) -> Dict[str, List[str]]:
+    """Chemins des fichiers audio et images factices des cas « media »"""
+    return {
+        "audio": [str(media_dir / f"narration_{index}.mp3") for index in range(MEDIA_FILES)],
+        "images": [str(media_dir / f"illustration_{index}.png") for index in range(MEDIA_FILES)]
+    }
+
+
+def build_media_files(media_dir: Path) -> Dict[str, List[str]]:
+    """Fichiers audio et images factices partagés par les cas « media »"""
+    media_dir.mkdir(parents=True, exist_ok=True)
+    media = media_paths(media_dir)
+    for audio_path, image_path in zip(media["audio"], media["images"]):
+        Path(audio_path).write_bytes(os.urandom(MEDIA_FILE_SIZE))
+        Path(image_path).write_bytes(os.urandom(MEDIA_FILE_SIZE // 4))
+    return media
+
+
+def build_request(chapters: int, variant: str, media: Optional[Dict[str, List[str]]] = None) -> Dict:
+    """Charge utile EPubRequest synthétique"""
+    content = []
+    animations = []
+
+    for chapter in range(1, chapters + 1):
+        content.append({"type": "chapter", "level": 1, "title": f"Chapitre {chapter}"})
+        for paragraph in range(PARAGRAPHS_PER_CHAPTER):
+            content.append({
+                "type": "text",
+                "html": f"<p>Paragraphe {paragraph} du chapitre {chapter}. " + "Lorem ipsum dolor sit amet. " * 20 + "</p>"
+            })
+
+        if variant == "css":
+            animation_id = f"anim_{chapter}"
+            content.append({"type": "animation", "animation_id": animation_id})
+            animations.append({
+                "id": animation_id,
+                "type": "css",
+                "name": animation_id,
+                "css_code": (
+                    f"@keyframes {animation_id} {{ 0% {{ opacity: 0; }} 100% {{ opacity: 1; }} }}\n"
+                    f".{animation_id} {{ animation: {animation_id} 2000ms ease-in-out; }}\n"
+                )
+            })
+        elif variant == "media":
+            animation_id = f"anim_{chapter}"
+            content.append({"type": "animation", "animation_id": animation_id})
+            content.append({"type": "image", "image_path": media["images"][chapter % MEDIA_FILES]})
+            content.append({
+                "type": "audio",
+                "audio_path": media["audio"][chapter % MEDIA_FILES],
+                "sync": {
+                    "markers": [{"time": 0.5 * marker, "animation_id": animation_id, "trigger": "start"}
+                                for marker in range(4)],
+                    "sync_data": {"duration": 2.5}
+                }
+            })
+            animations.append({
+                "id": animation_id,
+                "lottie_data": {"v": "5.7.4", "fr": 30, "ip": 0, "op": 90, "w": 1920, "h": 1080, "layers": []}
+            })
+
+    return {
+        "title": f"Benchmark {chapters} chapitres ({variant})",
+        "author": "Benchmark",
+        "content": content,
+        "animations": animations,
+        "audio_files": media["audio"] if variant == "media" else [],
+        "metadata": {"language": "fr"}
+    }
+
+
+async def run_case(chapters: int, variant: str, work_dir: Path, trace_allocations: bool) -> Dict:
+    """Exécution d'un cas de benchmark (dans le processus courant, voir run_case_subprocess)"""
+    if trace_allocations:
+        tracemalloc.start()
+    # Médias factices hors du stockage d'assets : répertoire autorisé explicitement
+    os.environ["MEDIA_ROOTS"] = str(work_dir / "media")
+    media = media_paths(work_dir / "media") if variant == "media" else None
+    request = build_request(chapters, variant, media)
+    generator = ProfiledEPubGenerator(work_dir / "out", trace_allocations)
+    generator.output_dir.mkdir(parents=True, exist_ok=True)
+    task_id = f"bench_{chapters}_{variant}"
+
+    generator.sampler.start()
+    started = time.perf_counter()
+    try:
+        await generator.generate_async(task_id=task_id, **request)
+    finally:
+        generator.sampler.stop()
+    total = time.perf_counter() - started
+
+    task = generator.get_task_status(task_id)
+    if task.get("status") != "completed":
+        raise RuntimeError(f"{task_id}: {task.get('error')}")
+    os.remove(task["file_path"])
+
+    return {
+        "case": f"{chapters}-{variant}",
+        "chapters": chapters,
+        "variant": variant,
+        "total_s": round(total, 6),
+        "file_size": task["file_size"],
+        "peak_rss_kb": _peak_rss_kb(),
+        "stages": generator.stage_stats
+    }
+
+
+def run_case_subprocess(chapters: int, variant: str, work_dir: Path, trace_allocations: bool) -> Dict:
+    """Un cas dans un interpréteur neuf (mesures mémoire indépendantes des cas précédents)"""
+    command = [sys.executable, os.path.abspath(__file__), "--case", str(chapters), variant,
+               "--work-dir", str(work_dir)]
+    if trace_allocations:
+        command.append("--trace-allocations")
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Cas {chapters}-{variant} en échec:\n{completed.stderr}")
+    return json.loads(completed.stdout)
+
+
+def run_benchmark(sizes: List[int], variants: List[str], repeat: int, trace_allocations: bool) -> Dict:
+    """Exécution de tous les cas, mesures répétées, chaque exécution dans son sous-processus"""
+    results = []
+    with tempfile.TemporaryDirectory(prefix="epub_bench_") as tmp:
+        work_dir = Path(tmp)
+        if "media" in variants:
+            build_media_files(work_dir / "media")
+        for chapters in sizes:
+            for variant in variants:
+                for run in range(repeat):
+                    result = run_case_subprocess(chapters, variant, work_dir, trace_allocations)
+                    result["run"] = run
+                    results.append(result)
+                    print(f"{result['case']:>14} run {run}: {result['total_s']:.3f}s", file=sys.stderr)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "trace_allocations": trace_allocations
+        },
+        "results": results
+    }
+
+
+def compare(baseline_path: str, current_path: str):
+    """Comparaison de deux exécutions (médiane des temps par cas et par étape)"""
+    def medians(path: str) -> Dict[str, Dict[str, float]]:
+        runs: Dict[str, Dict[str, List[float]]] = {}
+        for result in json.loads(Path(path).read_text())["results"]:
+            case = runs.setdefault(result["case"], {"total": []})
+            case["total"].append(result["total_s"])
+            for stage, stats in result["stages"].items():
+                case.setdefault(stage, []).append(stats["wall_s"])
+        return {case: {name: sorted(values)[len(values) // 2] for name, values in timings.items()}
+                for case, timings in runs.items()}
+
+    baseline, current = medians(baseline_path), medians(current_path)
+    print(f"{'cas':>14} {'étape':>10} {'avant (s)':>10} {'après (s)':>10} {'ratio':>7}")
+    for case in sorted(set(baseline) & set(current)):
+        for name in sorted(set(baseline[case]) & set(current[case])):
+            before, after = baseline[case][name], current[case][name]
+            ratio = after / before if before else float("inf")
+            print(f"{case:>14} {name:>10} {before:>10.4f} {after:>10.4f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de génération ePub")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--trace-allocations", action="store_true",
+                        help="pic d'allocations Python par étape (tracemalloc, ralentit les mesures)")
+    parser.add_argument("--output", help="fichier JSON de résultats (stdout par défaut)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"))
+    # Usage interne : un seul cas, résultat JSON sur stdout (voir run_case_subprocess)
+    parser.add_argument("--case", nargs=2, metavar=("CHAPTERS", "VARIANT"), help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.case:
+        chapters, variant = int(args.case[0]), args.case[1]
+        result = asyncio.run(run_case(chapters, variant, Path(args.work_dir), args.trace_allocations))
+        print(json.dumps(result))
+        return
+
+    report = run_benchmark(args.sizes, args.variants, args.repeat, args.trace_allocations)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# ===== FINGERPRINTED_TASKS.PY =====
+"""Réutilisation des exports par empreinte de requête (adressage par contenu), commune aux
+générateurs ePub et mobile : empreinte, recherche d'une tâche identique, mise en file.
+
+La classe hôte fournit `tasks` et `fingerprints` (dicts ou mappings partagés), `_set_task`
+et `CACHE_NAME` (libellé de CACHE_REQUESTS)."""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from document_model import MEDIA_KEYS
+from metrics import CACHE_REQUESTS
+
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+class FingerprintedTasks:
+    CACHE_NAME = "artifact"
+
+    def request_fingerprint(self, request: Dict) -> str:
+        """Empreinte normalisée d'une requête ; les fichiers locaux référencés y participent
+        via leur taille et leur date de modification"""
+        files = {}
+        for path in self._fingerprint_paths(request):
+            if isinstance(path, str) and path not in files and os.path.isfile(path):
+                stat = os.stat(path)
+                files[path] = [stat.st_size, stat.st_mtime_ns]
+        normalized = json.dumps(
+            {"request": request, "files": files, **self._fingerprint_salt()},
+            sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def _fingerprint_paths(self, request: Dict) -> Iterable[Optional[str]]:
+        """Chemins de médias référencés par la requête"""
+        for item in request.get("content", []):
+            for key in MEDIA_KEYS:
+                yield item.get(key)
+        yield from request.get("audio_files", [])
+
+    def _fingerprint_salt(self) -> Dict:
+        """Champs supplémentaires de l'empreinte (version de gabarit...)"""
+        return {}
+
+    def find_task_by_fingerprint(self, fingerprint: str) -> Optional[str]:
+        """Tâche identique terminée (fichier présent) ou en cours"""
+        task_id = self.fingerprints.get(fingerprint)
+        if task_id:
+            task = self.get_task_status(task_id)
+            if task.get("status") in ("queued", "processing") or (
+                    task.get("status") == "completed" and os.path.exists(task.get("file_path", ""))):
+                CACHE_REQUESTS.labels(self.CACHE_NAME, "hit").inc()
+                return task_id
+            self._release_fingerprint(fingerprint, task_id)
+
+        CACHE_REQUESTS.labels(self.CACHE_NAME, "miss").inc()
+        return None
+
+    def mark_queued(self, task_id: str, fingerprint: Optional[str] = None):
+        """Enregistrement d'une tâche acceptée (avant sa prise en charge, file partagée ou
+        tâche de fond) : une requête identique arrivant entre-temps la réutilise"""
+        self._set_task(task_id, {"status": "queued", "progress": 0, "created_at": time.time()})
+        if fingerprint:
+            self.fingerprints[fingerprint] = task_id
+
+    def backlog(self) -> int:
+        """Nombre de générations en attente ou en cours (parcours des tâches)"""
+        return sum(task.get("status") in ("queued", "processing") for task in list(self.tasks.values()))
+
+    def get_task_status(self, task_id: str) -> Dict:
+        """Statut d'une tâche de génération"""
+        return self.tasks.get(task_id, {"status": "not_found"})
+
+    def _release_fingerprint(self, fingerprint: Optional[str], task_id: str):
+        """Oubli d'une empreinte, seulement si elle désigne encore cette tâche (une requête
+        identique plus récente a pu la réattribuer)"""
+        if fingerprint and self.fingerprints.get(fingerprint) == task_id:
+            self.fingerprints.pop(fingerprint, None)
+
+    def _file_digest(self, path: Path) -> str:
+        """SHA-256 d'un fichier, lu par blocs"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as source:
+            for chunk in iter(lambda: source.read(DIGEST_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
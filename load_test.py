@@ -0,0 +1,519 @@
+# ===== LOAD_TEST.PY =====
+"""Tests de charge du service Python (main:app) avec fournisseurs TTS simulés en local.
+
+Les requêtes arrivent selon un processus de Poisson (boucle ouverte : la charge ne ralentit
+pas quand le serveur sature) avec un mélange de scénarios configurable. Le rapport JSON
+(débit, percentiles de latence, erreurs, CPU/RSS du serveur) est comparable entre commits.
+
+Usage :
+    python load_test.py --profile mixed --rate 20 --duration 60 --output run.json
+    python load_test.py --mix tts_interactive=80,sync=20 --rate 5 --workers 2
+    python load_test.py --profile mixed --isolate          # une phase par scénario
+    python load_test.py --target http://127.0.0.1:8001     # serveur déjà démarré
+    python load_test.py --compare baseline.json run.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from benchmark_meta import git_commit
+
+# Mélanges prédéfinis (poids relatifs par scénario)
+PROFILES = {
+    "interactive": {"tts_interactive": 90, "analyze": 10},
+    "mixed": {"tts_interactive": 60, "tts_batch": 10, "sync": 20, "epub_export": 10},
+    "export_heavy": {"tts_interactive": 30, "sync": 20, "epub_export": 50},
+}
+
+SAMPLE_TEXT = ("Il était une fois, au cœur de la jungle d'Azthar, un temple oublié que seuls "
+               "les oiseaux savaient encore trouver. ")
+
+
+# ===== FOURNISSEURS SIMULÉS =====
+class StubProviders:
+    """Serveur local imitant ElevenLabs et OpenAI TTS : latence fixe + par caractère,
+    taux d'erreurs 5xx et de 429 configurables"""
+
+    def __init__(self, base_latency: float, per_char_latency: float, error_rate: float,
+                 throttle_rate: float, seed: int):
+        self.base_latency = base_latency
+        self.per_char_latency = per_char_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/audio/speech", self.openai_speech)
+        app.router.add_post("/v1/text-to-speech/{voice_id}", self.elevenlabs_speech)
+        app.router.add_get("/v1/models", self.ok)
+        app.router.add_get("/v1/user", self.ok)
+        app.router.add_get("/cognitiveservices/voices/list", self.ok)
+        return app
+
+    async def ok(self, request: web.Request) -> web.Response:
+        return web.json_response({"data": []})
+
+    async def _synthesize(self, text: str) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.base_latency + self.per_char_latency * len(text))
+        draw = self.random.random()
+        if draw < self.error_rate:
+            return web.Response(status=500)
+        if draw < self.error_rate + self.throttle_rate:
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        # ~1 Ko de « MP3 » par seconde de parole estimée (15 caractères/s)
+        return web.Response(body=os.urandom(max(1024, len(text) * 70)), content_type="audio/mpeg")
+
+    async def openai_speech(self, request: web.Request) -> web.Response:
+        return await self._synthesize((await request.json()).get("input", ""))
+
+    async def elevenlabs_speech(self, request: web.Request) -> web.Response:
+        return await self._synthesize((await request.json()).get("text", ""))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def click_track_wav(seconds: float = 10.0, sr: int = 22050, bpm: int = 120) -> bytes:
+    """Piste de clics (WAV PCM 16 bits) servant d'audio aux scénarios sync/analyze"""
+    frames = bytearray()
+    period = int(sr * 60 / bpm)
+    for n in range(int(seconds * sr)):
+        phase = n % period
+        sample = int(20000 * math.sin(2 * math.pi * 880 * n / sr)) if phase < sr // 50 else 0
+        frames += sample.to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sr)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+# ===== SCÉNARIOS =====
+class Scenarios:
+    """Une coroutine par scénario ; renvoie le statut HTTP (ou lève en cas d'erreur réseau)"""
+
+    def __init__(self, session: aiohttp.ClientSession, base_url: str, epub_timeout: float):
+        self.session = session
+        self.base_url = base_url
+        self.epub_timeout = epub_timeout
+        self.asset_id: Optional[str] = None
+        self.counter = 0
+        # Durées de bout en bout des exports (soumission -> ePub terminé)
+        self.completions: List[float] = []
+        self.pending_exports = set()
+
+    async def setup(self):
+        """Envoi unique de l'audio de test (référencé ensuite par asset_id)"""
+        form = aiohttp.FormData()
+        form.add_field("file", click_track_wav(), filename="click.wav", content_type="audio/wav")
+        async with self.session.post(f"{self.base_url}/api/assets", data=form) as response:
+            response.raise_for_status()
+            self.asset_id = (await response.json())["asset_id"]
+
+    def registry(self) -> Dict[str, Callable]:
+        return {
+            "tts_interactive": self.tts_interactive,
+            "tts_batch": self.tts_batch,
+            "sync": self.sync,
+            "analyze": self.analyze,
+            "epub_export": self.epub_export,
+        }
+
+    async def _post(self, path: str, **kwargs) -> int:
+        async with self.session.post(f"{self.base_url}{path}", **kwargs) as response:
+            await response.read()
+            return response.status
+
+    async def tts_interactive(self) -> int:
+        return await self._post("/api/tts/synthesize", json={"text": SAMPLE_TEXT, "quality": "standard"})
+
+    async def tts_batch(self) -> int:
+        return await self._post("/api/tts/batch", json=[SAMPLE_TEXT] * 10)
+
+    async def sync(self) -> int:
+        return await self._post("/api/sync/audio-animation", json={
+            "audio_asset_id": self.asset_id,
+            "animations": [{"id": f"anim_{i}"} for i in range(8)],
+            "timeline": []
+        })
+
+    async def analyze(self) -> int:
+        return await self._post("/api/analyze/audio", data={"asset_id": self.asset_id})
+
+    async def epub_export(self) -> int:
+        """Soumission d'un ePub (contenu unique : pas de réutilisation) puis suivi jusqu'à la fin"""
+        self.counter += 1
+        content = []
+        for chapter in range(5):
+            content.append({"type": "chapter", "title": f"Chapitre {chapter + 1}"})
+            content.extend({"type": "text", "html": f"<p>{SAMPLE_TEXT * 5}</p>"} for _ in range(10))
+        started = time.perf_counter()
+        async with self.session.post(f"{self.base_url}/api/export/epub", json={
+            "title": f"Charge {os.getpid()} {self.counter} {time.time()}",
+            "author": "load_test",
+            "content": content
+        }) as response:
+            body = await response.json(content_type=None)
+            if response.status != 200:
+                return response.status
+        task = asyncio.create_task(self._await_epub(body["task_id"], started))
+        self.pending_exports.add(task)
+        task.add_done_callback(self.pending_exports.discard)
+        return response.status
+
+    async def drain(self):
+        """Attente du suivi des exports soumis pendant la phase"""
+        if self.pending_exports:
+            await asyncio.wait(set(self.pending_exports))
+
+    async def _await_epub(self, task_id: str, started: float):
+        deadline = started + self.epub_timeout
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(0.5)
+            try:
+                async with self.session.get(f"{self.base_url}/api/export/epub/status/{task_id}") as response:
+                    status = (await response.json()).get("status")
+            except aiohttp.ClientError:
+                continue
+            if status in ("completed", "error", "failed"):
+                if status == "completed":
+                    self.completions.append(time.perf_counter() - started)
+                return
+
+
+# ===== RESSOURCES DU SERVEUR =====
+def _process_tree(pid: int) -> List[int]:
+    """pid et descendants (workers uvicorn), via /proc"""
+    pids = [pid]
+    for current in pids:
+        for children in Path(f"/proc/{current}/task").glob("*/children"):
+            try:
+                pids.extend(int(child) for child in children.read_text().split())
+            except OSError:
+                continue
+    return pids
+
+
+def _cpu_and_rss(pids: List[int]) -> Optional[Dict]:
+    cpu_ticks, rss_pages = 0, 0
+    for pid in pids:
+        try:
+            stat = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+            cpu_ticks += int(stat[11]) + int(stat[12])
+            rss_pages += int(Path(f"/proc/{pid}/statm").read_text().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    if not rss_pages:
+        return None
+    return {"cpu_s": cpu_ticks / os.sysconf("SC_CLK_TCK"),
+            "rss_kb": rss_pages * os.sysconf("SC_PAGE_SIZE") // 1024}
+
+
+class ResourceSampler:
+    """Échantillonnage CPU/RSS du serveur pendant une phase (Linux uniquement)"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[Dict] = []
+
+    async def run(self):
+        while self.pid:
+            sample = _cpu_and_rss(_process_tree(self.pid))
+            if sample:
+                self.samples.append(sample)
+            await asyncio.sleep(self.interval)
+
+    def summary(self, wall_s: float, requests: int) -> Optional[Dict]:
+        if len(self.samples) < 2:
+            return None
+        cpu_s = self.samples[-1]["cpu_s"] - self.samples[0]["cpu_s"]
+        return {
+            "cpu_s": round(cpu_s, 3),
+            "cpu_percent": round(100 * cpu_s / wall_s, 1),
+            "cpu_ms_per_request": round(1000 * cpu_s / requests, 2) if requests else None,
+            "peak_rss_kb": max(sample["rss_kb"] for sample in self.samples)
+        }
+
+
+# ===== GÉNÉRATION DE CHARGE =====
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)]
+
+
+def summarize(latencies: List[float], statuses: List[str], wall_s: float) -> Dict:
+    count = len(statuses)
+    ok = sum(status.startswith("2") for status in statuses)
+    return {
+        "requests": count,
+        "throughput_rps": round(ok / wall_s, 3),
+        "error_rate": round(sum(not status.startswith("2") and status != "429" for status in statuses) / count, 4)
+        if count else 0.0,
+        "rejected_rate": round(statuses.count("429") / count, 4) if count else 0.0,
+        "statuses": {status: statuses.count(status) for status in sorted(set(statuses))},
+        "latency_s": {
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies) if latencies else None
+        }
+    }
+
+
+async def run_phase(scenarios: Scenarios, mix: Dict[str, float], rate: float, duration: float,
+                    server_pid: Optional[int], rng: random.Random) -> Dict:
+    """Arrivées de Poisson au débit `rate` pendant `duration` secondes"""
+    registry = scenarios.registry()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    results: Dict[str, Dict[str, List]] = {name: {"latencies": [], "statuses": []} for name in names}
+    in_flight = set()
+    completions_before = len(scenarios.completions)
+
+    async def fire(name: str):
+        started = time.perf_counter()
+        try:
+            status = str(await registry[name]())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = type(e).__name__
+        results[name]["latencies"].append(time.perf_counter() - started)
+        results[name]["statuses"].append(status)
+
+    sampler = ResourceSampler(server_pid)
+    sampler_task = asyncio.create_task(sampler.run())
+    started = time.perf_counter()
+    next_arrival = started
+    while next_arrival < started + duration:
+        await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+        task = asyncio.create_task(fire(rng.choices(names, weights)[0]))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        next_arrival += rng.expovariate(rate)
+    if in_flight:
+        await asyncio.wait(in_flight)
+    wall_s = time.perf_counter() - started
+    await scenarios.drain()
+    sampler_task.cancel()
+
+    routes = {name: summarize(data["latencies"], data["statuses"], wall_s)
+              for name, data in results.items() if data["statuses"]}
+    completions = scenarios.completions[completions_before:]
+    if completions:
+        routes["epub_export:complete"] = {
+            "requests": len(completions),
+            "latency_s": {"p50": percentile(completions, 0.5), "p90": percentile(completions, 0.9),
+                          "p99": percentile(completions, 0.99), "max": max(completions)}
+        }
+    total = sum(len(data["statuses"]) for data in results.values())
+    return {
+        "mix": mix,
+        "rate": rate,
+        "wall_s": round(wall_s, 3),
+        "routes": routes,
+        "resources": sampler.summary(wall_s, total)
+    }
+
+
+# ===== SERVEUR SOUS TEST =====
+def start_server(port: int, stub_url: str, workers: int, env_overrides: Dict[str, str],
+                 store_dir: Optional[str] = None) -> subprocess.Popen:
+    """main:app sous uvicorn, fournisseurs TTS pointant vers les serveurs simulés.
+
+    Plusieurs workers : état partagé (SHARED_STORE_PATH) dans store_dir, sans quoi le suivi
+    d'une tâche interrogé sur un autre worker que celui qui l'a créée renverrait 404."""
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": stub_url,
+        "ELEVENLABS_API_KEY": "stub",
+        "ELEVENLABS_BASE_URL": stub_url,
+        "TTS_PROBE_INTERVAL": "3600",
+        **({"SHARED_STORE_PATH": os.path.join(store_dir, "shared_state.db")} if store_dir else {}),
+        **env_overrides
+    }
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning", "--workers", str(workers)]
+    return subprocess.Popen(command, env=env, cwd=Path(__file__).resolve().parent)
+
+
+async def wait_until_ready(session: aiohttp.ClientSession, base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{base_url}/api/health/ready") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"Serveur non prêt après {timeout}s")
+
+
+async def run_load_test(args) -> Dict:
+    mix = args.mix or PROFILES[args.profile]
+    rng = random.Random(args.seed)
+    stub_runner = server = store_dir = None
+
+    if args.target:
+        base_url = args.target.rstrip("/")
+    else:
+        stubs = StubProviders(args.stub_latency, args.stub_per_char, args.stub_error_rate,
+                              args.stub_throttle_rate, args.seed)
+        stub_runner = web.AppRunner(stubs.app())
+        await stub_runner.setup()
+        stub_port = _free_port()
+        await web.TCPSite(stub_runner, "127.0.0.1", stub_port).start()
+        port = _free_port()
+        if args.workers > 1:
+            store_dir = tempfile.TemporaryDirectory(prefix="load_test_store_")
+        server = start_server(port, f"http://127.0.0.1:{stub_port}", args.workers,
+                              dict(item.split("=", 1) for item in args.server_env),
+                              store_dir.name if store_dir else None)
+        base_url = f"http://127.0.0.1:{port}"
+
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            await wait_until_ready(session, base_url)
+            scenarios = Scenarios(session, base_url, args.epub_timeout)
+            await scenarios.setup()
+            server_pid = server.pid if server else None
+
+            if args.warmup:
+                await run_phase(scenarios, mix, args.rate, args.warmup, None, rng)
+
+            if args.isolate:
+                phases = [await run_phase(scenarios, {name: 1}, args.rate, args.duration, server_pid, rng)
+                          for name in mix]
+            else:
+                phases = [await run_phase(scenarios, mix, args.rate, args.duration, server_pid, rng)]
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+        if stub_runner:
+            await stub_runner.cleanup()
+        if store_dir:
+            store_dir.cleanup()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "target": args.target,
+            "workers": args.workers,
+            "rate": args.rate,
+            "duration": args.duration,
+            "seed": args.seed,
+            "isolate": args.isolate,
+            "stub": {"latency": args.stub_latency, "per_char": args.stub_per_char,
+                     "error_rate": args.stub_error_rate, "throttle_rate": args.stub_throttle_rate}
+        },
+        "phases": phases
+    }
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """"tts_interactive=70,sync=30" -> poids par scénario"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"tts_interactive", "tts_batch", "sync", "analyze", "epub_export"}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Scénarios inconnus: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def compare(baseline_path: str, current_path: str):
+    """Comparaison de deux exécutions (par phase et par route)"""
+    def routes(path: str) -> Dict[str, Dict]:
+        report = json.loads(Path(path).read_text())
+        return {f"{'+'.join(phase['mix'])}/{route}": stats
+                for phase in report["phases"] for route, stats in phase["routes"].items()}
+
+    baseline, current = routes(baseline_path), routes(current_path)
+    print(f"{'route':>40} {'métrique':>10} {'avant':>10} {'après':>10} {'ratio':>7}")
+    for route in sorted(set(baseline) & set(current)):
+        for metric, before, after in (
+            ("p50 (s)", baseline[route]["latency_s"]["p50"], current[route]["latency_s"]["p50"]),
+            ("p99 (s)", baseline[route]["latency_s"]["p99"], current[route]["latency_s"]["p99"]),
+            ("débit", baseline[route].get("throughput_rps"), current[route].get("throughput_rps")),
+            ("erreurs", baseline[route].get("error_rate"), current[route].get("error_rate")),
+        ):
+            if before is None or after is None:
+                continue
+            ratio = after / before if before else float("inf") if after else 1.0
+            print(f"{route:>40} {metric:>10} {before:>10.4f} {after:>10.4f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tests de charge du service Python")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="mixed")
+    parser.add_argument("--mix", type=parse_mix, help="mélange explicite, ex. tts_interactive=70,sync=30")
+    parser.add_argument("--rate", type=float, default=10.0, help="arrivées par seconde (Poisson)")
+    parser.add_argument("--duration", type=float, default=30.0, help="durée de chaque phase (s)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="phase non mesurée (s)")
+    parser.add_argument("--isolate", action="store_true",
+                        help="une phase par scénario (ressources attribuées à chaque route)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="workers uvicorn du serveur lancé (> 1 : état partagé temporaire)")
+    parser.add_argument("--server-env", nargs="*", default=[], metavar="NAME=VALUE",
+                        help="variables d'environnement du serveur lancé")
+    parser.add_argument("--target", help="URL d'un serveur déjà démarré (pas de serveurs simulés)")
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--epub-timeout", type=float, default=120.0)
+    parser.add_argument("--stub-latency", type=float, default=0.2, help="latence fixe du TTS simulé (s)")
+    parser.add_argument("--stub-per-char", type=float, default=0.0005, help="latence par caractère (s)")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="fichier JSON de résultats (stdout par défaut)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = asyncio.run(run_load_test(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
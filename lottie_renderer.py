@@ -0,0 +1,352 @@
+# ===== LOTTIE_RENDERER.PY =====
+"""Aperçus raster des animations Lottie (vignette PNG ou planche de sprites).
+
+Rendu des calques de formes (rectangle, ellipse, remplissage, contour) et de texte tels que
+produits par AnimationService.create_lottie. Les keyframes de chaque propriété sont interpolées
+en une fois pour toutes les images demandées (numpy, easing de Bézier des tangentes i/o).
+Les aperçus sont mis en cache sur disque sous l'empreinte de l'animation et des paramètres :
+une grille d'aperçus est resservie par GET /api/animations/lottie/preview/{id} sans rendu.
+PIL et numpy sont importés au premier rendu.
+"""
+import hashlib
+import json
+import math
+import os
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import STAGE_LATENCY, CACHE_REQUESTS
+
+# À incrémenter à chaque changement du rendu (invalide les aperçus en cache)
+RENDERER_VERSION = "1"
+MAX_PREVIEW_WIDTH = 1024
+MAX_PREVIEW_FRAMES = 64
+ELLIPSE_POINTS = 48
+CORNER_POINTS = 6
+
+
+class LottieRenderError(ValueError):
+    """Animation ou paramètres d'aperçu invalides"""
+
+
+def _unwrap(data: Dict) -> Dict:
+    """Données Lottie, y compris enveloppées dans une réponse de create_lottie ({"lottie_data": ...})"""
+    while isinstance(data, dict) and "layers" not in data and isinstance(data.get("lottie_data"), dict):
+        data = data["lottie_data"]
+    if not isinstance(data, dict) or not isinstance(data.get("layers"), list):
+        raise LottieRenderError("Animation Lottie invalide (layers manquant)")
+    return data
+
+
+def _bezier_ease(progress, out_x, out_y, in_x, in_y):
+    """y(x) de la courbe de Bézier (0,0), (ox,oy), (ix,iy), (1,1), vectorisé (Newton)"""
+    import numpy as np
+
+    u = progress.copy()
+    for _ in range(8):
+        inverse = 1 - u
+        x = 3 * inverse ** 2 * u * out_x + 3 * inverse * u ** 2 * in_x + u ** 3
+        slope = 3 * inverse ** 2 * out_x + 6 * inverse * u * (in_x - out_x) + 3 * u ** 2 * (1 - in_x)
+        u = np.clip(u - np.where(np.abs(slope) > 1e-6, (x - progress) / np.where(slope == 0, 1, slope), 0), 0, 1)
+    inverse = 1 - u
+    return 3 * inverse ** 2 * u * out_y + 3 * inverse * u ** 2 * in_y + u ** 3
+
+
+def _tangent(keyframe: Dict, key: str, default: float) -> Tuple[float, float]:
+    handle = keyframe.get(key) or {}
+    x, y = handle.get("x", default), handle.get("y", default)
+    return float(x[0] if isinstance(x, list) else x), float(y[0] if isinstance(y, list) else y)
+
+
+def property_values(prop: Optional[Dict], frames, default: Sequence[float]):
+    """Valeurs d'une propriété Lottie aux images demandées : tableau (images, dimensions)"""
+    import numpy as np
+
+    count = len(frames)
+    if not isinstance(prop, dict) or "k" not in prop:
+        return np.tile(np.asarray(default, dtype=float), (count, 1))
+    keyframes = prop["k"]
+    if not prop.get("a") or not (isinstance(keyframes, list) and keyframes and isinstance(keyframes[0], dict)):
+        value = np.atleast_1d(np.asarray(keyframes, dtype=float))
+        return np.tile(value, (count, 1))
+
+    starts = [np.atleast_1d(np.asarray(kf.get("s", kf.get("e", default)), dtype=float)) for kf in keyframes]
+    width = max(len(value) for value in starts)
+    values = np.array([np.pad(value, (0, width - len(value)), mode="edge") for value in starts])
+    times = np.array([float(kf.get("t", 0)) for kf in keyframes])
+    # Fin de segment : valeur de la keyframe suivante, ou "e" (ancien format)
+    ends = values.copy()
+    ends[:-1] = values[1:]
+    for index, kf in enumerate(keyframes):
+        if "e" in kf:
+            end = np.atleast_1d(np.asarray(kf["e"], dtype=float))
+            ends[index] = np.pad(end, (0, width - len(end)), mode="edge")
+
+    segment = np.clip(np.searchsorted(times, frames, side="right") - 1, 0, len(times) - 1)
+    following = np.minimum(segment + 1, len(times) - 1)
+    span = times[following] - times[segment]
+    progress = np.clip(np.where(span > 0, (frames - times[segment]) / np.where(span > 0, span, 1), 0), 0, 1)
+    progress = np.where(frames < times[0], 0, progress)
+
+    tangents = np.array([_tangent(kf, "o", 0.0) + _tangent(kf, "i", 1.0) for kf in keyframes])[segment]
+    eased = _bezier_ease(progress, *tangents.T)
+    hold = np.array([bool(kf.get("h")) for kf in keyframes])[segment]
+    eased = np.where(hold, 0, eased)
+    return values[segment] + (ends[segment] - values[segment]) * eased[:, None]
+
+
+def _color(value, opacity: float) -> Tuple[int, int, int, int]:
+    channels = [float(channel) for channel in list(value)[:3]]
+    scale = 255 if max(channels, default=0) <= 1 else 1
+    return tuple(int(round(min(max(channel * scale, 0), 255))) for channel in channels) + (
+        int(round(min(max(opacity, 0), 1) * 255)),)
+
+
+def _rectangle_outline(size, roundness):
+    import numpy as np
+
+    half_w, half_h = abs(size[0]) / 2, abs(size[1]) / 2
+    radius = min(max(roundness, 0), half_w, half_h)
+    if radius <= 0:
+        return np.array([[-half_w, -half_h], [half_w, -half_h], [half_w, half_h], [-half_w, half_h]])
+    points = []
+    for (cx, cy), start in (((half_w - radius, -half_h + radius), -90), ((half_w - radius, half_h - radius), 0),
+                            ((-half_w + radius, half_h - radius), 90), ((-half_w + radius, -half_h + radius), 180)):
+        angles = np.radians(np.linspace(start, start + 90, CORNER_POINTS))
+        points.append(np.column_stack((cx + radius * np.cos(angles), cy + radius * np.sin(angles))))
+    return np.vstack(points)
+
+
+def _ellipse_outline(size):
+    import numpy as np
+
+    angles = np.linspace(0, 2 * math.pi, ELLIPSE_POINTS, endpoint=False)
+    return np.column_stack((abs(size[0]) / 2 * np.cos(angles), abs(size[1]) / 2 * np.sin(angles)))
+
+
+@lru_cache(maxsize=32)
+def _font(size: int):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:
+            return ImageFont.load_default()
+
+
+class _LayerSampler:
+    """Propriétés d'un calque échantillonnées une fois pour toutes les images"""
+
+    def __init__(self, layer: Dict, frames):
+        self.layer = layer
+        self.frames = frames
+        transform = layer.get("ks") or {}
+        self.position = property_values(transform.get("p"), frames, (0, 0, 0))
+        self.anchor = property_values(transform.get("a"), frames, (0, 0, 0))
+        self.scale = property_values(transform.get("s"), frames, (100, 100, 100))
+        self.rotation = property_values(transform.get("r"), frames, (0,))
+        self.opacity = property_values(transform.get("o"), frames, (100,))
+        self.visible = (frames >= float(layer.get("ip", -math.inf))) & (frames < float(layer.get("op", math.inf)))
+        self._shapes: Dict[int, object] = {}
+
+    def shape_value(self, prop: Dict, default: Sequence[float]):
+        values = self._shapes.get(id(prop))
+        if values is None:
+            values = self._shapes[id(prop)] = property_values(prop, self.frames, default)
+        return values
+
+    def to_canvas(self, points, frame: int, factor: float):
+        """Points locaux du calque vers le canevas (ancrage, échelle, rotation, position)"""
+        import numpy as np
+
+        scale = self.scale[frame][:2] / 100
+        angle = math.radians(self.rotation[frame][0])
+        rotation = np.array([[math.cos(angle), -math.sin(angle)], [math.sin(angle), math.cos(angle)]])
+        local = (points - self.anchor[frame][:2]) * scale
+        return (local @ rotation.T + self.position[frame][:2]) * factor
+
+
+class LottiePreviewRenderer:
+    """Rendu et cache disque des aperçus (une image par fichier PNG, métadonnées JSON à côté)"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_age: Optional[float] = None):
+        self.cache_dir = Path(cache_dir or os.getenv("LOTTIE_PREVIEW_DIR", "./exports/previews"))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age if max_age is not None else float(os.getenv("LOTTIE_PREVIEW_MAX_AGE", 7 * 24 * 3600))
+
+    def preview_id(self, lottie: Dict, frames: Sequence[float], width: int, background: Optional[str]) -> str:
+        encoded = json.dumps([RENDERER_VERSION, lottie, list(frames), width, background],
+                             sort_keys=True, separators=(",", ":"), default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()[:32]
+
+    def cached(self, preview_id: str) -> Optional[Dict]:
+        """Aperçu déjà rendu (chemin PNG et métadonnées), None sinon"""
+        if not preview_id.isalnum():
+            return None
+        image_path = self.cache_dir / f"{preview_id}.png"
+        meta_path = self.cache_dir / f"{preview_id}.json"
+        try:
+            meta = json.loads(meta_path.read_text())
+            os.utime(image_path)
+        except (OSError, ValueError):
+            return None
+        return {"id": preview_id, "path": str(image_path), "meta": meta}
+
+    def render(self, lottie_data: Dict, frames: Optional[Sequence[float]] = None, count: int = 1,
+               width: int = 320, background: Optional[str] = None) -> Dict:
+        """Aperçu des images demandées (frames explicites, ou count images réparties sur la durée) :
+        une image seule, ou une planche de sprites en grille quasi carrée"""
+        lottie = _unwrap(lottie_data)
+        if not 16 <= width <= MAX_PREVIEW_WIDTH:
+            raise LottieRenderError(f"width doit être compris entre 16 et {MAX_PREVIEW_WIDTH}")
+        frames = self._frames(lottie, frames, count)
+        preview_id = self.preview_id(lottie, frames, width, background)
+
+        cached = self.cached(preview_id)
+        CACHE_REQUESTS.labels("lottie_preview", "hit" if cached else "miss").inc()
+        if cached:
+            return {**cached, "cached": True}
+
+        with STAGE_LATENCY.labels("animation", "preview_render").time():
+            sheet, meta = self._render_sheet(lottie, frames, width, background)
+        image_path = self.cache_dir / f"{preview_id}.png"
+        meta_path = self.cache_dir / f"{preview_id}.json"
+        self._write_atomic(image_path, lambda out: sheet.save(out, format="PNG", optimize=True))
+        self._write_atomic(meta_path, lambda out: out.write(json.dumps(meta).encode()))
+        return {"id": preview_id, "path": str(image_path), "meta": meta, "cached": False}
+
+    def _write_atomic(self, path: Path, write):
+        """Écriture dans un fichier temporaire propre à l'appel, puis renommage : deux rendus
+        simultanés du même aperçu ne partagent jamais de fichier temporaire"""
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=f"{path.name}.", suffix=".tmp",
+                                         delete=False) as tmp:
+            try:
+                write(tmp)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+        os.replace(tmp.name, path)
+
+    def _frames(self, lottie: Dict, frames: Optional[Sequence[float]], count: int) -> List[float]:
+        start, end = float(lottie.get("ip", 0)), float(lottie.get("op", 0))
+        if frames:
+            selected = [min(max(float(frame), start), max(end - 1, start)) for frame in frames]
+        else:
+            if count < 1:
+                raise LottieRenderError("count doit être au moins 1")
+            step = max(end - start - 1, 0) / max(count - 1, 1)
+            selected = [start + index * step for index in range(count)]
+        if len(selected) > MAX_PREVIEW_FRAMES:
+            raise LottieRenderError(f"Au plus {MAX_PREVIEW_FRAMES} images par aperçu")
+        return [round(frame, 2) for frame in selected]
+
+    def _render_sheet(self, lottie: Dict, frames: List[float], width: int, background: Optional[str]):
+        import numpy as np
+        from PIL import Image, ImageColor
+
+        factor = width / float(lottie.get("w") or 1920)
+        height = max(int(round(float(lottie.get("h") or 1080) * factor)), 1)
+        frame_array = np.asarray(frames, dtype=float)
+        # Calques Lottie : le premier est au premier plan, dessiné en dernier
+        samplers = [_LayerSampler(layer, frame_array) for layer in reversed(lottie["layers"]) if isinstance(layer, dict)]
+        fill = ImageColor.getcolor(background, "RGBA") if background else (0, 0, 0, 0)
+
+        columns = math.ceil(math.sqrt(len(frames)))
+        rows = math.ceil(len(frames) / columns)
+        sheet = Image.new("RGBA", (columns * width, rows * height), (0, 0, 0, 0))
+        for index in range(len(frames)):
+            canvas = Image.new("RGBA", (width, height), fill)
+            for sampler in samplers:
+                if sampler.visible[index]:
+                    self._draw_layer(canvas, sampler, index, factor)
+            sheet.paste(canvas, ((index % columns) * width, (index // columns) * height))
+
+        meta = {"frames": frames, "columns": columns, "rows": rows,
+                "frame_width": width, "frame_height": height, "fps": lottie.get("fr")}
+        return sheet, meta
+
+    def _draw_layer(self, canvas, sampler: _LayerSampler, frame: int, factor: float):
+        from PIL import Image, ImageDraw
+
+        layer_opacity = sampler.opacity[frame][0] / 100
+        if layer_opacity <= 0:
+            return
+        overlay = Image.new("RGBA", canvas.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        if isinstance(sampler.layer.get("shapes"), list):
+            self._draw_shapes(draw, sampler, sampler.layer["shapes"], frame, factor, layer_opacity)
+        text = sampler.layer.get("t")
+        if isinstance(text, dict):
+            self._draw_text(draw, sampler, text, frame, factor, layer_opacity)
+        canvas.alpha_composite(overlay)
+
+    def _draw_shapes(self, draw, sampler: _LayerSampler, items: List[Dict], frame: int,
+                     factor: float, layer_opacity: float):
+        outlines, fill, stroke = [], None, None
+        for item in items:
+            kind = item.get("ty") if isinstance(item, dict) else None
+            if kind == "gr":
+                self._draw_shapes(draw, sampler, item.get("it") or [], frame, factor, layer_opacity)
+            elif kind in ("rc", "el"):
+                size = sampler.shape_value(item.get("s"), (100, 100))[frame]
+                center = sampler.shape_value(item.get("p"), (0, 0))[frame][:2]
+                if kind == "rc":
+                    outline = _rectangle_outline(size, sampler.shape_value(item.get("r"), (0,))[frame][0])
+                else:
+                    outline = _ellipse_outline(size)
+                outlines.append(outline + center)
+            elif kind == "fl" and fill is None:
+                opacity = sampler.shape_value(item.get("o"), (100,))[frame][0] / 100
+                fill = _color(sampler.shape_value(item.get("c"), (0, 0, 0))[frame], opacity * layer_opacity)
+            elif kind == "st" and stroke is None:
+                opacity = sampler.shape_value(item.get("o"), (100,))[frame][0] / 100
+                stroke = (_color(sampler.shape_value(item.get("c"), (0, 0, 0))[frame], opacity * layer_opacity),
+                          max(int(round(sampler.shape_value(item.get("w"), (1,))[frame][0] * factor)), 1))
+        for outline in outlines:
+            polygon = [tuple(point) for point in sampler.to_canvas(outline, frame, factor)]
+            if fill:
+                draw.polygon(polygon, fill=fill)
+            if stroke:
+                draw.line(polygon + polygon[:1], fill=stroke[0], width=stroke[1], joint="curve")
+
+    def _draw_text(self, draw, sampler: _LayerSampler, text: Dict, frame: int,
+                   factor: float, layer_opacity: float):
+        try:
+            document = text["d"]["k"][0]["s"]
+        except (KeyError, IndexError, TypeError):
+            return
+        # Aperçu : taille suivant l'échelle du calque, rotation ignorée
+        scale = abs(sampler.scale[frame][0]) / 100
+        size = max(int(round(float(document.get("s", 48)) * scale * factor)), 1)
+        x, y = sampler.to_canvas([[0.0, 0.0]], frame, factor)[0]
+        anchor = {0: "ls", 1: "rs", 2: "ms"}.get(document.get("j", 2), "ms")
+        draw.text((x, y), str(document.get("t", "")), font=_font(size), anchor=anchor,
+                  fill=_color(document.get("fc", (1, 1, 1)), layer_opacity))
+
+    def sweep(self) -> int:
+        """Suppression des aperçus non consultés depuis max_age secondes"""
+        cutoff = time.time() - self.max_age
+        evicted = 0
+        for image_path in self.cache_dir.glob("*.png"):
+            try:
+                if image_path.stat().st_mtime < cutoff:
+                    image_path.unlink()
+                    image_path.with_suffix(".json").unlink(missing_ok=True)
+                    evicted += 1
+            except FileNotFoundError:
+                continue
+        # Fichiers temporaires d'un rendu interrompu (arrêt du processus)
+        for tmp_path in self.cache_dir.glob("*.tmp"):
+            try:
+                if tmp_path.stat().st_mtime < cutoff:
+                    tmp_path.unlink()
+            except FileNotFoundError:
+                continue
+        return evicted
@@ -0,0 +1,179 @@
+# ===== MARKER_INDEX.PY =====
+"""Index d'intervalles des markers de synchronisation : « quelles animations sont actives à t ? »
+en O(log n), côté serveur comme côté lecteur.
+
+Chaque marker devient un intervalle [start, end) (end : marker, durée de l'animation ou
+DEFAULT_MARKER_DURATION). La table exportée (ePub, mobile, API) est triée :
+    {"version": 1,
+     "boundaries": [t0, t1, ...],          débuts et fins d'intervalles, croissants
+     "active": [[i, ...], ...],            markers actifs sur [boundaries[k], boundaries[k+1])
+     "markers": [{"animation_id", "start", "end", "trigger", "intensity"}, ...]}
+Recherche : k = dernier indice tel que boundaries[k] <= t (recherche dichotomique), puis active[k].
+"""
+import hashlib
+import json
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+TABLE_VERSION = 1
+# Durée d'activité d'un marker sans fin ni durée d'animation (valeur historique du lecteur ePub)
+DEFAULT_MARKER_DURATION = 3.0
+
+
+class MarkerIndex:
+    """Table triée des intervalles actifs, immuable une fois construite"""
+
+    __slots__ = ("markers", "boundaries", "active", "_identifier")
+
+    def __init__(self, markers: List[Dict], boundaries: List[float], active: List[List[int]]):
+        self.markers = markers
+        self.boundaries = boundaries
+        self.active = active
+        self._identifier = None
+
+    @classmethod
+    def build(cls, markers: Sequence[Dict], animations: Optional[Sequence[Dict]] = None,
+              duration: Optional[float] = None,
+              default_duration: float = DEFAULT_MARKER_DURATION) -> "MarkerIndex":
+        """Index des markers de sync_with_audio ; animations : durées par ID, duration : fin de la piste"""
+        durations = {
+            str(animation["id"]): float(animation["duration"]) for animation in animations or ()
+            if isinstance(animation, dict) and animation.get("id") is not None
+            and isinstance(animation.get("duration"), (int, float)) and animation["duration"] > 0
+        }
+        intervals = []
+        for marker in markers:
+            if marker.get("animation_id") is None or marker.get("time") is None:
+                continue
+            animation_id = str(marker["animation_id"])
+            start = float(marker["time"])
+            end = marker.get("end")
+            end = float(end) if end is not None else start + durations.get(animation_id, default_duration)
+            if duration:
+                end = min(end, float(duration))
+            if end <= start:
+                continue
+            intervals.append({
+                "animation_id": animation_id,
+                "start": round(start, 3),
+                "end": round(end, 3),
+                "trigger": marker.get("trigger", "start"),
+                "intensity": marker.get("intensity", 1.0)
+            })
+        intervals.sort(key=lambda interval: (interval["start"], interval["end"]))
+
+        # Balayage des bornes : ensemble des intervalles actifs entre deux bornes consécutives
+        events: Dict[float, List[int]] = {}
+        for index, interval in enumerate(intervals):
+            events.setdefault(interval["start"], []).append(index)
+            events.setdefault(interval["end"], []).append(~index)
+        boundaries = sorted(events)
+        active, current = [], set()
+        for boundary in boundaries:
+            for event in events[boundary]:
+                if event >= 0:
+                    current.add(event)
+                else:
+                    current.discard(~event)
+            active.append(sorted(current))
+        return cls(intervals, boundaries, active)
+
+    @classmethod
+    def from_table(cls, table: Dict) -> "MarkerIndex":
+        if table.get("version") != TABLE_VERSION:
+            raise ValueError(f"Version de table non supportée: {table.get('version')}")
+        return cls(table["markers"], table["boundaries"], table["active"])
+
+    def to_table(self) -> Dict:
+        return {"version": TABLE_VERSION, "boundaries": self.boundaries,
+                "active": self.active, "markers": self.markers}
+
+    @property
+    def identifier(self) -> str:
+        """Identifiant stable (SHA-256 de la table) : même sync, même index"""
+        if self._identifier is None:
+            encoded = json.dumps(self.to_table(), sort_keys=True, separators=(",", ":")).encode()
+            self._identifier = hashlib.sha256(encoded).hexdigest()[:32]
+        return self._identifier
+
+    def __len__(self) -> int:
+        return len(self.markers)
+
+    def at(self, time_s: float) -> List[Dict]:
+        """Markers actifs à l'instant time_s"""
+        position = bisect_right(self.boundaries, time_s) - 1
+        if position < 0:
+            return []
+        return [self.markers[index] for index in self.active[position]]
+
+    def between(self, start: float, end: float) -> List[Dict]:
+        """Markers actifs sur tout ou partie de [start, end), triés par début"""
+        if end <= start:
+            return self.at(start) if end == start else []
+        first = max(bisect_right(self.boundaries, start) - 1, 0)
+        last = bisect_left(self.boundaries, end)
+        indexes = set()
+        for position in range(first, last):
+            indexes.update(self.active[position])
+        return [self.markers[index] for index in sorted(indexes)]
+
+
+class MarkerIndexRegistry:
+    """Index enregistrés par identifiant : tables JSON en mémoire ou partagées entre workers
+    (SharedStore), index reconstruits gardés en cache local (identifiant dérivé du contenu).
+    Appelé depuis des threads (asyncio.to_thread) : les OrderedDict sont protégés par un verrou."""
+
+    def __init__(self, store=None, max_entries: int = 1000, cache_entries: int = 64):
+        self.tables = store.mapping("marker_indexes") if store else OrderedDict()
+        self.shared = store is not None
+        self.max_entries = max_entries
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[str, MarkerIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, index: MarkerIndex) -> str:
+        identifier = index.identifier
+        table = index.to_table()
+        with self._lock:
+            if identifier not in self.tables:
+                self.tables[identifier] = {"table": table, "created": time.time()}
+                # En mémoire : les plus anciens d'abord (les tables partagées passent par sweep)
+                while not self.shared and len(self.tables) > self.max_entries:
+                    self.tables.popitem(last=False)
+            self._remember(identifier, index)
+        return identifier
+
+    def get(self, identifier: str) -> Optional[MarkerIndex]:
+        with self._lock:
+            index = self._cache.get(identifier)
+            if index is not None:
+                self._cache.move_to_end(identifier)
+                return index
+            entry = self.tables.get(identifier)
+        if entry is None:
+            return None
+        # Reconstruction hors verrou ; un index évincé entre-temps est simplement remis en cache
+        index = MarkerIndex.from_table(entry["table"])
+        with self._lock:
+            self._remember(identifier, index)
+        return index
+
+    def _remember(self, identifier: str, index: MarkerIndex):
+        """Mise en cache local (verrou tenu par l'appelant)"""
+        self._cache[identifier] = index
+        self._cache.move_to_end(identifier)
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+
+    def sweep(self, max_age: float) -> int:
+        """Suppression des index plus anciens que max_age secondes"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = [identifier for identifier, entry in list(self.tables.items()) if entry["created"] < cutoff]
+            for identifier in expired:
+                self.tables.pop(identifier, None)
+                self._cache.pop(identifier, None)
+        return len(expired)
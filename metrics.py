@@ -0,0 +1,260 @@
+# ===== METRICS.PY =====
+"""Métriques applicatives au format d'exposition Prometheus (sans dépendance externe)"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, *values: str, **kwargs: str):
+        """Série associée à un jeu de labels (créée à la première utilisation)"""
+        key = tuple(str(v) for v in values) if values else tuple(str(kwargs[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self, const_labels: Tuple[Tuple[str, str], ...] = ()) -> List[str]:
+        """Échantillons de toutes les séries ; const_labels : labels ajoutés à chacune (worker)"""
+        names = self.labelnames + tuple(name for name, _ in const_labels)
+        values = tuple(value for _, value in const_labels)
+        # Copie sous le verrou : labels() peut créer une série dans un autre thread
+        with self._lock:
+            children = sorted(self._children.items())
+        lines = []
+        for key, child in children:
+            lines.extend(child.samples(self.name, names, key + values))
+        return lines
+
+    def collect(self) -> List[str]:
+        return self.header() + self.samples()
+
+
+class _Value:
+    __slots__ = ("value", "lock", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Valeur calculée au moment de l'exposition"""
+        self.function = function
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+    def samples(self, name: str, labelnames, key) -> List[str]:
+        value = self.function() if self.function else self.value
+        return [f"{name}{_format_labels(labelnames, key)} {value}"]
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "total", "count", "lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def samples(self, name: str, labelnames, key) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            bucket_labels = _format_labels(labelnames, key, f'le="{le}"')
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {self.total}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {self.count}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default().set_function(function)
+
+    def track_inprogress(self):
+        return self._default().track_inprogress()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        """Exposition texte (format Prometheus 0.0.4)"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self, worker: str) -> Dict[str, List[str]]:
+        """Échantillons de ce processus, étiquetés worker="<worker>" (publiés dans l'état partagé)"""
+        return {metric.name: metric.samples((("worker", worker),)) for metric in self.metrics}
+
+    def render_snapshots(self, snapshots: List[Dict[str, List[str]]]) -> str:
+        """Exposition regroupant les échantillons de plusieurs workers : une seule description
+        par métrique, une série par worker (à agréger côté Prometheus, ex. sum without (worker))"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.header())
+            for snapshot in snapshots:
+                lines.extend(snapshot.get(metric.name, []))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ===== MÉTRIQUES PARTAGÉES =====
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Requêtes HTTP traitées", ("method", "route", "status")
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latence des requêtes HTTP", ("method", "route")
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requêtes HTTP en cours"
+)
+STAGE_LATENCY = Histogram(
+    "service_stage_duration_seconds", "Durée des étapes internes des services", ("service", "stage")
+)
+STAGE_ERRORS = Counter(
+    "service_stage_errors_total", "Erreurs par service et par étape", ("service", "stage")
+)
+SERVICE_IN_FLIGHT = Gauge(
+    "service_in_flight", "Opérations en cours par service", ("service",)
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Accès aux caches (hit/miss)", ("cache", "result")
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight", "Requêtes admises en cours par classe de routes", ("route_class",)
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth", "Requêtes en attente d'admission par classe de routes", ("route_class",)
+)
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total", "Requêtes refusées (429) par classe de routes et motif", ("route_class", "reason")
+)
+TTS_SCHEDULER_WAIT = Histogram(
+    "tts_scheduler_wait_seconds", "Attente d'une place d'appel fournisseur TTS par priorité", ("priority",)
+)
+TTS_SCHEDULER_IN_FLIGHT = Gauge(
+    "tts_scheduler_in_flight", "Appels fournisseurs TTS en cours par priorité", ("priority",)
+)
+TTS_SCHEDULER_QUEUE_DEPTH = Gauge(
+    "tts_scheduler_queue_depth", "Appels fournisseurs TTS en attente par priorité", ("priority",)
+)
+TTS_RATE_LIMIT_WAIT = Histogram(
+    "tts_rate_limit_wait_seconds", "Attente imposée par les quotas d'un fournisseur TTS", ("provider",)
+)
+TTS_RATE_LIMITED = Counter(
+    "tts_rate_limited_total", "Réponses 429 des fournisseurs TTS", ("provider",)
+)
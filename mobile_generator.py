@@ -0,0 +1,508 @@
+# ===== MOBILE_GENERATOR.PY =====
+"""Génération de projets React Native (Expo) : gabarit pré-construit mis en cache,
+superposition des écrans et médias propres à chaque projet, archive zip téléchargeable"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from asset_store import local_media_path, media_roots
+from document_model import Document, MEDIA_KEYS
+from fingerprinted_tasks import FingerprintedTasks
+from marker_index import MarkerIndex
+from metrics import STAGE_LATENCY, STAGE_ERRORS, SERVICE_IN_FLIGHT, CACHE_REQUESTS
+
+# Version du gabarit : à incrémenter à chaque modification de TEMPLATE_FILES
+TEMPLATE_VERSION = "2"
+MEDIA_CHUNK_SIZE = 1024 * 1024
+# Médias déjà compressés : stockés tels quels dans l'archive
+PRECOMPRESSED_EXTENSIONS = {".mp3", ".m4a", ".aac", ".ogg", ".opus", ".mp4", ".webm",
+                            ".png", ".jpg", ".jpeg", ".gif", ".webp"}
+
+# Fichiers communs à tous les projets (ne dépendent pas du contenu)
+TEMPLATE_FILES = {
+    "babel.config.js": """module.exports = function (api) {
+  api.cache(true);
+  return {
+    presets: ['babel-preset-expo'],
+    plugins: ['react-native-reanimated/plugin'],
+  };
+};
+""",
+    "App.js": """import 'react-native-gesture-handler';
+import React from 'react';
+import { NavigationContainer, DarkTheme, DefaultTheme } from '@react-navigation/native';
+import { createNativeStackNavigator } from '@react-navigation/native-stack';
+import { useColorScheme } from 'react-native';
+import HomeScreen from './src/screens/HomeScreen';
+import { chapterScreens } from './src/generated/routes';
+
+const Stack = createNativeStackNavigator();
+
+export default function App() {
+  const scheme = useColorScheme();
+  return (
+    <NavigationContainer theme={scheme === 'dark' ? DarkTheme : DefaultTheme}>
+      <Stack.Navigator>
+        <Stack.Screen name="Home" component={HomeScreen} options={{ title: 'Sommaire' }} />
+        {chapterScreens.map(({ name, title, component }) => (
+          <Stack.Screen key={name} name={name} component={component} options={{ title }} />
+        ))}
+      </Stack.Navigator>
+    </NavigationContainer>
+  );
+}
+""",
+    "src/screens/HomeScreen.js": """import React from 'react';
+import { FlatList, Pressable, Text, StyleSheet } from 'react-native';
+import { chapterScreens } from '../generated/routes';
+
+export default function HomeScreen({ navigation }) {
+  return (
+    <FlatList
+      data={chapterScreens}
+      keyExtractor={(item) => item.name}
+      renderItem={({ item }) => (
+        <Pressable style={styles.item} onPress={() => navigation.navigate(item.name)}>
+          <Text style={styles.title}>{item.title}</Text>
+        </Pressable>
+      )}
+    />
+  );
+}
+
+const styles = StyleSheet.create({
+  item: { padding: 16, borderBottomWidth: StyleSheet.hairlineWidth },
+  title: { fontSize: 18 },
+});
+""",
+    "src/markerLookup.js": """// Table triée des markers (générée avec le projet) : recherche dichotomique
+export function markerTablePosition(table, time) {
+  let low = 0;
+  let high = table.boundaries.length - 1;
+  let position = -1;
+  while (low <= high) {
+    const middle = (low + high) >> 1;
+    if (table.boundaries[middle] <= time) {
+      position = middle;
+      low = middle + 1;
+    } else {
+      high = middle - 1;
+    }
+  }
+  return position;
+}
+
+export function activeAnimationIds(table, position) {
+  return position < 0 ? [] : table.active[position].map((index) => table.markers[index].animation_id);
+}
+""",
+    "src/components/ChapterView.js": """import React, { useState } from 'react';
+import { ScrollView, Text, Image, StyleSheet } from 'react-native';
+import AnimatedScene from './AnimatedScene';
+import AudioPlayer from './AudioPlayer';
+
+export default function ChapterView({ chapter, assets }) {
+  const [activeIds, setActiveIds] = useState(null);
+  return (
+    <ScrollView contentContainerStyle={styles.container}>
+      {chapter.content.map((item, index) => {
+        switch (item.type) {
+          case 'chapter':
+            return <Text key={index} style={styles.heading}>{item.title}</Text>;
+          case 'text':
+            return <Text key={index} style={styles.paragraph}>{item.text}</Text>;
+          case 'animation':
+            return assets[item.asset] ? (
+              <AnimatedScene
+                key={index}
+                source={assets[item.asset]}
+                active={!activeIds || activeIds.includes(item.animationId)}
+              />
+            ) : null;
+          case 'image':
+            return assets[item.asset] ? <Image key={index} source={assets[item.asset]} style={styles.image} /> : null;
+          case 'audio':
+            return assets[item.asset] ? (
+              <AudioPlayer
+                key={index}
+                source={assets[item.asset]}
+                markerTable={item.markerTable}
+                onActiveChange={setActiveIds}
+              />
+            ) : null;
+          default:
+            return null;
+        }
+      })}
+    </ScrollView>
+  );
+}
+
+const styles = StyleSheet.create({
+  container: { padding: 16 },
+  heading: { fontSize: 24, fontWeight: 'bold', marginBottom: 12 },
+  paragraph: { fontSize: 16, lineHeight: 24, marginBottom: 12 },
+  image: { width: '100%', aspectRatio: 16 / 9, resizeMode: 'contain', marginBottom: 12 },
+});
+""",
+    "src/components/AnimatedScene.js": """import React, { useEffect, useRef } from 'react';
+import LottieView from 'lottie-react-native';
+
+export default function AnimatedScene({ source, active = true }) {
+  const animation = useRef(null);
+
+  useEffect(() => {
+    if (animation.current) {
+      active ? animation.current.play() : animation.current.pause();
+    }
+  }, [active]);
+
+  return <LottieView ref={animation} source={source} autoPlay={active} loop style={{ width: '100%', aspectRatio: 16 / 9 }} />;
+}
+""",
+    "src/components/AudioPlayer.js": """import React, { useEffect, useRef, useState } from 'react';
+import { Button } from 'react-native';
+import { Audio } from 'expo-av';
+import { markerTablePosition, activeAnimationIds } from '../markerLookup';
+
+export default function AudioPlayer({ source, markerTable, onActiveChange }) {
+  const sound = useRef(null);
+  const lastPosition = useRef(null);
+  const [playing, setPlaying] = useState(false);
+
+  const onStatus = (status) => {
+    if (!markerTable || !onActiveChange || !status.isLoaded) {
+      return;
+    }
+    // Notification uniquement au changement d'intervalle
+    const position = markerTablePosition(markerTable, status.positionMillis / 1000);
+    if (position !== lastPosition.current) {
+      lastPosition.current = position;
+      onActiveChange(activeAnimationIds(markerTable, position));
+    }
+  };
+
+  useEffect(() => () => sound.current && sound.current.unloadAsync(), []);
+
+  const toggle = async () => {
+    if (!sound.current) {
+      const { sound: loaded } = await Audio.Sound.createAsync(source, { progressUpdateIntervalMillis: 100 }, onStatus);
+      sound.current = loaded;
+    }
+    if (playing) {
+      await sound.current.pauseAsync();
+    } else {
+      await sound.current.playAsync();
+    }
+    setPlaying(!playing);
+  };
+
+  return <Button title={playing ? 'Pause' : 'Écouter'} onPress={toggle} />;
+}
+""",
+}
+
+PACKAGE_DEPENDENCIES = {
+    "expo": "~51.0.0",
+    "expo-av": "~14.0.0",
+    "react": "18.2.0",
+    "react-native": "0.74.0",
+    "react-native-gesture-handler": "~2.16.0",
+    "react-native-reanimated": "~3.10.0",
+    "react-native-safe-area-context": "4.10.0",
+    "react-native-screens": "3.31.0",
+    "@react-navigation/native": "^6.1.0",
+    "@react-navigation/native-stack": "^6.9.0",
+    "@react-native-async-storage/async-storage": "1.23.1",
+    "lottie-react-native": "6.7.0",
+}
+
+
+class MobileGenerator(FingerprintedTasks):
+    CACHE_NAME = "mobile_project"
+
+    def __init__(self, store=None):
+        # État partagé entre workers si un SharedStore est fourni
+        self.tasks = store.mapping("mobile_tasks") if store else {}
+        self.fingerprints = store.mapping("mobile_fingerprints") if store else {}
+        self.output_dir = Path(os.getenv("MOBILE_OUTPUT_DIR", "./exports/mobile"))
+        self.template_dir = Path(os.getenv("MOBILE_TEMPLATE_CACHE", "./exports/mobile/templates"))
+        self.asset_concurrency = int(os.getenv("MOBILE_ASSET_CONCURRENCY", 8))
+        self.max_age = float(os.getenv("MOBILE_RETENTION_MAX_AGE", 24 * 3600))
+
+    # ----- Empreinte et réutilisation -----
+
+    def _fingerprint_salt(self) -> Dict:
+        # Nouvelle version du gabarit : projets précédents non réutilisables
+        return {"template": TEMPLATE_VERSION}
+
+    def _set_task(self, task_id: str, record: Dict):
+        self.tasks[task_id] = record
+
+    # ----- Génération -----
+
+    async def generate_react_native_app(self, task_id: str, project_name: str,
+                                        content: Union[List[Dict], Document],
+                                        animations: List[Dict] = None, fingerprint: Optional[str] = None):
+        """Génération du projet et de son archive (tâche de fond ; content : brut ou Document)"""
+        with SERVICE_IN_FLIGHT.labels("mobile").track_inprogress():
+            self.tasks[task_id] = {"status": "processing", "progress": 0, "created_at": time.time()}
+            if fingerprint:
+                self.fingerprints[fingerprint] = task_id
+            stage = "template"
+            try:
+                with STAGE_LATENCY.labels("mobile", "template").time():
+                    template_zip = await asyncio.to_thread(self._template_archive)
+                self._update_task(task_id, progress=20)
+
+                stage = "assets"
+                document = Document.parse(content, animations)
+                with STAGE_LATENCY.labels("mobile", "assets").time():
+                    assets = await self._prepare_assets(document)
+                self._update_task(task_id, progress=50)
+
+                stage = "overlay"
+                overlay = self._overlay_files(project_name, document, assets)
+
+                stage = "archive"
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                archive = self.output_dir / f"{task_id}.zip"
+                with STAGE_LATENCY.labels("mobile", "archive").time():
+                    await asyncio.to_thread(self._write_archive, archive, template_zip, overlay, assets)
+                    digest = await asyncio.to_thread(self._file_digest, archive)
+
+                self.tasks[task_id] = {
+                    "status": "completed",
+                    "progress": 100,
+                    "project_name": project_name,
+                    "file_path": str(archive),
+                    "file_size": archive.stat().st_size,
+                    "sha256": digest,
+                    "fingerprint": fingerprint,
+                    "screens": len(overlay["screens"]),
+                    "assets": len(assets),
+                    "finished_at": time.time()
+                }
+
+            except Exception as e:
+                STAGE_ERRORS.labels("mobile", stage).inc()
+                self.tasks[task_id] = {"status": "error", "error": str(e), "stage": stage,
+                                       "finished_at": time.time()}
+                self._release_fingerprint(fingerprint, task_id)
+
+    def _update_task(self, task_id: str, **fields):
+        task = self.tasks[task_id]
+        task.update(fields)
+        self.tasks[task_id] = task
+
+    def _template_archive(self) -> Path:
+        """Archive zip du gabarit, construite une fois par version puis copiée pour chaque
+        projet : les fichiers communs ne sont jamais recompressés"""
+        template_zip = self.template_dir / f"template_v{TEMPLATE_VERSION}.zip"
+        if template_zip.exists():
+            CACHE_REQUESTS.labels("mobile_template", "hit").inc()
+            return template_zip
+
+        CACHE_REQUESTS.labels("mobile_template", "miss").inc()
+        self.template_dir.mkdir(parents=True, exist_ok=True)
+        # Fichier temporaire propre à l'appel : deux générations du même worker (threads)
+        # peuvent construire l'archive en même temps
+        with tempfile.NamedTemporaryFile(dir=self.template_dir, prefix=f"{template_zip.name}.",
+                                         suffix=".tmp", delete=False) as tmp:
+            try:
+                with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as archive:
+                    for name, source in sorted(TEMPLATE_FILES.items()):
+                        archive.writestr(name, source)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+        os.replace(tmp.name, template_zip)
+        return template_zip
+
+    async def _prepare_assets(self, document: Document) -> Dict[str, Dict]:
+        """Inventaire des médias, préparés en parallèle (lecture, hachage, sérialisation)"""
+        semaphore = asyncio.Semaphore(self.asset_concurrency)
+        jobs = {}
+        for animation in document.animations:
+            if animation.get("id") and animation.get("lottie_data"):
+                jobs[f"animation:{animation['id']}"] = ("animations", animation["lottie_data"], f"{animation['id']}.json")
+        roots = media_roots()
+        for item in document:
+            for key, folder in zip(MEDIA_KEYS, ("audio", "images", "animations")):
+                # Fichiers des répertoires autorisés uniquement (MediaPathError sinon), URLs ignorées
+                source = getattr(item, key) and local_media_path(getattr(item, key), roots)
+                if source:
+                    jobs.setdefault(source, (folder, source, Path(source).name))
+
+        async def prepare(key: str, folder: str, source, filename: str) -> Dict:
+            async with semaphore:
+                return await asyncio.to_thread(self._prepare_asset, key, folder, source, filename)
+
+        prepared = await asyncio.gather(*(prepare(key, *job) for key, job in jobs.items()))
+        return {asset["key"]: asset for asset in prepared}
+
+    def _prepare_asset(self, key: str, folder: str, source, filename: str) -> Dict:
+        """Un média : nom adressé par contenu (dédoublonnage), mode de compression"""
+        digest = hashlib.sha256()
+        if isinstance(source, str):
+            with open(source, "rb") as media:
+                while chunk := media.read(MEDIA_CHUNK_SIZE):
+                    digest.update(chunk)
+            data = None
+        else:
+            data = json.dumps(source, separators=(",", ":")).encode()
+            digest.update(data)
+        extension = Path(filename).suffix.lower()
+        return {
+            "key": key,
+            "path": f"assets/{folder}/{digest.hexdigest()[:16]}{extension}",
+            "source": source if data is None else None,
+            "data": data,
+            "compress_type": zipfile.ZIP_STORED if extension in PRECOMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
+        }
+
+    def _overlay_files(self, project_name: str, document: Document, assets: Dict[str, Dict]) -> Dict:
+        """Fichiers propres au projet : configuration, écrans générés, table des médias"""
+        slug = re.sub(r"[^a-z0-9-]", "-", project_name.lower()).strip("-") or "app"
+        chapters = self._chapters(document, assets)
+        files = {
+            "package.json": json.dumps({
+                "name": slug,
+                "version": "1.0.0",
+                "main": "node_modules/expo/AppEntry.js",
+                "scripts": {"start": "expo start", "android": "expo start --android", "ios": "expo start --ios"},
+                "dependencies": PACKAGE_DEPENDENCIES,
+                "devDependencies": {"@babel/core": "^7.24.0"}
+            }, indent=2),
+            "app.json": json.dumps({"expo": {"name": project_name, "slug": slug, "version": "1.0.0",
+                                             "userInterfaceStyle": "automatic"}}, indent=2),
+        }
+
+        # require() statiques : exigés par le bundler Metro pour embarquer les médias
+        used_assets = sorted({asset["path"] for asset in assets.values()})
+        files["src/generated/assets.js"] = "export default {\n" + "".join(
+            f"  {json.dumps(path)}: require({json.dumps('../../' + path)}),\n" for path in used_assets
+        ) + "};\n"
+
+        screens = []
+        for index, chapter in enumerate(chapters):
+            name = f"Chapter{index + 1}Screen"
+            files[f"src/generated/chapters/chapter_{index + 1}.json"] = json.dumps(chapter, ensure_ascii=False)
+            files[f"src/generated/screens/{name}.js"] = (
+                "import React from 'react';\n"
+                "import ChapterView from '../../components/ChapterView';\n"
+                "import assets from '../assets';\n"
+                f"import chapter from '../chapters/chapter_{index + 1}.json';\n\n"
+                f"export default function {name}() {{\n"
+                "  return <ChapterView chapter={chapter} assets={assets} />;\n"
+                "}\n"
+            )
+            screens.append((name, chapter["title"]))
+
+        files["src/generated/routes.js"] = "".join(
+            f"import {name} from './screens/{name}';\n" for name, _ in screens
+        ) + "\nexport const chapterScreens = [\n" + "".join(
+            f"  {{ name: {json.dumps(name)}, title: {json.dumps(title, ensure_ascii=False)}, component: {name} }},\n"
+            for name, title in screens
+        ) + "];\n"
+        return {"files": files, "screens": screens}
+
+    def _chapters(self, document: Document, assets: Dict[str, Dict]) -> List[Dict]:
+        """Un écran par chapitre (le préambule éventuel forme le premier), médias remplacés
+        par leur chemin dans le projet"""
+        sections = [(chapter.title, chapter.items) for chapter in document.chapters]
+        if document.preamble:
+            sections.insert(0, (document.preamble[0].title or "Chapitre 1", document.preamble))
+
+        chapters = []
+        for title, items in sections:
+            entries = []
+            for item in items:
+                entry = {"type": item.type}
+                if item.type == "chapter":
+                    entry["title"] = item.title or ""
+                elif item.html or item.text:
+                    entry["text"] = re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", item.html or item.text)).strip()
+                for key in MEDIA_KEYS:
+                    source = getattr(item, key)
+                    if source and os.path.realpath(source) in assets:
+                        entry["asset"] = assets[os.path.realpath(source)]["path"]
+                if item.type == "animation" and f"animation:{item.animation_id}" in assets:
+                    entry["asset"] = assets[f"animation:{item.animation_id}"]["path"]
+                if item.type == "animation" and item.animation_id:
+                    entry["animationId"] = item.animation_id
+                markers = (item.sync or {}).get("markers") if item.type == "audio" else None
+                if markers:
+                    # Table triée des intervalles actifs, lue par AudioPlayer (src/markerLookup.js)
+                    entry["markerTable"] = MarkerIndex.build(
+                        markers, document.animations,
+                        duration=((item.sync or {}).get("sync_data") or {}).get("duration")
+                    ).to_table()
+                entries.append(entry)
+            chapters.append({"title": title, "content": entries})
+        return chapters
+
+    def _write_archive(self, archive: Path, template_zip: Path, overlay: Dict, assets: Dict[str, Dict]):
+        """Copie de l'archive du gabarit puis ajout des fichiers du projet (mode append)"""
+        tmp_path = archive.with_suffix(".zip.tmp")
+        shutil.copyfile(template_zip, tmp_path)
+        with zipfile.ZipFile(tmp_path, "a", zipfile.ZIP_DEFLATED) as project:
+            for name, source in overlay["files"].items():
+                project.writestr(name, source)
+            written = set()
+            for asset in assets.values():
+                if asset["path"] in written:
+                    continue
+                written.add(asset["path"])
+                if asset["data"] is not None:
+                    project.writestr(asset["path"], asset["data"], compress_type=asset["compress_type"])
+                else:
+                    info = zipfile.ZipInfo.from_file(asset["source"], asset["path"])
+                    info.compress_type = asset["compress_type"]
+                    with open(asset["source"], "rb") as media, project.open(info, "w", force_zip64=True) as entry:
+                        shutil.copyfileobj(media, entry, MEDIA_CHUNK_SIZE)
+        os.replace(tmp_path, archive)
+
+    # ----- Statut, rétention, santé -----
+
+    def get_generated_file(self, task_id: str) -> Optional[str]:
+        """Chemin de l'archive générée"""
+        task = self.tasks.get(task_id, {})
+        return task.get("file_path") if task.get("status") == "completed" else None
+
+    async def sweep(self) -> Dict:
+        """Éviction des tâches terminées depuis plus de max_age et de leurs archives (tâches
+        modifiées sur la boucle d'événements, suppression des archives dans un thread)"""
+        cutoff = time.time() - self.max_age
+        archives = []
+        evicted = 0
+        for task_id, task in list(self.tasks.items()):
+            if task.get("status") in ("completed", "error") and task.get("finished_at", 0) < cutoff:
+                if task.get("file_path"):
+                    archives.append(Path(task["file_path"]))
+                self._release_fingerprint(task.get("fingerprint"), task_id)
+                self.tasks.pop(task_id, None)
+                evicted += 1
+        await asyncio.to_thread(self._remove_archives, archives)
+        return {"evicted": evicted}
+
+    def _remove_archives(self, archives: List[Path]):
+        for archive in archives:
+            archive.unlink(missing_ok=True)
+
+    def health_check(self) -> Dict:
+        """Vérification santé du générateur"""
+        return {
+            "status": "healthy",
+            "output_dir": str(self.output_dir),
+            "template_cached": (self.template_dir / f"template_v{TEMPLATE_VERSION}.zip").exists()
+        }
@@ -0,0 +1,150 @@
+# ===== MULTIPART_SPOOL.PY =====
+"""Réception des uploads multipart directement depuis le flux de la requête.
+
+request.form() (et les paramètres UploadFile) lisent tout le corps dans un SpooledTemporaryFile
+avant d'appeler la route : le fichier existait alors en double et le plafond de taille ne
+s'appliquait qu'une fois le corps entièrement reçu (uploads chunked : pas de Content-Length).
+Ici le champ fichier est écrit par blocs dans le spool à mesure de la réception, haché au passage,
+et le plafond est vérifié à chaque bloc ; les autres champs sont renvoyés en texte.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+try:
+    from python_multipart import MultipartParser
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Champs texte (JSON des animations, identifiants) : bornés, gardés en mémoire
+MAX_FIELD_BYTES = 1024 * 1024
+MAX_FIELDS = 32
+
+
+class MultipartError(ValueError):
+    """Corps multipart invalide (boundary absent, champ en trop, fichier inattendu)"""
+
+
+class UploadTooLarge(Exception):
+    """Fichier dépassant la taille maximale autorisée"""
+
+
+class MultipartSpool:
+    """Un corps multipart : au plus un fichier (champ `file_field`) écrit dans `spool_dir`"""
+
+    def __init__(self, spool_dir: str, max_bytes: int, file_field: str = "file"):
+        self.spool_dir = spool_dir
+        self.max_bytes = max_bytes
+        self.file_field = file_field
+        self.fields: Dict[str, str] = {}
+        self.upload: Optional[Dict] = None
+        self._digest = hashlib.sha256()
+        self._spool = None
+        self._pending: List[bytes] = []
+        self._part: Dict = {}
+        self._header_name = b""
+        self._header_value = b""
+
+    async def receive(self, content_type: str, stream: AsyncIterator[bytes]) -> Tuple[Dict[str, str], Optional[Dict]]:
+        """Champs texte et fichier reçu ({path, sha256, size, filename, content_type}) ;
+        l'appelant supprime upload["path"] après usage"""
+        _, params = parse_options_header(content_type or "")
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise MultipartError("Corps multipart sans boundary")
+        parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished
+        })
+        try:
+            async for chunk in stream:
+                parser.write(chunk)
+                # Écriture hors boucle d'événements, un bloc de réception à la fois
+                if self._pending:
+                    data = b"".join(self._pending)
+                    self._pending.clear()
+                    await asyncio.to_thread(self._spool.write, data)
+            parser.finalize()
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+        except BaseException:
+            self.discard()
+            raise
+        return self.fields, self.upload
+
+    def discard(self):
+        """Suppression du fichier reçu (erreur de réception ou de traitement)"""
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        if self.upload and os.path.exists(self.upload["path"]):
+            os.remove(self.upload["path"])
+
+    # ----- Rappels du parseur (synchrones) -----
+
+    def _on_part_begin(self):
+        self._part = {"headers": {}, "data": bytearray(), "file": False}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._part["headers"][self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._part["headers"].get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise MultipartError('Champ multipart sans "name"')
+        self._part["name"] = options[b"name"].decode("utf-8", "replace")
+        if b"filename" not in options:
+            if len(self.fields) >= MAX_FIELDS:
+                raise MultipartError(f"Trop de champs (max {MAX_FIELDS})")
+            return
+        if self._part["name"] != self.file_field or self.upload is not None:
+            raise MultipartError(f"Un seul fichier attendu, dans le champ '{self.file_field}'")
+        fd, path = tempfile.mkstemp(prefix="upload_", suffix=self._suffix(options[b"filename"]), dir=self.spool_dir)
+        self._spool = os.fdopen(fd, "wb")
+        self._part["file"] = True
+        self.upload = {
+            "path": path,
+            "size": 0,
+            "filename": options[b"filename"].decode("utf-8", "replace"),
+            "content_type": self._part["headers"].get(b"content-type", b"").decode("latin-1") or None
+        }
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        chunk = data[start:end]
+        if not self._part["file"]:
+            if len(self._part["data"]) + len(chunk) > MAX_FIELD_BYTES:
+                raise MultipartError(f"Champ '{self._part['name']}' trop volumineux")
+            self._part["data"].extend(chunk)
+            return
+        self.upload["size"] += len(chunk)
+        if self.upload["size"] > self.max_bytes:
+            raise UploadTooLarge(f"Fichier trop volumineux (max {self.max_bytes} octets)")
+        self._digest.update(chunk)
+        self._pending.append(chunk)
+
+    def _on_part_end(self):
+        if self._part["file"]:
+            self.upload["sha256"] = self._digest.hexdigest()
+        else:
+            self.fields[self._part["name"]] = self._part["data"].decode("utf-8", "replace")
+
+    @staticmethod
+    def _suffix(filename: bytes) -> str:
+        suffix = os.path.splitext(filename.decode("utf-8", "replace"))[1].lower()
+        return suffix if suffix[1:].isalnum() and len(suffix) <= 9 else ".bin"
@@ -1,15 +1,19 @@
 # ===== main.py - SERVICE PRINCIPAL PYTHON =====
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from fastapi.responses import FileResponse, StreamingResponse, Response, JSONResponse
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, Tuple
 import asyncio
 import uvicorn
 import logging
 import tempfile
 import os
-from datetime import datetime
+import time
+import uuid
+import hashlib
+import argparse
+from datetime import datetime, timezone
 import json
 import base64
 import io
@@ -19,6 +23,17 @@ from tts_service import TTSService
 from animation_service import AnimationService
 from epub_generator import EPubGenerator
 from mobile_generator import MobileGenerator
+from metrics import REGISTRY, CONTENT_TYPE, HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_FLIGHT, STAGE_LATENCY
+from shared_store import SharedStore, JobWorker
+from admission import AdmissionLimiter, AdmissionRejected
+from asset_store import AssetStore, ASSET_REF_PREFIX, is_remote
+from multipart_spool import MultipartSpool, UploadTooLarge
+from response_compression import CompressionMiddleware, PrecompressedCache
+from book_pipeline import NarratedBookPipeline
+from document_model import Document, DocumentError, MEDIA_KEYS
+from marker_index import MarkerIndex, MarkerIndexRegistry
+from lottie_renderer import LottiePreviewRenderer
+from compact_arrays import pack_analysis, ENCODINGS as COMPACT_ENCODINGS, SCHEMA as COMPACT_SCHEMA
 
 # Configuration logging
 logging.basicConfig(level=logging.INFO)
@@ -39,11 +54,347 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialisation des services
-tts_service = TTSService()
-animation_service = AnimationService()
-epub_generator = EPubGenerator()
-mobile_generator = MobileGenerator()
+# Compression négociée (zstd/br/gzip) des réponses JSON et texte au-delà du seuil
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", 1024)))
+
+# Résultats déterministes servis depuis un cache déjà sérialisé et compressé
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+lottie_cache = PrecompressedCache("lottie_response", RESPONSE_CACHE_MAX_BYTES // 2)
+analysis_cache = PrecompressedCache("analysis_response", RESPONSE_CACHE_MAX_BYTES // 2)
+
+# Contrôle d'admission des routes coûteuses en CPU : au-delà de la concurrence et de
+# la file d'attente de leur classe, réponse 429 immédiate avec Retry-After.
+# Limites par worker (multipliées par le nombre de workers en --production) ; le plafond
+# d'exports en attente (EXPORT_MAX_BACKLOG) est au contraire global en mode partagé.
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 15))
+admission_limiters = {
+    "tts": AdmissionLimiter.from_env("tts", concurrency=8, max_queue=16, queue_timeout=ADMISSION_QUEUE_TIMEOUT),
+    "audio_analysis": AdmissionLimiter.from_env("audio_analysis", concurrency=2, max_queue=4, queue_timeout=ADMISSION_QUEUE_TIMEOUT),
+    "animation": AdmissionLimiter.from_env("animation", concurrency=2, max_queue=4, queue_timeout=ADMISSION_QUEUE_TIMEOUT),
+    "export": AdmissionLimiter.from_env("export", concurrency=4, max_queue=8, queue_timeout=ADMISSION_QUEUE_TIMEOUT),
+}
+ADMISSION_ROUTES = {
+    "/api/tts/synthesize": "tts",
+    "/api/tts/batch": "tts",
+    "/api/sync/audio-animation": "audio_analysis",
+    "/api/analyze/audio": "audio_analysis",
+    "/api/animations/generate": "animation",
+    "/api/animations/lottie": "animation",
+    "/api/animations/lottie/preview": "animation",
+    "/api/export/epub": "export",
+    "/api/export/mobile": "export",
+    "/api/pipeline/book": "export",
+}
+# Générations ePub en attente ou en cours au-delà desquelles un nouvel export est refusé
+EXPORT_MAX_BACKLOG = int(os.getenv("EXPORT_MAX_BACKLOG", 20))
+EXPORT_RETRY_AFTER = int(os.getenv("EXPORT_RETRY_AFTER", 60))
+
+def _too_many_requests(rejected: AdmissionRejected) -> Response:
+    return Response(
+        content=json.dumps({"detail": "Service saturé, réessayez plus tard", "route_class": rejected.route_class}),
+        status_code=429,
+        media_type="application/json",
+        headers={"Retry-After": str(rejected.retry_after)}
+    )
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    route_class = ADMISSION_ROUTES.get(request.url.path) if request.method == "POST" else None
+    if route_class is None:
+        return await call_next(request)
+    try:
+        # Refus avant lecture du corps (uploads audio)
+        async with admission_limiters[route_class].admit():
+            return await call_next(request)
+    except AdmissionRejected as rejected:
+        return _too_many_requests(rejected)
+
+# Uploads audio : plafond de taille vérifié dès l'en-tête Content-Length, puis pendant la copie
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 200 * 1024 * 1024))
+UPLOAD_ROUTES = {"/api/analyze/audio", "/api/sync/audio-animation", "/api/assets"}
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    if request.url.path in UPLOAD_ROUTES:
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > UPLOAD_MAX_BYTES:
+            return Response(
+                content=json.dumps({"detail": f"Fichier trop volumineux (max {UPLOAD_MAX_BYTES} octets)"}),
+                status_code=413,
+                media_type="application/json"
+            )
+    return await call_next(request)
+
+# Métriques HTTP par route (latence jusqu'au début de la réponse)
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    with HTTP_IN_FLIGHT.track_inprogress():
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Gabarit de route (et non le chemin brut) pour borner la cardinalité
+            # (les refus d'admission n'atteignent pas le routage : chemins statiques connus)
+            route = request.scope.get("route")
+            if route:
+                path = route.path
+            else:
+                path = request.url.path if request.url.path in ADMISSION_ROUTES else "unmatched"
+            HTTP_LATENCY.labels(request.method, path).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(request.method, path, str(status)).inc()
+
+# Initialisation des services (paresseuse : construits à la première utilisation)
+class LazyService:
+    """Proxy construisant le service au premier accès"""
+    
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+    
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+    
+    def get(self):
+        if self._instance is None:
+            self._instance = self._factory()
+        return self._instance
+    
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+# État partagé entre workers (tâches, empreintes, files de jobs) : SQLite local.
+# Sans SHARED_STORE_PATH, tout reste en mémoire du processus (mode développement).
+SHARED_STORE_PATH = os.getenv("SHARED_STORE_PATH")
+shared_store = SharedStore(SHARED_STORE_PATH) if SHARED_STORE_PATH else None
+# Identité du worker (baux exclusifs de l'état partagé)
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 2))
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", 25))
+job_workers: Dict[str, JobWorker] = {}
+
+# Fichiers envoyés une fois puis référencés par ID (SHA-256), partagés entre workers
+ASSET_STORE_DIR = os.getenv("ASSET_STORE_DIR", "./exports/assets")
+ASSET_MAX_AGE = float(os.getenv("ASSET_MAX_AGE", 7 * 24 * 3600))
+asset_store = AssetStore(ASSET_STORE_DIR)
+
+# Index d'intervalles des markers de sync, interrogeables par les lecteurs
+MARKER_INDEX_MAX_AGE = float(os.getenv("MARKER_INDEX_MAX_AGE", 24 * 3600))
+marker_indexes = MarkerIndexRegistry(shared_store)
+
+tts_service = LazyService(TTSService)
+animation_service = LazyService(AnimationService)
+epub_generator = LazyService(lambda: EPubGenerator(store=shared_store))
+mobile_generator = LazyService(lambda: MobileGenerator(store=shared_store))
+lottie_previews = LazyService(LottiePreviewRenderer)
+book_pipeline = LazyService(lambda: NarratedBookPipeline(
+    tts_service.get(), animation_service.get(), epub_generator.get(), store=shared_store
+))
+
+services = {
+    "tts": tts_service,
+    "animation": animation_service,
+    "epub": epub_generator,
+    "mobile": mobile_generator,
+    "pipeline": book_pipeline
+}
+
+# Santé calculée en tâche de fond : les sondes (load balancer) lisent un cache
+HEALTH_REFRESH_INTERVAL = float(os.getenv("HEALTH_REFRESH_INTERVAL", 10))
+TTS_PROBE_INTERVAL = float(os.getenv("TTS_PROBE_INTERVAL", 60))
+health_cache: Dict[str, Any] = {}
+readiness = {"started": False, "warmed_up": False}
+
+# Services à précharger au démarrage, ex. "animation,epub" (aucun par défaut)
+WARMUP_SERVICES = [name.strip() for name in os.getenv("WARMUP_SERVICES", "").split(",") if name.strip()]
+
+# Intervalle du nettoyage périodique (tâches, exports, fichiers temporaires)
+RETENTION_SWEEP_INTERVAL = float(os.getenv("RETENTION_SWEEP_INTERVAL", 300))
+background_jobs: List[asyncio.Task] = []
+
+async def run_retention_sweeper():
+    """Boucle d'éviction des tâches et fichiers expirés"""
+    while True:
+        await asyncio.sleep(RETENTION_SWEEP_INTERVAL)
+        try:
+            if epub_generator.loaded:
+                epub_stats = await epub_generator.sweep()
+                if epub_stats["evicted"]:
+                    logger.info(f"Rétention ePub: {epub_stats}")
+            if animation_service.loaded:
+                temp_stats = await asyncio.to_thread(animation_service.sweep_temp_dir)
+                if temp_stats["evicted_files"]:
+                    logger.info(f"Rétention temporaires: {temp_stats}")
+            if mobile_generator.loaded:
+                mobile_stats = await mobile_generator.sweep()
+                if mobile_stats["evicted"]:
+                    logger.info(f"Rétention mobile: {mobile_stats}")
+            if lottie_previews.loaded:
+                evicted_previews = await asyncio.to_thread(lottie_previews.sweep)
+                if evicted_previews:
+                    logger.info(f"Rétention aperçus Lottie: {evicted_previews} supprimés")
+            if book_pipeline.loaded:
+                evicted_pipelines = await book_pipeline.sweep()
+                if evicted_pipelines:
+                    logger.info(f"Rétention pipelines: {evicted_pipelines} supprimés")
+            evicted_indexes = await asyncio.to_thread(marker_indexes.sweep, MARKER_INDEX_MAX_AGE)
+            if evicted_indexes:
+                logger.info(f"Rétention index de markers: {evicted_indexes} supprimés")
+            evicted_assets = await asyncio.to_thread(asset_store.sweep, ASSET_MAX_AGE)
+            if evicted_assets:
+                logger.info(f"Rétention assets: {evicted_assets} supprimés")
+        except Exception as e:
+            logger.error(f"Erreur rétention: {str(e)}")
+
+async def warm_up_services():
+    """Préchargement optionnel des services (imports lourds, compilation JIT)"""
+    for name in WARMUP_SERVICES:
+        try:
+            started = time.perf_counter()
+            service = services[name].get()
+            if hasattr(service, "warm_up"):
+                await asyncio.to_thread(service.warm_up)
+            logger.info(f"Service {name} préchargé en {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Erreur préchargement {name}: {str(e)}")
+    readiness["warmed_up"] = True
+
+async def compute_health() -> Dict:
+    """Rapport de santé complet (services non encore chargés : non construits)"""
+    health_status = {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "services": {
+            "tts": await tts_service.health_check(),
+            **{
+                name: services[name].health_check() if services[name].loaded
+                else {"status": "healthy", "loaded": False}
+                for name in ("animation", "epub", "mobile", "pipeline")
+            }
+        }
+    }
+    
+    all_healthy = all(
+        service["status"] == "healthy" 
+        for service in health_status["services"].values()
+    )
+    
+    if not all_healthy:
+        health_status["status"] = "degraded"
+    
+    health_status["admission"] = {name: limiter.snapshot() for name, limiter in admission_limiters.items()}
+    
+    # Stockage d'assets : occupation relevée par le dernier nettoyage
+    if asset_store.last_usage is None:
+        asset_store.last_usage = await asyncio.to_thread(asset_store.usage)
+    health_status["assets"] = {**asset_store.last_usage, "max_age": ASSET_MAX_AGE}
+    
+    if shared_store:
+        health_status["job_queues"] = {
+            name: await asyncio.to_thread(shared_store.queue(name).depth) for name in job_workers
+        }
+    
+    return health_status
+
+async def run_health_monitor():
+    """Sondage actif des fournisseurs et rafraîchissement du cache de santé.
+    
+    Avec l'état partagé, seul le worker détenteur du bail "tts_probe" sonde les fournisseurs
+    (un sondage par machine, pas un par worker) ; les autres relisent son dernier résultat."""
+    last_probe = None
+    probes_store = shared_store.mapping("health") if shared_store else None
+    while True:
+        try:
+            leader = probes_store is None or await asyncio.to_thread(
+                shared_store.acquire_lease, "tts_probe", WORKER_ID, HEALTH_REFRESH_INTERVAL * 3
+            )
+            if not leader:
+                last_probe = None
+                probes = await asyncio.to_thread(probes_store.get, "tts_probes")
+                if probes is not None:
+                    tts_service.set_provider_health(probes)
+            elif last_probe is None or time.monotonic() - last_probe >= TTS_PROBE_INTERVAL:
+                probes = await tts_service.probe_providers()
+                if probes_store is not None:
+                    await asyncio.to_thread(probes_store.__setitem__, "tts_probes", probes)
+                last_probe = time.monotonic()
+            health_cache["report"] = await compute_health()
+        except Exception as e:
+            logger.error(f"Erreur santé: {str(e)}")
+        await asyncio.sleep(HEALTH_REFRESH_INTERVAL)
+
+# Publication des métriques de chaque worker dans l'état partagé (voir /api/metrics)
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", 15))
+
+def _publish_metrics():
+    shared_store.mapping("metrics")[WORKER_ID] = {"updated_at": time.time(), "samples": REGISTRY.snapshot(WORKER_ID)}
+
+async def run_metrics_publisher():
+    """Relevé périodique des métriques de ce worker ; les relevés des workers arrêtés
+    (recyclage, arrêt brutal) sont supprimés"""
+    metrics_store = shared_store.mapping("metrics")
+    while True:
+        try:
+            await asyncio.to_thread(_publish_metrics)
+            cutoff = time.time() - METRICS_PUBLISH_INTERVAL * 10
+            for worker_id, row in await asyncio.to_thread(metrics_store.items):
+                if row["updated_at"] < cutoff:
+                    await asyncio.to_thread(metrics_store.pop, worker_id, None)
+        except Exception as e:
+            logger.error(f"Erreur publication métriques: {str(e)}")
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+
+@app.on_event("startup")
+async def start_background_jobs():
+    """Démarrage des tâches de fond"""
+    background_jobs.append(asyncio.create_task(run_retention_sweeper()))
+    background_jobs.append(asyncio.create_task(run_health_monitor()))
+    if WARMUP_SERVICES:
+        background_jobs.append(asyncio.create_task(warm_up_services()))
+    else:
+        readiness["warmed_up"] = True
+    
+    # Consommateur de la file partagée : n'importe quel worker exécute les exports
+    if shared_store:
+        job_workers["epub"] = JobWorker(
+            shared_store.queue("epub"),
+            lambda payload: epub_generator.generate_async(**payload),
+            concurrency=JOB_CONCURRENCY
+        )
+        job_workers["mobile"] = JobWorker(
+            shared_store.queue("mobile"),
+            lambda payload: mobile_generator.generate_react_native_app(**payload),
+            concurrency=JOB_CONCURRENCY
+        )
+        job_workers["pipeline"] = JobWorker(
+            shared_store.queue("pipeline"),
+            lambda payload: book_pipeline.run(payload["pipeline_id"]),
+            concurrency=JOB_CONCURRENCY
+        )
+        for worker in job_workers.values():
+            background_jobs.append(asyncio.create_task(worker.run()))
+        background_jobs.append(asyncio.create_task(run_metrics_publisher()))
+    
+    readiness["started"] = True
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    """Arrêt des tâches de fond et nettoyage"""
+    readiness["started"] = False
+    
+    # Jobs en cours : attendus, puis remis en file pour un autre worker
+    for worker in job_workers.values():
+        await worker.stop(JOB_SHUTDOWN_TIMEOUT)
+    for job in background_jobs:
+        job.cancel()
+    if shared_store:
+        await asyncio.to_thread(shared_store.release_lease, "tts_probe", WORKER_ID)
+        await asyncio.to_thread(shared_store.mapping("metrics").pop, WORKER_ID, None)
+    if animation_service.loaded:
+        animation_service.close()
 
 # ===== MODÈLES PYDANTIC =====
 class TTSRequest(BaseModel):
@@ -53,6 +404,7 @@ class TTSRequest(BaseModel):
     speed: float = 1.0
     format: str = "mp3"
     quality: str = "high"
+    timestamps: bool = False
 
 class AnimationRequest(BaseModel):
     type: str  # "lottie", "css", "video"
@@ -62,6 +414,13 @@ class AnimationRequest(BaseModel):
     width: int = 1920
     height: int = 1080
 
+class LottiePreviewRequest(BaseModel):
+    lottie_data: Dict[str, Any]
+    frames: Optional[List[float]] = None  # images explicites, sinon `count` réparties sur la durée
+    count: int = 1
+    width: int = 320
+    background: Optional[str] = None
+
 class EPubRequest(BaseModel):
     title: str
     author: str
@@ -70,8 +429,26 @@ class EPubRequest(BaseModel):
     audio_files: List[str] = []
     metadata: Dict[str, Any] = {}
 
+class BookPipelineRequest(EPubRequest):
+    voice: str = "alloy"
+    language: str = "fr"
+    speed: float = 1.0
+    format: str = "mp3"
+    quality: str = "standard"
+    narrate: bool = True
+    # Silence (s) entre deux segments TTS d'un chapitre
+    chunk_pause: float = Field(0.0, ge=0)
+
+class MobileRequest(BaseModel):
+    project_name: str
+    content: List[Dict[str, Any]]
+    animations: List[Dict[str, Any]] = []
+
 class SyncRequest(BaseModel):
-    audio_file: str
+    audio_file: Optional[str] = None
+    audio_asset_id: Optional[str] = None
+    # Horodatage par mot (réponse TTS avec timestamps) : remplace l'analyse de l'audio
+    word_timings: Optional[List[Dict[str, Any]]] = None
     animations: List[Dict[str, Any]]
     timeline: List[Dict[str, Any]]
 
@@ -89,18 +466,22 @@ async def synthesize_speech(request: TTSRequest):
             language=request.language,
             speed=request.speed,
             format=request.format,
-            quality=request.quality
+            quality=request.quality,
+            timestamps=request.timestamps
         )
         
         if audio_data["success"]:
-            return {
+            response = {
                 "success": True,
                 "audio_data": audio_data["data"],
-                "format": request.format,
+                "format": audio_data.get("format", request.format),
                 "duration": audio_data.get("duration", 0),
                 "file_size": len(audio_data["data"]),
                 "metadata": audio_data.get("metadata", {})
             }
+            if "words" in audio_data:
+                response["words"] = audio_data["words"]
+            return response
         else:
             raise HTTPException(status_code=500, detail=audio_data["error"])
             
@@ -110,11 +491,14 @@ async def synthesize_speech(request: TTSRequest):
 
 @app.post("/api/tts/batch")
 async def batch_synthesize(texts: List[str], voice: str = "alloy"):
-    """Synthèse en lot pour plusieurs textes"""
+    """Synthèse en lot pour plusieurs textes (priorité "bulk" : places libres uniquement,
+    les aperçus interactifs restent servis pendant les exports)"""
     try:
         results = []
-        for i, text in enumerate(texts):
-            audio_data = await tts_service.synthesize(text=text, voice=voice)
+        synthesized = await asyncio.gather(*(
+            tts_service.synthesize(text=text, voice=voice, priority="bulk") for text in texts
+        ))
+        for i, audio_data in enumerate(synthesized):
             if audio_data["success"]:
                 results.append({
                     "index": i,
@@ -158,72 +542,434 @@ async def generate_animation(request: AnimationRequest):
 @app.post("/api/animations/lottie")
 async def create_lottie_animation(
     elements: List[Dict[str, Any]],
+    request: Request,
     duration: int = 3000,
     fps: int = 30
 ):
     """Création d'animation Lottie personnalisée"""
     try:
+        accept_encoding = request.headers.get("accept-encoding")
+        cache_key = lottie_cache.key(elements, duration, fps)
+        cached = await lottie_cache.lookup(cache_key, accept_encoding)
+        if cached:
+            return cached
+        
         lottie_data = await animation_service.create_lottie(
             elements=elements,
             duration=duration,
             fps=fps
         )
         
-        return {
+        result = {
             "success": True,
             "lottie_data": lottie_data,
             "format": "lottie",
             "duration": duration,
             "fps": fps
         }
+        if lottie_data.get("success") is False:
+            return result
+        return await lottie_cache.store(cache_key, result, accept_encoding)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _preview_response(preview: Dict, request: Request) -> Response:
+    """PNG d'un aperçu (immuable : identifiant dérivé du contenu), grille décrite en en-têtes"""
+    meta = preview["meta"]
+    headers = {
+        "ETag": f'"{preview["id"]}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "X-Preview-Id": preview["id"],
+        "X-Preview-Frames": ",".join(f"{frame:g}" for frame in meta["frames"]),
+        "X-Preview-Grid": f"{meta['columns']}x{meta['rows']}",
+        "X-Preview-Frame-Size": f"{meta['frame_width']}x{meta['frame_height']}"
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(preview["path"], media_type="image/png", headers=headers)
+
+@app.post("/api/animations/lottie/preview")
+async def render_lottie_preview(preview_request: LottiePreviewRequest, request: Request):
+    """Vignette PNG (une image) ou planche de sprites (plusieurs) d'une animation Lottie"""
+    try:
+        preview = await asyncio.to_thread(
+            lottie_previews.render, preview_request.lottie_data, preview_request.frames,
+            preview_request.count, preview_request.width, preview_request.background
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return _preview_response(preview, request)
+
+@app.get("/api/animations/lottie/preview/{preview_id}")
+async def get_lottie_preview(preview_id: str, request: Request):
+    """Aperçu déjà rendu, servi depuis le cache sans nouveau rendu"""
+    preview = await asyncio.to_thread(lottie_previews.cached, preview_id)
+    if preview is None:
+        raise HTTPException(status_code=404, detail="Aperçu non trouvé")
+    return _preview_response(preview, request)
+
 @app.post("/api/animations/css")
 async def generate_css_animation(
     properties: Dict[str, Any],
     keyframes: List[Dict[str, Any]],
     duration: int = 2000
 ):
-    """Génération d'animations CSS"""
+    """Génération d'animations CSS (properties : name, easing, delay, iteration_count...)"""
+    result = animation_service.generate_css_animation({**properties, "keyframes": keyframes}, duration)
+    if not result["success"]:
+        raise HTTPException(status_code=422, detail=result["error"])
+    return result
+
+@app.post("/api/animations/css/batch")
+async def generate_css_batch(animations: List[Dict[str, Any]], duration: int = 2000):
+    """Feuille de style minifiée d'un lot d'animations CSS (@keyframes identiques émises une fois)"""
+    result = animation_service.generate_css_batch(animations, duration)
+    if not result["success"]:
+        raise HTTPException(status_code=422, detail=result["error"])
+    return result
+
+# ===== UPLOADS (SPOOL SUR DISQUE) =====
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or tempfile.gettempdir()
+
+async def _receive_upload(request: Request, spool_dir: str = UPLOAD_SPOOL_DIR) -> Tuple[Dict[str, str], Optional[Dict]]:
+    """Corps multipart lu directement depuis le flux de la requête (voir MultipartSpool) :
+    champs texte et fichier `file` écrit dans le spool, plafond vérifié à chaque bloc reçu ;
+    l'appelant supprime upload["path"] après usage"""
     try:
-        css_code = animation_service.generate_css_animation(
-            properties=properties,
-            keyframes=keyframes,
-            duration=duration
+        return await MultipartSpool(spool_dir, UPLOAD_MAX_BYTES).receive(
+            request.headers.get("content-type", ""), request.stream()
         )
-        
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        # MultipartError ou corps mal formé (erreurs du parseur python-multipart)
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _asset_path(asset_id: str) -> str:
+    """Chemin d'un asset déjà envoyé (404 si inconnu)"""
+    path = asset_store.path(asset_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Asset inconnu: {asset_id}")
+    return path
+
+def _resolve_media_ref(value: Any) -> Any:
+    """Référence média d'une requête : "asset:<id>" remplacée par le chemin du blob, URL http(s)
+    conservée ; tout autre chemin est refusé (les fichiers du serveur ne sont jamais lus)"""
+    if value is None or value == "" or is_remote(value):
+        return value
+    if not isinstance(value, str) or not value.startswith(ASSET_REF_PREFIX):
+        raise HTTPException(
+            status_code=422,
+            detail=f"Média non autorisé: {value!r} (référence asset:<id> ou URL http(s) attendue)"
+        )
+    return asset_store.resolve(value)
+
+def _resolve_asset_refs(request: Dict) -> Dict:
+    """Remplacement des références "asset:<id>" d'une requête (ePub, mobile) par les chemins locaux"""
+    try:
+        resolved = {
+            **request,
+            "content": [
+                {key: _resolve_media_ref(value) if key in MEDIA_KEYS else value
+                 for key, value in item.items()}
+                for item in request["content"]
+            ]
+        }
+        if "audio_files" in request:
+            resolved["audio_files"] = [_resolve_media_ref(path) for path in request["audio_files"]]
+        return resolved
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Asset inconnu: {e.args[0]}")
+
+# ===== ROUTES ASSETS =====
+@app.post("/api/assets")
+async def upload_asset(request: Request):
+    """Envoi d'un fichier (multipart, champ `file`) une seule fois ; renvoie son ID (SHA-256 du contenu)"""
+    _, upload = await _receive_upload(request, spool_dir=str(asset_store.tmp_dir))
+    if upload is None:
+        raise HTTPException(status_code=422, detail="Champ fichier 'file' manquant")
+    info = await asyncio.to_thread(
+        asset_store.put_spooled, upload["path"], upload["sha256"], upload["size"],
+        upload["filename"], upload["content_type"]
+    )
+    
+    return {
+        "success": True,
+        "asset_id": info["asset_id"],
+        "size": info["size"],
+        "created": info["created"],
+        "reference": f"asset:{info['asset_id']}"
+    }
+
+@app.post("/api/assets/dedupe")
+async def dedupe_assets(asset_ids: List[str]):
+    """Parmi des SHA-256 calculés côté client, ceux qu'il reste à envoyer"""
+    present = [asset_id for asset_id in asset_ids if asset_store.info(asset_id)]
+    return {
+        "present": present,
+        "missing": [asset_id for asset_id in asset_ids if asset_id not in present]
+    }
+
+@app.head("/api/assets/{asset_id}")
+async def head_asset(asset_id: str):
+    """Existence d'un asset (sans transfert)"""
+    info = asset_store.info(asset_id)
+    if not info:
+        return Response(status_code=404)
+    return Response(headers={
+        "Content-Length": str(info["size"]),
+        "ETag": f'"{asset_id}"',
+        "Content-Type": info.get("content_type") or "application/octet-stream"
+    })
+
+@app.get("/api/assets/{asset_id}")
+async def download_asset(asset_id: str, request: Request):
+    """Téléchargement d'un asset (reprise via Range)"""
+    info = asset_store.info(asset_id)
+    path = asset_store.path(asset_id, touch=False) if info else None
+    if not path:
+        raise HTTPException(status_code=404, detail="Asset non trouvé")
+    
+    return _ranged_file_response(
+        request,
+        path,
+        filename=info.get("filename") or asset_id,
+        media_type=info.get("content_type") or "application/octet-stream",
+        etag=asset_id
+    )
+
+# ===== ENCODAGE COMPACT DES ANALYSES =====
+COMPACT_MEDIA_TYPE = "application/octet-stream"
+
+def _compact_options(request: Request) -> Optional[Dict]:
+    """Options d'encodage compact des séries (paramètres de requête) ; None : tableaux JSON habituels.
+
+    compact=float32|delta16, max_points (par série), min_interval_ms (onsets), max_segments ;
+    réponse binaire jaza/1 si Accept contient application/octet-stream, sinon base64 dans le JSON."""
+    params = request.query_params
+    encoding = params.get("compact")
+    if not encoding:
+        return None
+    if encoding not in COMPACT_ENCODINGS:
+        raise HTTPException(status_code=422,
+                            detail=f"compact doit valoir {' ou '.join(COMPACT_ENCODINGS)}")
+    try:
         return {
-            "success": True,
-            "css_code": css_code,
-            "format": "css",
-            "duration": duration
+            "encoding": encoding,
+            "max_points": int(params.get("max_points") or 0) or None,
+            "min_interval": float(params.get("min_interval_ms") or 0) / 1000 or None,
+            "max_segments": int(params.get("max_segments") or 0) or None,
+            "binary": COMPACT_MEDIA_TYPE in request.headers.get("accept", "")
         }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Paramètres de décimation invalides")
+
+def _compact_payload(analysis: Dict, options: Dict, fields: Dict) -> Tuple[Any, str]:
+    """Corps de réponse compact et son type : conteneur binaire (fields dans les métadonnées)
+    ou JSON reprenant fields avec le conteneur en base64"""
+    with STAGE_LATENCY.labels("animation", "compact").time():
+        packed = pack_analysis(
+            analysis, options["encoding"], max_points=options["max_points"],
+            min_interval=options["min_interval"], max_segments=options["max_segments"],
+            meta=fields if options["binary"] else None
+        )
+    if options["binary"]:
+        return packed, COMPACT_MEDIA_TYPE
+    return {**fields, "compact": {
+        "schema": COMPACT_SCHEMA,
+        "encoding": options["encoding"],
+        "packed": base64.b64encode(packed).decode("ascii")
+    }}, "application/json"
 
 # ===== ROUTES SYNCHRONISATION =====
 @app.post("/api/sync/audio-animation")
-async def sync_audio_animation(request: SyncRequest):
-    """Synchronisation audio et animations"""
+async def sync_audio_animation(request: Request):
+    """Synchronisation audio et animations.
+    
+    JSON (SyncRequest : audio en base64, `audio_asset_id` ou `word_timings`) ou multipart :
+    champ fichier `file` (ou champ `asset_id`), champs `animations` et `timeline` en JSON.
+    Séries de l'analyse encodables en jaza/1 (voir _compact_options)."""
+    audio_path = None
+    spooled = None
+    compact = _compact_options(request)
     try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            fields, upload = await _receive_upload(request)
+            spooled = upload and upload["path"]
+            sync_request = SyncRequest(
+                audio_asset_id=fields.get("asset_id"),
+                animations=json.loads(fields.get("animations") or "[]"),
+                timeline=json.loads(fields.get("timeline") or "[]")
+            )
+            if upload:
+                audio_path = spooled
+            elif not sync_request.audio_asset_id:
+                raise HTTPException(status_code=422, detail="Champ fichier 'file' ou 'asset_id' manquant")
+        else:
+            sync_request = SyncRequest(**await request.json())
+            if not (sync_request.audio_file or sync_request.audio_asset_id or sync_request.word_timings):
+                raise HTTPException(status_code=422,
+                                    detail="'audio_file', 'audio_asset_id' ou 'word_timings' requis")
+        
+        if sync_request.audio_asset_id and not sync_request.word_timings:
+            audio_path = _asset_path(sync_request.audio_asset_id)
+        
         sync_data = await animation_service.sync_with_audio(
-            audio_file=request.audio_file,
-            animations=request.animations,
-            timeline=request.timeline
+            audio_file=sync_request.audio_file,
+            animations=sync_request.animations,
+            timeline=sync_request.timeline,
+            audio_path=audio_path,
+            word_timings=sync_request.word_timings
         )
         
+        marker_index = None
+        if sync_data.get("markers"):
+            index = MarkerIndex.build(sync_data["markers"], sync_request.animations,
+                                      duration=(sync_data.get("sync_data") or {}).get("duration"))
+            marker_index = {"id": await asyncio.to_thread(marker_indexes.register, index),
+                            "intervals": len(index)}
+        
+        if compact and sync_data.get("success"):
+            payload, media_type = _compact_payload(sync_data["sync_data"], compact, {
+                "success": True,
+                "timeline": sync_data.get("timeline", []),
+                "markers": sync_data.get("markers", []),
+                "marker_index": marker_index
+            })
+            # Binaire ou JSON selon Accept : à signaler aux caches
+            if media_type == COMPACT_MEDIA_TYPE:
+                return Response(content=payload, media_type=media_type, headers={"Vary": "Accept"})
+            return JSONResponse(payload, headers={"Vary": "Accept"})
+        
         return {
             "success": True,
             "sync_data": sync_data,
             "timeline": sync_data.get("timeline", []),
-            "markers": sync_data.get("markers", [])
+            "markers": sync_data.get("markers", []),
+            "marker_index": marker_index
         }
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # Corps JSON ou champs multipart invalides
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if spooled:
+            os.remove(spooled)
+
+def _marker_index(index_id: str) -> MarkerIndex:
+    """Index de markers enregistré (404 si inconnu ou expiré)"""
+    index = marker_indexes.get(index_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Index de markers non trouvé")
+    return index
+
+@app.get("/api/sync/markers/{index_id}")
+async def get_marker_table(index_id: str):
+    """Table triée complète, pour une recherche côté lecteur (identifiant dérivé du contenu : immuable)"""
+    index = await asyncio.to_thread(_marker_index, index_id)
+    return Response(
+        content=json.dumps(index.to_table(), separators=(",", ":")),
+        media_type="application/json",
+        headers={"ETag": f'"{index_id}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+@app.get("/api/sync/markers/{index_id}/at")
+async def query_markers_at(index_id: str, t: float):
+    """Animations actives à l'instant t (secondes)"""
+    index = await asyncio.to_thread(_marker_index, index_id)
+    return {"time": t, "active": index.at(t)}
+
+@app.get("/api/sync/markers/{index_id}/range")
+async def query_markers_range(index_id: str, start: float, end: float):
+    """Animations actives sur tout ou partie de [start, end)"""
+    if end < start:
+        raise HTTPException(status_code=422, detail="end doit être supérieur ou égal à start")
+    index = await asyncio.to_thread(_marker_index, index_id)
+    return {"start": start, "end": end, "markers": index.between(start, end)}
+
+# ===== TÉLÉCHARGEMENTS (RANGE / ETAG) =====
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+def _parse_byte_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """Analyse d'un en-tête Range à plage unique (bornes incluses)"""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        # Plages multiples non gérées : réponse complète, autorisé par la RFC 9110
+        return None
+    
+    start, _, end = spec.strip().partition("-")
+    if not start:
+        # Suffixe : les N derniers octets
+        length = int(end)
+        if length <= 0:
+            raise ValueError("Plage vide")
+        return max(file_size - length, 0), file_size - 1
+    
+    first = int(start)
+    last = min(int(end), file_size - 1) if end else file_size - 1
+    if first >= file_size or first > last:
+        raise ValueError("Plage hors limites")
+    return first, last
+
+def _iter_file_range(file_path: str, start: int, end: int):
+    """Lecture par blocs d'une portion de fichier"""
+    with open(file_path, "rb") as source:
+        source.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = source.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _ranged_file_response(request: Request, file_path: str, filename: str,
+                          media_type: str, etag: Optional[str]) -> Response:
+    """Réponse fichier avec reprise (Range), ETag fort et GET conditionnel"""
+    stat = os.stat(file_path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Last-Modified": datetime.fromtimestamp(stat.st_mtime, timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")
+    }
+    if etag:
+        headers["ETag"] = f'"{etag}"'
+        if_none_match = request.headers.get("if-none-match", "")
+        # Comparaison faible : le client peut renvoyer l'ETag W/ d'une variante compressée
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        if if_none_match.strip() == "*" or headers["ETag"] in tags:
+            return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or (etag and if_range.strip() == f'"{etag}"')):
+        try:
+            byte_range = _parse_byte_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+        
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _iter_file_range(file_path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers=headers
+            )
+    
+    headers["Content-Length"] = str(stat.st_size)
+    return StreamingResponse(
+        _iter_file_range(file_path, 0, stat.st_size - 1),
+        media_type=media_type,
+        headers=headers
+    )
 
 # ===== ROUTES GÉNÉRATION EPUB =====
 @app.post("/api/export/epub")
@@ -232,27 +978,63 @@ async def generate_epub(request: EPubRequest, background_tasks: BackgroundTasks)
     try:
         logger.info(f"Génération ePub: {request.title}")
         
-        # Génération en arrière-plan
-        task_id = f"epub_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # Références "asset:<id>" remplacées par les fichiers déjà envoyés
+        epub_request = _resolve_asset_refs(request.dict())
+        document = Document.parse(epub_request["content"], epub_request["animations"])
         
-        background_tasks.add_task(
-            epub_generator.generate_async,
-            task_id=task_id,
-            title=request.title,
-            author=request.author,
-            content=request.content,
-            animations=request.animations,
-            audio_files=request.audio_files,
-            metadata=request.metadata
-        )
+        # Réutilisation d'un ePub identique déjà généré (ou en cours de génération)
+        fingerprint = epub_generator.request_fingerprint(epub_request)
+        existing = epub_generator.find_task_by_fingerprint(fingerprint)
+        if existing:
+            logger.info(f"ePub réutilisé: {existing}")
+            return {
+                "success": True,
+                "task_id": existing,
+                "status": epub_generator.get_task_status(existing)["status"],
+                "reused": True
+            }
+        
+        # Contre-pression : la génération elle-même est asynchrone, on borne donc le
+        # nombre de générations en attente ou en cours plutôt que la durée de la requête
+        backlog = epub_generator.backlog()
+        if backlog >= EXPORT_MAX_BACKLOG:
+            raise admission_limiters["export"].reject("backlog_full", retry_after=EXPORT_RETRY_AFTER)
+        
+        # Génération en arrière-plan (suffixe aléatoire : plusieurs workers par seconde)
+        task_id = f"epub_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        job = {
+            "task_id": task_id,
+            "title": epub_request["title"],
+            "author": epub_request["author"],
+            "content": epub_request["content"],
+            "animations": epub_request["animations"],
+            "audio_files": epub_request["audio_files"],
+            "metadata": epub_request["metadata"],
+            "fingerprint": fingerprint
+        }
+        
+        # Tâche et empreinte enregistrées avant toute exécution : une requête identique
+        # arrivant avant le démarrage de la génération la réutilise
+        epub_generator.mark_queued(task_id, fingerprint)
+        if shared_store:
+            shared_store.queue("epub").put(task_id, job)
+            status = "queued"
+        else:
+            # Même processus : le document validé est transmis tel quel
+            background_tasks.add_task(epub_generator.generate_async, **{**job, "content": document})
+            status = "processing"
         
         return {
             "success": True,
             "task_id": task_id,
-            "status": "processing",
+            "status": status,
             "estimated_time": "2-5 minutes"
         }
         
+    except (AdmissionRejected, HTTPException):
+        raise
+    except DocumentError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -262,73 +1044,224 @@ async def get_epub_status(task_id: str):
     status = epub_generator.get_task_status(task_id)
     return status
 
+@app.get("/api/export/epub/events/{task_id}")
+async def stream_epub_events(task_id: str):
+    """Progression ePub poussée en Server-Sent Events (remplace le polling du statut)"""
+    return StreamingResponse(
+        epub_generator.stream_events(task_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/export/epub/download/{task_id}")
-async def download_epub(task_id: str):
-    """Téléchargement du fichier ePub généré"""
+async def download_epub(task_id: str, request: Request):
+    """Téléchargement du fichier ePub généré (reprise via Range)"""
     file_path = epub_generator.get_generated_file(task_id)
     if not file_path or not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Fichier non trouvé")
     
-    return FileResponse(
-        path=file_path,
+    return _ranged_file_response(
+        request,
+        file_path,
         filename=f"{task_id}.epub",
-        media_type="application/epub+zip"
+        media_type="application/epub+zip",
+        etag=epub_generator.get_task_status(task_id).get("sha256")
     )
 
+# ===== ROUTES PIPELINE LIVRE NARRÉ =====
+def _start_pipeline(pipeline_id: str, background_tasks: BackgroundTasks) -> str:
+    """Exécution par la file partagée (multi-workers) ou en tâche de fond locale"""
+    if shared_store:
+        shared_store.queue("pipeline").put(f"{pipeline_id}_{uuid.uuid4().hex[:6]}", {"pipeline_id": pipeline_id})
+        return "queued"
+    background_tasks.add_task(book_pipeline.run, pipeline_id)
+    return "processing"
+
+def _pipeline_backlog() -> int:
+    """Exports ePub et pipelines en attente ou en cours"""
+    return epub_generator.backlog() + book_pipeline.backlog()
+
+@app.post("/api/pipeline/book")
+async def create_book_pipeline(request: BookPipelineRequest, background_tasks: BackgroundTasks):
+    """Livre narré complet (TTS, synchronisation, animations, ePub) en une requête.
+    
+    Les animations avec une clé `generate` ({type, content, duration, fps}) sont générées ;
+    les références "asset:<id>" sont acceptées comme pour /api/export/epub."""
+    try:
+        # Pipelines en attente ou en cours compris : leurs étapes TTS et de synchronisation
+        # précèdent l'export ePub
+        if _pipeline_backlog() >= EXPORT_MAX_BACKLOG:
+            raise admission_limiters["export"].reject("backlog_full", retry_after=EXPORT_RETRY_AFTER)
+        
+        epub_fields = set(EPubRequest.__fields__)
+        payload = request.dict()
+        epub_request = _resolve_asset_refs({k: v for k, v in payload.items() if k in epub_fields})
+        options = {k: v for k, v in payload.items() if k not in epub_fields}
+        
+        pipeline_id = f"book_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        record = book_pipeline.create(pipeline_id, epub_request, options)
+        status = _start_pipeline(pipeline_id, background_tasks)
+        
+        return {
+            "success": True,
+            "pipeline_id": pipeline_id,
+            "status": status,
+            "stages": list(record["stages"])
+        }
+        
+    except (AdmissionRejected, HTTPException):
+        raise
+    except DocumentError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/pipeline/book/{pipeline_id}")
+async def get_book_pipeline(pipeline_id: str):
+    """Progression par étape du pipeline"""
+    status = book_pipeline.get_status(pipeline_id)
+    if status["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Pipeline non trouvé")
+    return status
+
+@app.post("/api/pipeline/book/{pipeline_id}/resume")
+async def resume_book_pipeline(pipeline_id: str, background_tasks: BackgroundTasks):
+    """Reprise après échec ou interruption : seules les étapes non terminées (et leurs
+    dépendants) sont réexécutées"""
+    status = book_pipeline.get_status(pipeline_id)
+    if status["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Pipeline non trouvé")
+    if not book_pipeline.resumable(pipeline_id):
+        raise HTTPException(status_code=409, detail=f"Pipeline {status['status']}, reprise impossible")
+    # Une reprise relance l'assemblage ePub : même contre-pression qu'une création (chemin
+    # paramétré, hors du middleware d'admission : réponse 429 construite ici)
+    if _pipeline_backlog() >= EXPORT_MAX_BACKLOG:
+        return _too_many_requests(
+            admission_limiters["export"].reject("backlog_full", retry_after=EXPORT_RETRY_AFTER)
+        )
+    
+    pending_stages = book_pipeline.mark_queued(pipeline_id)
+    return {
+        "success": True,
+        "pipeline_id": pipeline_id,
+        "status": _start_pipeline(pipeline_id, background_tasks),
+        "pending_stages": pending_stages
+    }
+
 # ===== ROUTES MOBILE =====
 @app.post("/api/export/mobile")
-async def generate_mobile_app(
-    project_name: str,
-    content: List[Dict[str, Any]],
-    animations: List[Dict[str, Any]] = [],
-    background_tasks: BackgroundTasks = None
-):
-    """Génération d'application mobile React Native"""
+async def generate_mobile_app(request: MobileRequest, background_tasks: BackgroundTasks):
+    """Génération d'application mobile React Native (archive zip du projet Expo)"""
     try:
-        task_id = f"mobile_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
-        background_tasks.add_task(
-            mobile_generator.generate_react_native_app,
-            task_id=task_id,
-            project_name=project_name,
-            content=content,
-            animations=animations
-        )
+        logger.info(f"Génération mobile: {request.project_name}")
+        
+        mobile_request = _resolve_asset_refs(request.dict())
+        document = Document.parse(mobile_request["content"], mobile_request["animations"])
+        
+        # Réutilisation d'un projet identique déjà généré (ou en cours de génération)
+        fingerprint = mobile_generator.request_fingerprint(mobile_request)
+        existing = mobile_generator.find_task_by_fingerprint(fingerprint)
+        if existing:
+            logger.info(f"Projet mobile réutilisé: {existing}")
+            return {
+                "success": True,
+                "task_id": existing,
+                "status": mobile_generator.get_task_status(existing)["status"],
+                "reused": True
+            }
+        
+        # Contre-pression, comme pour /api/export/epub
+        if mobile_generator.backlog() >= EXPORT_MAX_BACKLOG:
+            raise admission_limiters["export"].reject("backlog_full", retry_after=EXPORT_RETRY_AFTER)
+        
+        task_id = f"mobile_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        job = {
+            "task_id": task_id,
+            "project_name": mobile_request["project_name"],
+            "content": mobile_request["content"],
+            "animations": mobile_request["animations"],
+            "fingerprint": fingerprint
+        }
+        
+        mobile_generator.mark_queued(task_id, fingerprint)
+        if shared_store:
+            shared_store.queue("mobile").put(task_id, job)
+            status = "queued"
+        else:
+            background_tasks.add_task(mobile_generator.generate_react_native_app, **{**job, "content": document})
+            status = "processing"
         
         return {
             "success": True,
             "task_id": task_id,
-            "status": "processing",
-            "estimated_time": "5-10 minutes"
+            "status": status,
+            "estimated_time": "moins d'une minute"
         }
         
+    except (AdmissionRejected, HTTPException):
+        raise
+    except DocumentError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/export/mobile/status/{task_id}")
+async def get_mobile_status(task_id: str):
+    """Statut de génération du projet mobile"""
+    return mobile_generator.get_task_status(task_id)
+
+@app.get("/api/export/mobile/download/{task_id}")
+async def download_mobile_app(task_id: str, request: Request):
+    """Téléchargement de l'archive du projet (reprise via Range)"""
+    file_path = mobile_generator.get_generated_file(task_id)
+    if not file_path or not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+    
+    return _ranged_file_response(
+        request,
+        file_path,
+        filename=f"{task_id}.zip",
+        media_type="application/zip",
+        etag=mobile_generator.get_task_status(task_id).get("sha256")
+    )
+
 # ===== ROUTES UTILITAIRES =====
 @app.get("/api/health")
 async def health_check():
-    """Vérification santé des services"""
-    health_status = {
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "services": {
-            "tts": await tts_service.health_check(),
-            "animation": animation_service.health_check(),
-            "epub": epub_generator.health_check(),
-            "mobile": mobile_generator.health_check()
-        }
-    }
-    
-    all_healthy = all(
-        service["status"] == "healthy" 
-        for service in health_status["services"].values()
+    """Vérification santé des services (rapport mis en cache par run_health_monitor)"""
+    if "report" not in health_cache:
+        health_cache["report"] = await compute_health()
+    return health_cache["report"]
+
+@app.get("/api/health/live")
+async def liveness():
+    """Liveness : le processus répond (temps constant)"""
+    return {"status": "alive"}
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    """Readiness : démarrage et préchargement terminés (temps constant)"""
+    if readiness["started"] and readiness["warmed_up"]:
+        return {"status": "ready"}
+    return Response(
+        content=json.dumps({"status": "starting", **readiness}),
+        status_code=503,
+        media_type="application/json"
     )
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Métriques au format d'exposition Prometheus.
     
-    if not all_healthy:
-        health_status["status"] = "degraded"
-    
-    return health_status
+    Les métriques sont propres à chaque processus : avec l'état partagé, la réponse regroupe
+    les derniers relevés publiés par tous les workers, chacun sous son label worker."""
+    if not shared_store:
+        return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+    await asyncio.to_thread(_publish_metrics)
+    rows = await asyncio.to_thread(shared_store.mapping("metrics").values)
+    cutoff = time.time() - METRICS_PUBLISH_INTERVAL * 3
+    snapshots = [row["samples"] for row in rows if row["updated_at"] >= cutoff]
+    return Response(content=REGISTRY.render_snapshots(snapshots), media_type=CONTENT_TYPE)
 
 @app.get("/api/voices")
 async def get_available_voices():
@@ -337,23 +1270,55 @@ async def get_available_voices():
     return {"voices": voices}
 
 @app.post("/api/analyze/audio")
-async def analyze_audio(file: UploadFile = File(...)):
-    """Analyse d'un fichier audio pour synchronisation"""
+async def analyze_audio(request: Request):
+    """Analyse d'un fichier audio pour synchronisation : multipart (champ fichier `file`)
+    ou champ `asset_id` d'un asset existant. Séries encodables en jaza/1 (voir _compact_options)."""
+    compact = _compact_options(request)
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        fields, upload = await _receive_upload(request)
+    else:
+        fields, upload = dict(await request.form()), None
+    if upload:
+        audio_path, content_hash, spooled = upload["path"], upload["sha256"], upload["path"]
+    elif fields.get("asset_id"):
+        asset_id = fields["asset_id"]
+        audio_path, content_hash, spooled = _asset_path(asset_id), asset_id, None
+    else:
+        raise HTTPException(status_code=422, detail="Champ 'file' ou 'asset_id' requis")
     try:
-        content = await file.read()
-        analysis = await animation_service.analyze_audio(content)
+        # Même contenu audio, même analyse : réponse resservie sans recalcul ni recompression
+        accept_encoding = request.headers.get("accept-encoding")
+        cache_key = content_hash if compact is None else analysis_cache.key(content_hash, compact)
+        # Encodage compact : binaire ou JSON selon Accept (compris dans la clé)
+        vary = ("Accept",) if compact else ()
+        cached = await analysis_cache.lookup(cache_key, accept_encoding, vary)
+        if cached:
+            return cached
         
-        return {
+        analysis = await animation_service.analyze_audio(audio_path)
+        
+        if compact:
+            payload, media_type = _compact_payload(analysis, compact, {
+                "success": True,
+                "duration": analysis.get("duration", 0),
+                "tempo": analysis.get("tempo", 120)
+            })
+            return await analysis_cache.store(cache_key, payload, accept_encoding, media_type, vary)
+        
+        return await analysis_cache.store(content_hash, {
             "success": True,
             "analysis": analysis,
             "duration": analysis.get("duration", 0),
             "tempo": analysis.get("tempo", 120),
             "beats": analysis.get("beats", []),
             "segments": analysis.get("segments", [])
-        }
+        }, accept_encoding)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if spooled:
+            os.remove(spooled)
 
 # ===== TTS_SERVICE.PY =====
 import aiohttp
@@ -362,6 +1327,11 @@ from typing import Dict, List, Optional
 import base64
 import tempfile
 import os
+import time
+from datetime import datetime
+from metrics import STAGE_LATENCY, STAGE_ERRORS, SERVICE_IN_FLIGHT
+from tts_scheduler import PriorityScheduler, INTERACTIVE
+from rate_limiter import RateLimitRegistry, RateLimited, QuotaWaitExceeded
 
 class TTSService:
     def __init__(self):
@@ -369,31 +1339,102 @@ class TTSService:
         self.azure_key = os.getenv("AZURE_SPEECH_KEY")
         self.azure_region = os.getenv("AZURE_SPEECH_REGION")
         self.openai_key = os.getenv("OPENAI_API_KEY")
+        # URLs des fournisseurs surchargeables (serveurs simulés des tests de charge)
+        self.elevenlabs_url = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io").rstrip("/")
+        self.openai_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com").rstrip("/")
+        # Sans région ni URL explicite, Azure n'est pas configuré (pas d'appel vers https://None...)
+        self.azure_url = os.getenv(
+            "AZURE_TTS_BASE_URL", f"https://{self.azure_region}.tts.speech.microsoft.com" if self.azure_region else ""
+        ).rstrip("/") or None
+        # Résultat du dernier sondage actif des fournisseurs (voir probe_providers)
+        self.provider_health: Dict[str, Dict] = {}
+        # Places d'appel fournisseur : réservées en partie aux demandes interactives
+        self.scheduler = PriorityScheduler.from_env()
+        # Quotas par clé API (requêtes et caractères par minute), adaptés aux 429 et en-têtes x-ratelimit-*
+        self.rate_limits = RateLimitRegistry.from_env()
         
     async def synthesize(self, text: str, voice: str = "alloy", **kwargs) -> Dict:
-        """Synthèse vocale avec sélection automatique du meilleur moteur"""
+        """Synthèse vocale avec sélection automatique du meilleur moteur.
+        
+        timestamps=True : horodatage par mot (`words`) si le fournisseur le permet ;
+        seul ElevenLabs le fournit, il est donc essayé en premier quelle que soit la qualité.
+        priority : "interactive" (défaut) ou "bulk" (lots, exports), voir PriorityScheduler."""
+        priority = kwargs.pop("priority", INTERACTIVE)
         try:
-            # Tentative avec ElevenLabs si disponible
-            if self.elevenlabs_key and kwargs.get("quality", "high") == "high":
-                result = await self._synthesize_elevenlabs(text, voice, **kwargs)
-                if result["success"]:
-                    return result
-            
-            # Fallback vers OpenAI TTS
-            if self.openai_key:
-                result = await self._synthesize_openai(text, voice, **kwargs)
-                if result["success"]:
-                    return result
-            
-            # Fallback vers Azure
-            if self.azure_key:
-                return await self._synthesize_azure(text, voice, **kwargs)
+            with SERVICE_IN_FLIGHT.labels("tts").track_inprogress():
+                # Tentative avec ElevenLabs si disponible
+                if self.elevenlabs_key and (kwargs.get("quality", "high") == "high" or kwargs.get("timestamps")):
+                    result = await self._call_provider("elevenlabs", self._synthesize_elevenlabs, text, voice, priority, **kwargs)
+                    if result["success"]:
+                        return result
                 
-            return {"success": False, "error": "Aucun service TTS disponible"}
+                # Fallback vers OpenAI TTS
+                if self.openai_key:
+                    result = await self._call_provider("openai", self._synthesize_openai, text, voice, priority, **kwargs)
+                    if result["success"]:
+                        return result
+                
+                # Fallback vers Azure
+                if self.azure_key and self.azure_url:
+                    return await self._call_provider("azure", self._synthesize_azure, text, voice, priority, **kwargs)
+                    
+                return {"success": False, "error": "Aucun service TTS disponible"}
             
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def timestamps_available(self, audio_format: str, quality: str) -> bool:
+        """Horodatage par mot possible sans changer de fournisseur ni de format : seul
+        ElevenLabs le fournit (qualité haute), et uniquement en MP3"""
+        return bool(self.elevenlabs_key) and quality == "high" and audio_format == "mp3"
+    
+    async def _call_provider(self, provider: str, method, text: str, voice: str,
+                             priority: str = INTERACTIVE, **kwargs) -> Dict:
+        """Appel d'un fournisseur (place obtenue selon la priorité) avec mesure de latence
+        et comptage des erreurs.
+        
+        L'attente des quotas de la clé (selon la priorité) précède la prise de place : une clé
+        suspendue n'immobilise aucune place. Une attente de quota au-delà de max_wait n'est pas
+        faite ; un 429 est retenté jusqu'à max_retries fois si la suspension imposée ne dépasse
+        pas max_wait. Sinon l'erreur est rendue (fournisseur suivant)."""
+        api_key = {"elevenlabs": self.elevenlabs_key, "openai": self.openai_key,
+                   "azure": self.azure_key}.get(provider)
+        limiter = self.rate_limits.limiter(provider, api_key)
+        attempt = 0
+        while True:
+            try:
+                await limiter.acquire(len(text), priority)
+            except QuotaWaitExceeded as e:
+                result = {"success": False, "error": str(e)}
+                break
+            async with self.scheduler.slot(priority):
+                with STAGE_LATENCY.labels("tts", provider).time():
+                    try:
+                        result = await method(text, voice, **kwargs)
+                    except RateLimited as e:
+                        result = {"success": False, "error": str(e), "retry_after": e.retry_after}
+                    except Exception:
+                        STAGE_ERRORS.labels("tts", provider).inc()
+                        raise
+            retry_after = result.get("retry_after")
+            if (retry_after is None or attempt >= self.rate_limits.max_retries
+                    or retry_after > self.rate_limits.max_wait):
+                break
+            attempt += 1
+        if not result["success"]:
+            STAGE_ERRORS.labels("tts", provider).inc()
+        return result
+    
+    async def _post(self, session, provider: str, api_key: str, url: str, **request):
+        """POST fournisseur : en-têtes de quota transmis au limiteur de la clé, 429 levé en
+        RateLimited (la clé est suspendue, _call_provider décide d'un nouvel essai)"""
+        response = await session.post(url, **request)
+        delay = self.rate_limits.limiter(provider, api_key).observe(response.status, response.headers)
+        if delay is not None:
+            response.release()
+            raise RateLimited(provider, delay)
+        return response
+    
     async def _synthesize_elevenlabs(self, text: str, voice: str, **kwargs) -> Dict:
         """Synthèse avec ElevenLabs (qualité premium)"""
         voice_map = {
@@ -406,10 +1447,12 @@ class TTSService:
         }
         
         voice_id = voice_map.get(voice, voice_map["alloy"])
+        timestamps = kwargs.get("timestamps", False)
         
         async with aiohttp.ClientSession() as session:
             headers = {
-                "Accept": "audio/mpeg",
+                # Avec horodatage : réponse JSON (audio en base64 et alignement par caractère)
+                "Accept": "application/json" if timestamps else "audio/mpeg",
                 "Content-Type": "application/json",
                 "xi-api-key": self.elevenlabs_key
             }
@@ -425,11 +1468,24 @@ class TTSService:
                 }
             }
             
-            async with session.post(
-                f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}",
+            async with await self._post(
+                session, "elevenlabs", self.elevenlabs_key,
+                f"{self.elevenlabs_url}/v1/text-to-speech/{voice_id}" + ("/with-timestamps" if timestamps else ""),
                 headers=headers,
                 json=data
             ) as response:
+                if response.status == 200 and timestamps:
+                    payload = await response.json()
+                    words = self._words_from_alignment(payload.get("alignment") or {})
+                    return {
+                        "success": True,
+                        "data": payload["audio_base64"],
+                        "format": "mp3",
+                        "provider": "elevenlabs",
+                        "duration": words[-1]["end"] if words else self._estimate_duration(text),
+                        "words": words,
+                        "metadata": {"voice_id": voice_id, "model": "eleven_multilingual_v2"}
+                    }
                 if response.status == 200:
                     audio_content = await response.read()
                     return {
@@ -459,8 +1515,9 @@ class TTSService:
                 "response_format": kwargs.get("format", "mp3")
             }
             
-            async with session.post(
-                "https://api.openai.com/v1/audio/speech",
+            async with await self._post(
+                session, "openai", self.openai_key,
+                f"{self.openai_url}/v1/audio/speech",
                 headers=headers,
                 json=data
             ) as response:
@@ -477,6 +1534,24 @@ class TTSService:
                 else:
                     return {"success": False, "error": f"OpenAI API error: {response.status}"}
     
+    def _words_from_alignment(self, alignment: Dict) -> List[Dict]:
+        """Horodatage par mot à partir de l'alignement par caractère d'ElevenLabs"""
+        characters = alignment.get("characters") or []
+        starts = alignment.get("character_start_times_seconds") or []
+        ends = alignment.get("character_end_times_seconds") or []
+        words = []
+        current = None
+        for offset, (char, start, end) in enumerate(zip(characters, starts, ends)):
+            if char.isspace():
+                current = None
+                continue
+            if current is None:
+                current = {"word": "", "start": start, "end": end, "offset": offset}
+                words.append(current)
+            current["word"] += char
+            current["end"] = end
+        return words
+    
     def _estimate_duration(self, text: str, wpm: int = 150) -> float:
         """Estimation de la durée audio basée sur le nombre de mots"""
         words = len(text.split())
@@ -490,15 +1565,77 @@ class TTSService:
             status["providers"].append("elevenlabs")
         if self.openai_key:
             status["providers"].append("openai")
-        if self.azure_key:
+        if self.azure_key and self.azure_url:
             status["providers"].append("azure")
             
+        status["scheduler"] = self.scheduler.snapshot()
+        status["rate_limits"] = self.rate_limits.snapshot()
+        
         if not status["providers"]:
             status["status"] = "unhealthy"
             status["error"] = "Aucune clé API configurée"
+        elif self.provider_health:
+            status["probes"] = self.provider_health
+            probed = {p: probe for p, probe in self.provider_health.items() if probe["status"] != "not_configured"}
+            reachable = [p for p, probe in probed.items() if probe["status"] != "unhealthy"]
+            if not reachable:
+                status["status"] = "unhealthy"
+                status["error"] = "Aucun fournisseur TTS joignable"
+            elif len(reachable) < len(probed):
+                status["status"] = "degraded"
             
         return status
     
+    async def probe_providers(self, timeout: float = 5.0) -> Dict[str, Dict]:
+        """Sondage actif des fournisseurs via des endpoints légers (sans synthèse)"""
+        probes = {}
+        if self.elevenlabs_key:
+            probes["elevenlabs"] = (f"{self.elevenlabs_url}/v1/user", {"xi-api-key": self.elevenlabs_key})
+        if self.openai_key:
+            probes["openai"] = (f"{self.openai_url}/v1/models", {"Authorization": f"Bearer {self.openai_key}"})
+        if self.azure_key and self.azure_url:
+            probes["azure"] = (
+                f"{self.azure_url}/cognitiveservices/voices/list",
+                {"Ocp-Apim-Subscription-Key": self.azure_key}
+            )
+        
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            results = await asyncio.gather(*(
+                self._probe(session, provider, url, headers) for provider, (url, headers) in probes.items()
+            ))
+        
+        self.provider_health = dict(zip(probes, results))
+        if self.azure_key and not self.azure_url:
+            self.provider_health["azure"] = {
+                "status": "not_configured",
+                "error": "AZURE_SPEECH_REGION (ou AZURE_TTS_BASE_URL) non défini",
+                "checked_at": datetime.now().isoformat()
+            }
+        return self.provider_health
+    
+    def set_provider_health(self, probes: Dict[str, Dict]):
+        """Résultat du sondage effectué par un autre worker (état partagé)"""
+        self.provider_health = probes
+    
+    async def _probe(self, session, provider: str, url: str, headers: Dict) -> Dict:
+        """Sondage d'un fournisseur : 2xx sain, 429 dégradé, erreur d'authentification ou 5xx hors service"""
+        started = time.perf_counter()
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status < 400:
+                    status = "healthy"
+                elif response.status == 429:
+                    status = "degraded"
+                else:
+                    status = "unhealthy"
+                result = {"status": status, "http_status": response.status}
+        except Exception as e:
+            result = {"status": "unhealthy", "error": str(e)}
+        
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        result["checked_at"] = datetime.now().isoformat()
+        return result
+    
     async def get_available_voices(self) -> List[Dict]:
         """Liste des voix disponibles"""
         voices = [
@@ -514,10 +1651,36 @@ class TTSService:
 
 # ===== DÉMARRAGE DU SERVEUR =====
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="AI Platform Python Services")
+    parser.add_argument("--production", action="store_true",
+                        help="plusieurs workers, sans rechargement automatique")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("MAX_REQUESTS", 10000)),
+                        help="recyclage d'un worker après ce nombre de requêtes")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", 30)))
+    args = parser.parse_args()
+    
+    if args.production:
+        # Les workers partagent l'état via SQLite (hérité par variable d'environnement)
+        os.environ.setdefault("SHARED_STORE_PATH", "./exports/shared_state.db")
+        # Quotas TTS par processus : chaque worker n'en prend que sa part
+        os.environ.setdefault("TTS_RATE_LIMIT_WORKERS", str(args.workers))
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            limit_max_requests=args.max_requests,
+            timeout_graceful_shutdown=args.graceful_timeout,
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level="info"
+        )
\ No newline at end of file
@@ -0,0 +1,294 @@
+# ===== RATE_LIMITER.PY =====
+"""Cadencement des appels aux fournisseurs TTS selon leurs quotas.
+
+Par fournisseur et par clé API : un seau de jetons pour les requêtes par minute, un autre
+pour les caractères par minute. Les quotas viennent de la configuration (TTS_<FOURNISSEUR>_RPM
+et _CPM), puis des en-têtes x-ratelimit-* renvoyés par le fournisseur. Un 429 suspend la clé
+jusqu'à Retry-After (avec gigue) et réduit le débit ; les succès le rétablissent peu à peu
+(augmentation additive, diminution multiplicative) : le débit se stabilise juste sous la limite
+au lieu d'osciller.
+
+Priorités (voir tts_scheduler) : une demande interactive réserve ses jetons dès son arrivée,
+quitte à rendre le solde négatif ; le travail de masse attend, dans l'ordre d'arrivée, que le
+solde soit de nouveau positif avant de prendre les siens. Un lot volumineux ne constitue donc
+jamais de dette devant les demandes interactives : celles-ci attendent au plus l'appel de
+masse en cours. Une attente de quota au-delà de max_wait est refusée (QuotaWaitExceeded,
+fournisseur suivant) et une attente annulée rend ses jetons.
+
+Les seaux sont propres à chaque processus : avec plusieurs workers (--production), chacun
+ne dispose que de sa part du quota, quota / TTS_RATE_LIMIT_WORKERS (renseigné par --workers,
+à fixer à workers × réplicas si plusieurs instances partagent les mêmes clés). Un 429 ne
+suspend que la clé du worker qui l'a reçu.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from metrics import TTS_RATE_LIMITED, TTS_RATE_LIMIT_WAIT
+from tts_scheduler import INTERACTIVE, BULK
+
+# Quotas par défaut (0 : pas de limite) ; surchargeables par TTS_<FOURNISSEUR>_RPM / _CPM
+DEFAULT_QUOTAS = {
+    "elevenlabs": {"rpm": 120, "cpm": 0},
+    "openai": {"rpm": 50, "cpm": 0},
+    "azure": {"rpm": 200, "cpm": 0},
+}
+# Rafale tolérée : quelques secondes de quota
+BURST_SECONDS = 5.0
+# Réduction du débit après un 429 et fraction du quota regagnée à chaque succès
+DECREASE_FACTOR = 0.7
+RECOVERY_STEP = 0.02
+MIN_RATE_FRACTION = 0.1
+# Gigue par appel en attente (fraction de son délai, plafonnée) : pas de départs groupés
+WAITER_JITTER = 0.1
+MAX_WAITER_JITTER = 1.0
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+class RateLimited(Exception):
+    """Réponse 429 d'un fournisseur ; retry_after : suspension imposée à la clé (s)"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider}: quota dépassé (429), nouvel essai possible dans {retry_after:.1f} s")
+        self.retry_after = retry_after
+
+
+class QuotaWaitExceeded(RateLimited):
+    """Attente de quota locale supérieure à max_wait : l'appel n'est pas envoyé"""
+
+    def __init__(self, provider: str, delay: float):
+        Exception.__init__(self, f"{provider}: quota local épuisé, attente de {delay:.1f} s refusée")
+        self.retry_after = delay
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Délai en secondes : "20", "1.5", "6m0s", "120ms" ou date HTTP (Retry-After)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Seau de jetons à réservation : un appel prend ses jetons tout de suite (solde éventuellement
+    négatif) et attend le temps nécessaire pour les regagner ; l'ordre d'arrivée est respecté"""
+
+    def __init__(self, per_minute: float, headroom: float):
+        self.headroom = headroom
+        self.limit = per_minute * headroom / 60
+        self.rate = self.limit
+        self.capacity = max(self.limit * BURST_SECONDS, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Délai (s) avant de pouvoir consommer `amount` jetons, réservés dès maintenant.
+
+        Pendant une suspension, le seau ne se remplit qu'à partir de sa fin (updated) : le
+        délai est la fin de la suspension plus le temps de regagner le solde négatif."""
+        self._refill(now)
+        self.tokens -= amount
+        return max(self.updated - now, 0.0) + max(-self.tokens, 0.0) / self.rate
+
+    def credit_delay(self, now: float) -> float:
+        """Délai (s) avant que le solde atteigne un jeton, sans rien réserver"""
+        self._refill(now)
+        return max(self.updated - now, 0.0) + max(1.0 - self.tokens, 0.0) / self.rate
+
+    def refund(self, amount: float):
+        """Restitution d'une réservation abandonnée (appel annulé ou refusé)"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def pause(self, now: float, delay: float):
+        """Aucun jeton regagné avant now + delay (Retry-After), solde ramené à zéro au plus"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        self.updated = max(self.updated, now + delay)
+
+    def set_limit(self, per_minute: float):
+        """Quota annoncé par le fournisseur (en-tête x-ratelimit-limit-*)"""
+        limit = per_minute * self.headroom / 60
+        if limit > 0 and abs(limit - self.limit) > 1e-9:
+            self.rate = min(self.rate * limit / self.limit, limit)
+            self.limit = limit
+            self.capacity = max(limit * BURST_SECONDS, 1.0)
+
+    def throttle(self):
+        self.rate = max(self.rate * DECREASE_FACTOR, self.limit * MIN_RATE_FRACTION)
+
+    def recover(self):
+        self.rate = min(self.rate + self.limit * RECOVERY_STEP, self.limit)
+
+
+class ProviderRateLimiter:
+    """Quotas d'une clé API d'un fournisseur : requêtes et caractères par minute"""
+
+    def __init__(self, provider: str, rpm: float, cpm: float, headroom: float, max_wait: float = 30.0):
+        self.provider = provider
+        self.max_wait = max_wait
+        self.buckets: Dict[str, TokenBucket] = {}
+        if rpm > 0:
+            self.buckets["requests"] = TokenBucket(rpm, headroom)
+        if cpm > 0:
+            self.buckets["characters"] = TokenBucket(cpm, headroom)
+        self.rate_limited = 0
+        # Travail de masse : un seul appel à la fois attend que le solde redevienne positif
+        self._bulk_turn = asyncio.Lock()
+
+    async def acquire(self, characters: int, priority: str = INTERACTIVE):
+        """Attente d'une place dans les quotas avant l'envoi d'une requête ;
+        QuotaWaitExceeded si l'attente dépasserait max_wait"""
+        started = time.monotonic()
+        if priority == BULK:
+            await self._acquire_bulk(characters)
+        else:
+            await self._acquire_interactive(characters)
+        TTS_RATE_LIMIT_WAIT.labels(self.provider).observe(time.monotonic() - started)
+
+    def _amounts(self, characters: int) -> Dict[str, float]:
+        amounts = {"requests": 1, "characters": characters}
+        return {name: amounts[name] for name in self.buckets}
+
+    def _refund(self, amounts: Dict[str, float]):
+        for name, amount in amounts.items():
+            self.buckets[name].refund(amount)
+
+    async def _acquire_interactive(self, characters: int):
+        """Réservation immédiate, dans l'ordre d'arrivée, puis attente des jetons"""
+        now = time.monotonic()
+        amounts = self._amounts(characters)
+        delay = max((self.buckets[name].reserve(amount, now) for name, amount in amounts.items()), default=0.0)
+        if delay > self.max_wait:
+            self._refund(amounts)
+            raise QuotaWaitExceeded(self.provider, delay)
+        if delay > 0:
+            delay += random.uniform(0, min(delay * WAITER_JITTER, MAX_WAITER_JITTER))
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self._refund(amounts)
+                raise
+
+    async def _acquire_bulk(self, characters: int):
+        """Prise des jetons seulement quand le solde est positif ; les réservations
+        interactives arrivées entre-temps repoussent l'appel. max_wait borne l'attente
+        des quotas une fois l'appel en tête (pas la file des autres appels de masse)"""
+        async with self._bulk_turn:
+            while True:
+                now = time.monotonic()
+                delay = max((bucket.credit_delay(now) for bucket in self.buckets.values()), default=0.0)
+                if delay <= 0:
+                    for name, amount in self._amounts(characters).items():
+                        self.buckets[name].reserve(amount, now)
+                    return
+                if delay > self.max_wait:
+                    raise QuotaWaitExceeded(self.provider, delay)
+                await asyncio.sleep(delay)
+
+    def observe(self, status: int, headers) -> Optional[float]:
+        """Prise en compte d'une réponse ; renvoie le délai imposé (s) si la requête a été limitée"""
+        for name, header in (("requests", "requests"), ("characters", "characters"), ("characters", "tokens")):
+            bucket = self.buckets.get(name)
+            if bucket is None:
+                continue
+            limit = headers.get(f"x-ratelimit-limit-{header}")
+            if limit and limit.replace(".", "", 1).isdigit():
+                bucket.set_limit(float(limit))
+            remaining = headers.get(f"x-ratelimit-remaining-{header}")
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{header}"))
+            if remaining == "0" and reset:
+                # Quota épuisé côté fournisseur : attente de sa remise à zéro
+                bucket.pause(time.monotonic(), reset)
+
+        if status != 429:
+            for bucket in self.buckets.values():
+                bucket.recover()
+            return None
+
+        self.rate_limited += 1
+        TTS_RATE_LIMITED.labels(self.provider).inc()
+        delay = parse_duration(headers.get("retry-after"))
+        if delay is None:
+            delay = parse_duration(headers.get("x-ratelimit-reset-requests")) or 1.0
+        # Gigue : les appels suspendus ne repartent pas tous au même instant
+        delay *= random.uniform(1.0, 1.25)
+        now = time.monotonic()
+        for bucket in self.buckets.values():
+            bucket.throttle()
+            bucket.pause(now, delay)
+        return delay
+
+    def snapshot(self) -> Dict:
+        return {
+            "rate_limited": self.rate_limited,
+            **{name: {"limit_per_minute": round(bucket.limit * 60, 2),
+                      "rate_per_minute": round(bucket.rate * 60, 2)}
+               for name, bucket in self.buckets.items()}
+        }
+
+
+class RateLimitRegistry:
+    """Limiteurs par (fournisseur, clé API) ; les clés ne sont conservées que sous forme d'empreinte"""
+
+    def __init__(self, quotas: Dict[str, Dict[str, float]], headroom: float = 0.9,
+                 max_retries: int = 3, max_wait: float = 30.0, workers: int = 1):
+        self.quotas = quotas
+        # Part du quota de ce processus : la marge s'applique aussi aux limites annoncées
+        self.headroom = headroom / max(workers, 1)
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.limiters: Dict[str, ProviderRateLimiter] = {}
+
+    @classmethod
+    def from_env(cls) -> "RateLimitRegistry":
+        """Quotas TTS_<FOURNISSEUR>_RPM / _CPM, marge TTS_RATE_LIMIT_HEADROOM, nouveaux essais
+        TTS_RATE_LIMIT_RETRIES, attente maximale TTS_RATE_LIMIT_MAX_WAIT (au-delà : fournisseur suivant),
+        nombre de processus se partageant les clés TTS_RATE_LIMIT_WORKERS"""
+        quotas = {
+            provider: {
+                "rpm": float(os.getenv(f"TTS_{provider.upper()}_RPM", defaults["rpm"])),
+                "cpm": float(os.getenv(f"TTS_{provider.upper()}_CPM", defaults["cpm"]))
+            }
+            for provider, defaults in DEFAULT_QUOTAS.items()
+        }
+        return cls(
+            quotas,
+            headroom=float(os.getenv("TTS_RATE_LIMIT_HEADROOM", 0.9)),
+            max_retries=int(os.getenv("TTS_RATE_LIMIT_RETRIES", 3)),
+            max_wait=float(os.getenv("TTS_RATE_LIMIT_MAX_WAIT", 30)),
+            workers=int(os.getenv("TTS_RATE_LIMIT_WORKERS", 1))
+        )
+
+    def limiter(self, provider: str, api_key: Optional[str]) -> ProviderRateLimiter:
+        key = f"{provider}:{hashlib.sha256((api_key or '').encode()).hexdigest()[:12]}"
+        limiter = self.limiters.get(key)
+        if limiter is None:
+            quota = self.quotas.get(provider, {"rpm": 0, "cpm": 0})
+            limiter = self.limiters[key] = ProviderRateLimiter(
+                provider, quota["rpm"], quota["cpm"], self.headroom, self.max_wait
+            )
+        return limiter
+
+    def snapshot(self) -> Dict:
+        return {key: limiter.snapshot() for key, limiter in self.limiters.items()}
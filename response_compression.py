@@ -0,0 +1,268 @@
+# ===== RESPONSE_COMPRESSION.PY =====
+"""Compression des réponses négociée (zstd, brotli, gzip) et cache de réponses précompressées"""
+import asyncio
+import hashlib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+from metrics import CACHE_REQUESTS
+
+# brotli et zstandard sont optionnels : sans eux, seul gzip est proposé
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Ordre de préférence du serveur à qualité égale côté client
+AVAILABLE_ENCODINGS: List[str] = (["zstd"] if zstandard else []) + (["br"] if brotli else []) + ["gzip"]
+
+# Niveaux « à la volée » (coût CPU par réponse) et « précompressé » (payé une fois)
+STREAMING_LEVELS = {"gzip": 6, "br": 4, "zstd": 3}
+PRECOMPRESSED_LEVELS = {"gzip": 9, "br": 11, "zstd": 19}
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+# Flux à faible latence : chaque événement doit partir immédiatement, sans tampon de compression
+EXCLUDED_TYPES = ("text/event-stream",)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Meilleur encodage disponible accepté par le client (q > 0), None sinon"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    candidates = [
+        (accepted.get(encoding, accepted.get("*", 0.0)), -rank, encoding)
+        for rank, encoding in enumerate(AVAILABLE_ENCODINGS)
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+
+class StreamEncoder:
+    """Compresseur incrémental : compress() + flush() par bloc, finish() en fin de flux"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            raise ValueError(f"Encodage non supporté: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Émission de ce qui est en tampon (le client peut décoder jusqu'ici)"""
+        if self.encoding == "gzip":
+            return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._compressor.flush()
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress_bytes(data: bytes, encoding: str, level: int) -> bytes:
+    encoder = StreamEncoder(encoding, level)
+    return encoder.compress(data) + encoder.finish()
+
+
+class CompressionMiddleware:
+    """Middleware ASGI : compression des réponses textuelles au-delà de minimum_size.
+
+    Les réponses en plusieurs blocs (StreamingResponse) sont compressées bloc par bloc
+    sans être mises en tampon ; les réponses déjà encodées (cache précompressé), partielles
+    (206) ou binaires sont transmises telles quelles. Une réponse compressée perd Accept-Ranges
+    et son ETag devient faible (W/)."""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSender(send, encoding, self.minimum_size).send)
+
+
+class _CompressingSender:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.encoder: Optional[StreamEncoder] = None
+        self.passthrough = False
+
+    def _eligible(self, headers: Headers, status: int) -> bool:
+        content_type = headers.get("content-type", "")
+        return (
+            200 <= status < 300 and status not in (204, 206)
+            and "content-encoding" not in headers
+            and "content-range" not in headers
+            and content_type.startswith(COMPRESSIBLE_TYPES)
+            and not content_type.startswith(EXCLUDED_TYPES)
+        )
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            if self._eligible(Headers(raw=message["headers"]), message["status"]):
+                self.start_message = message  # en attente du premier bloc (taille)
+            else:
+                self.passthrough = True
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            # Octets différents de la représentation d'origine : validateur affaibli (un ETag
+            # fort ne désigne qu'elle) et plages non servies sur le corps encodé
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            if "accept-ranges" in headers:
+                del headers["Accept-Ranges"]
+            self.encoder = StreamEncoder(self.encoding, STREAMING_LEVELS[self.encoding])
+            if not more_body:
+                # Réponse en un bloc : longueur connue après compression
+                body = self.encoder.compress(body) + self.encoder.finish()
+                headers["Content-Length"] = str(len(body))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            del headers["Content-Length"]
+            await self._send(start)
+
+        if more_body:
+            chunk = self.encoder.compress(body) + self.encoder.flush()
+        else:
+            chunk = self.encoder.compress(body) + self.encoder.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+
+class PrecompressedCache:
+    """Cache LRU de réponses JSON (ou binaires), conservées sérialisées et compressées par encodage
+    (chaque variante est calculée une fois, au niveau maximal, puis resservie sans CPU).
+    Sérialisation et compression s'exécutent dans un thread : un brotli 11 sur une grosse
+    analyse ne bloque pas la boucle d'événements."""
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, Dict[str, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Clé stable d'un jeu de paramètres JSON"""
+        normalized = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    async def lookup(self, key: str, accept_encoding: Optional[str], vary: Sequence[str] = ()) -> Optional[Response]:
+        """Réponse en cache ; vary : en-têtes de requête (hors Accept-Encoding) ayant déterminé
+        le contenu, donc la clé, annoncés aux caches intermédiaires"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        CACHE_REQUESTS.labels(self.name, "hit" if entry is not None else "miss").inc()
+        if entry is None:
+            return None
+        return await self._response(key, entry, accept_encoding, vary)
+
+    async def store(self, key: str, payload, accept_encoding: Optional[str],
+                    media_type: str = "application/json", vary: Sequence[str] = ()) -> Response:
+        """Mise en cache d'un résultat (sérialisé en JSON, ou octets tels quels) et réponse correspondante"""
+        if isinstance(payload, bytes):
+            identity = payload
+        else:
+            identity = await asyncio.to_thread(self._serialize, payload)
+        entry = {"identity": identity, "media_type": media_type.encode()}
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self.size -= sum(len(v) for v in previous.values())
+            self._entries[key] = entry
+            self.size += sum(len(v) for v in entry.values())
+            self._evict()
+        return await self._response(key, entry, accept_encoding, vary)
+
+    @staticmethod
+    def _serialize(payload) -> bytes:
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+
+    async def _response(self, key: str, entry: Dict[str, bytes], accept_encoding: Optional[str],
+                        vary: Sequence[str] = ()) -> Response:
+        encoding = negotiate_encoding(accept_encoding)
+        headers = {"Vary": ", ".join(("Accept-Encoding", *vary))}
+        media_type = entry["media_type"].decode()
+        if encoding is None:
+            return Response(content=entry["identity"], media_type=media_type, headers=headers)
+
+        body = entry.get(encoding)
+        if body is None:
+            body = await asyncio.to_thread(compress_bytes, entry["identity"], encoding, PRECOMPRESSED_LEVELS[encoding])
+            with self._lock:
+                if self._entries.get(key) is entry and encoding not in entry:
+                    entry[encoding] = body
+                    self.size += len(body)
+                    self._evict()
+        headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= sum(len(v) for v in evicted.values())
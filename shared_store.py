@@ -0,0 +1,260 @@
+# ===== SHARED_STORE.PY =====
+"""État partagé entre workers : dictionnaires clé/valeur et files de tâches sur SQLite (WAL)"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import MutableMapping
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStore:
+    """Base SQLite locale partagée par tous les workers d'une même machine"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        db = self.connection()
+        db.execute("""CREATE TABLE IF NOT EXISTS kv (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        )""")
+        db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            queue TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            worker TEXT,
+            enqueued_at REAL NOT NULL,
+            heartbeat_at REAL
+        )""")
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (queue, status, enqueued_at)")
+        db.execute("""CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )""")
+
+    def connection(self) -> sqlite3.Connection:
+        """Connexion propre au thread (et au processus)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Bail exclusif (tâche à n'exécuter que sur un worker) : pris s'il est libre ou expiré,
+        prolongé s'il appartient déjà à `owner` ; True si `owner` le détient"""
+        now = time.time()
+        cursor = self.connection().execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+            (name, owner, now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+    def release_lease(self, name: str, owner: str):
+        self.connection().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def mapping(self, namespace: str) -> "SharedDict":
+        return SharedDict(self, namespace)
+
+    def queue(self, name: str) -> "JobQueue":
+        return JobQueue(self, name)
+
+
+class SharedDict(MutableMapping):
+    """Dictionnaire persistant (valeurs JSON) ; les valeurs lues sont des copies :
+    toute modification doit être réécrite via __setitem__"""
+
+    def __init__(self, store: SharedStore, namespace: str):
+        self.store = store
+        self.namespace = namespace
+
+    def __getitem__(self, key: str) -> Any:
+        row = self.store.connection().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key: str, value: Any):
+        self.store.connection().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value), time.time())
+        )
+
+    def __delitem__(self, key: str):
+        cursor = self.store.connection().execute(
+            "DELETE FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self.store.connection().execute(
+            "SELECT key FROM kv WHERE namespace = ?", (self.namespace,)
+        ).fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self) -> int:
+        return self.store.connection().execute(
+            "SELECT COUNT(*) FROM kv WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def increment(self, key: str, delta: int = 1) -> None:
+        """Incrément atomique d'un compteur (sans lecture préalable)"""
+        self.store.connection().execute(
+            "INSERT INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = CAST(value AS INTEGER) + ?, updated_at = ?",
+            (self.namespace, key, json.dumps(delta), time.time(), delta, time.time())
+        )
+
+    def items(self):
+        rows = self.store.connection().execute(
+            "SELECT key, value FROM kv WHERE namespace = ?", (self.namespace,)
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+
+class JobQueue:
+    """File de tâches partagée : chaque job est pris en charge par un seul worker"""
+
+    def __init__(self, store: SharedStore, name: str):
+        self.store = store
+        self.name = name
+
+    def put(self, job_id: str, payload: Dict):
+        self.store.connection().execute(
+            "INSERT INTO jobs (id, queue, payload, status, enqueued_at) VALUES (?, ?, ?, 'pending', ?)",
+            (job_id, self.name, json.dumps(payload), time.time())
+        )
+
+    def claim(self, worker: str) -> Optional[Tuple[str, Dict]]:
+        """Prise en charge atomique du plus ancien job en attente"""
+        db = self.store.connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT id, payload FROM jobs WHERE queue = ? AND status = 'pending' ORDER BY enqueued_at LIMIT 1",
+                (self.name,)
+            ).fetchone()
+            if row:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, heartbeat_at = ? WHERE id = ?",
+                    (worker, time.time(), row[0])
+                )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return (row[0], json.loads(row[1])) if row else None
+
+    def heartbeat(self, job_id: str):
+        self.store.connection().execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def complete(self, job_id: str):
+        self.store.connection().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def release(self, job_id: str):
+        """Remise en attente (arrêt du worker avant la fin du job)"""
+        self.store.connection().execute(
+            "UPDATE jobs SET status = 'pending', worker = NULL WHERE id = ?", (job_id,)
+        )
+
+    def requeue_stale(self, timeout: float) -> int:
+        """Remise en attente des jobs dont le worker ne donne plus signe de vie"""
+        cursor = self.store.connection().execute(
+            "UPDATE jobs SET status = 'pending', worker = NULL "
+            "WHERE queue = ? AND status = 'running' AND heartbeat_at < ?",
+            (self.name, time.time() - timeout)
+        )
+        return cursor.rowcount
+
+    def depth(self) -> Dict[str, int]:
+        rows = self.store.connection().execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE queue = ? GROUP BY status", (self.name,)
+        ).fetchall()
+        return {"pending": 0, "running": 0, **dict(rows)}
+
+
+class JobWorker:
+    """Consommateur d'une JobQueue dans un worker, avec concurrence bornée"""
+
+    def __init__(self, queue: JobQueue, handler: Callable[[Dict], Awaitable[Any]],
+                 concurrency: int = 2, poll_interval: float = 0.5,
+                 heartbeat_interval: float = 15.0, stale_after: float = 120.0):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.running: Dict[str, asyncio.Task] = {}
+        self._stopping = False
+
+    async def run(self):
+        """Boucle de prise en charge des jobs (jusqu'à stop())"""
+        last_heartbeat = 0.0
+        while not self._stopping:
+            now = time.monotonic()
+            if now - last_heartbeat >= self.heartbeat_interval:
+                for job_id in list(self.running):
+                    await asyncio.to_thread(self.queue.heartbeat, job_id)
+                await asyncio.to_thread(self.queue.requeue_stale, self.stale_after)
+                last_heartbeat = now
+
+            job = None
+            if len(self.running) < self.concurrency:
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id)
+            if job:
+                job_id, payload = job
+                self.running[job_id] = asyncio.create_task(self._execute(job_id, payload))
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+    async def _execute(self, job_id: str, payload: Dict):
+        try:
+            await self.handler(payload)
+            await asyncio.to_thread(self.queue.complete, job_id)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.queue.release, job_id)
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} en échec: {str(e)}")
+            await asyncio.to_thread(self.queue.complete, job_id)
+        finally:
+            self.running.pop(job_id, None)
+
+    async def stop(self, timeout: float):
+        """Arrêt gracieux : plus de nouvelle prise en charge, jobs en cours attendus
+        jusqu'au délai, puis annulés et remis en attente pour un autre worker"""
+        self._stopping = True
+        pending = list(self.running.values())
+        if not pending:
+            return
+        _, unfinished = await asyncio.wait(pending, timeout=timeout)
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
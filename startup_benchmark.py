@@ -0,0 +1,116 @@
+# ===== STARTUP_BENCHMARK.PY =====
+"""Temps de démarrage et RSS de base du service Python (import de main:app).
+
+Mesure l'arborescence déployée, un module par fichier (main.py, tts_service.py,
+animation_service.py, epub_generator.py...) : les bundles python_services.py et
+animation_epub_services.py doivent être découpés selon leurs en-têtes « # ===== X.PY ===== ».
+Chaque mesure est faite dans un processus neuf. Les seuils optionnels font échouer
+la commande (code 1) pour détecter les régressions en CI.
+
+Usage :
+    python startup_benchmark.py --repeat 5 --output startup.json
+    python startup_benchmark.py --max-import-s 1.5 --max-rss-mb 150
+    python startup_benchmark.py --warmup animation,epub
+    python startup_benchmark.py --app-dir /srv/python_services
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+# Modules dont le chargement au démarrage signale une régression
+HEAVY_MODULES = ("librosa", "numpy", "PIL", "jinja2", "numba", "scipy")
+
+PROBE = r"""
+import json, resource, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter() - started
+warmup = [name for name in sys.argv[1].split(",") if name]
+for name in warmup:
+    service = main.services[name].get()
+    if hasattr(service, "warm_up"):
+        service.warm_up()
+ready = time.perf_counter() - started
+with open("/proc/self/statm") as statm:
+    rss_kb = int(statm.read().split()[1]) * resource.getpagesize() // 1024
+print(json.dumps({
+    "import_s": imported,
+    "ready_s": ready,
+    "rss_kb": rss_kb,
+    "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy_modules": sorted(m for m in json.loads(sys.argv[2]) if m in sys.modules)
+}))
+"""
+
+
+def measure(app_dir: Path, warmup: str) -> Dict:
+    """Une mesure de démarrage dans un interpréteur neuf"""
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE, warmup, json.dumps(HEAVY_MODULES)],
+        capture_output=True, text=True, check=True, cwd=app_dir
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs: List[Dict]) -> Dict:
+    return {
+        key: {"median": statistics.median(r[key] for r in runs), "max": max(r[key] for r in runs)}
+        for key in ("import_s", "ready_s", "rss_kb", "peak_rss_kb")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de démarrage des services Python")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", default="", help="services à précharger, ex. animation,epub")
+    parser.add_argument("--max-import-s", type=float, help="seuil sur la médiane du temps d'import")
+    parser.add_argument("--max-rss-mb", type=float, help="seuil sur la médiane du RSS après import")
+    parser.add_argument("--output", help="fichier JSON de résultats (stdout par défaut)")
+    parser.add_argument("--app-dir", default=str(Path(__file__).resolve().parent),
+                        help="répertoire contenant main.py et les modules de services")
+    args = parser.parse_args()
+
+    app_dir = Path(args.app_dir).resolve()
+    if not (app_dir / "main.py").exists():
+        parser.error(f"main.py introuvable dans {app_dir} : découper python_services.py et "
+                     "animation_epub_services.py en modules (--app-dir)")
+
+    runs = [measure(app_dir, args.warmup) for _ in range(args.repeat)]
+    summary = summarize(runs)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "warmup": args.warmup,
+            "app_dir": str(app_dir)
+        },
+        "summary": summary,
+        "heavy_modules": runs[-1]["heavy_modules"],
+        "runs": runs
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+    failures = []
+    if args.max_import_s is not None and summary["import_s"]["median"] > args.max_import_s:
+        failures.append(f"import {summary['import_s']['median']:.3f}s > {args.max_import_s}s")
+    if args.max_rss_mb is not None and summary["rss_kb"]["median"] / 1024 > args.max_rss_mb:
+        failures.append(f"RSS {summary['rss_kb']['median'] / 1024:.1f} Mo > {args.max_rss_mb} Mo")
+    if failures:
+        print("Régression de démarrage : " + ", ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# ===== TTS_SCHEDULER.PY =====
+"""Ordonnancement à deux niveaux des appels aux fournisseurs TTS.
+
+Les demandes interactives (aperçu d'une phrase dans l'éditeur) disposent de places réservées
+que le travail de masse (lots, pipeline de livres narrés) ne peut jamais occuper ; celui-ci
+remplit les places libres restantes. À chaque libération, les demandes interactives en
+attente passent en premier, puis le travail de masse, dans l'ordre d'arrivée.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from metrics import TTS_SCHEDULER_WAIT, TTS_SCHEDULER_IN_FLIGHT, TTS_SCHEDULER_QUEUE_DEPTH
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+class PriorityScheduler:
+    """`slots` appels simultanés au plus, dont `reserved` réservés aux demandes interactives"""
+
+    def __init__(self, slots: int, reserved: int):
+        if not 0 <= reserved < slots:
+            raise ValueError("reserved doit être compris entre 0 et slots - 1")
+        self.slots = slots
+        self.reserved = reserved
+        self.in_use = {priority: 0 for priority in PRIORITIES}
+        self._waiters: Dict[str, deque] = {priority: deque() for priority in PRIORITIES}
+        for priority in PRIORITIES:
+            TTS_SCHEDULER_IN_FLIGHT.labels(priority).set_function(lambda p=priority: self.in_use[p])
+            TTS_SCHEDULER_QUEUE_DEPTH.labels(priority).set_function(lambda p=priority: len(self._waiters[p]))
+
+    @classmethod
+    def from_env(cls, slots: int = 8, reserved: int = 2) -> "PriorityScheduler":
+        """Limites surchargeables par TTS_PROVIDER_CONCURRENCY et TTS_INTERACTIVE_RESERVED"""
+        return cls(
+            slots=int(os.getenv("TTS_PROVIDER_CONCURRENCY", slots)),
+            reserved=int(os.getenv("TTS_INTERACTIVE_RESERVED", reserved))
+        )
+
+    def _can_start(self, priority: str) -> bool:
+        if sum(self.in_use.values()) >= self.slots:
+            return False
+        return priority == INTERACTIVE or self.in_use[BULK] < self.slots - self.reserved
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE):
+        """Occupation d'une place pendant un appel fournisseur"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priorité inconnue: {priority}")
+        started = time.perf_counter()
+        # Pas de dépassement : une place libre ne revient qu'au premier de sa file
+        queued_ahead = self._waiters[priority] or (priority == BULK and self._waiters[INTERACTIVE])
+        if not queued_ahead and self._can_start(priority):
+            self.in_use[priority] += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[priority].append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # Place attribuée juste avant l'annulation : transmise au suivant
+                    self._release(priority)
+                elif waiter in self._waiters[priority]:
+                    self._waiters[priority].remove(waiter)
+                raise
+        TTS_SCHEDULER_WAIT.labels(priority).observe(time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def _release(self, priority: str):
+        self.in_use[priority] -= 1
+        for candidate in PRIORITIES:
+            waiters = self._waiters[candidate]
+            while waiters and self._can_start(candidate):
+                waiter = waiters.popleft()
+                if waiter.done():
+                    continue
+                self.in_use[candidate] += 1
+                waiter.set_result(None)
+
+    def snapshot(self) -> Dict:
+        return {
+            "slots": self.slots,
+            "reserved_interactive": self.reserved,
+            "in_flight": dict(self.in_use),
+            "waiting": {priority: len(waiters) for priority, waiters in self._waiters.items()}
+        }